@@ -8,13 +8,104 @@ class Settings(BaseSettings):
     
     # LLM 配置 (对应 .env 文件)
     LLM_PROVIDER: str = "deepseek"
-    OPENAI_API_KEY: str
+    OPENAI_API_KEY: str = ""          # 未配置时 LLM 调用直接失败，走本地兜底建议
     OPENAI_BASE_URL: str = "https://api.deepseek.com/v1"
     LLM_MODEL_NAME: str = "deepseek-chat"
 
+    # LLM 连接池与并发配置
+    LLM_MAX_CONCURRENCY: int = 16     # 最大同时在途请求数 (自适应并发的上限)
+    LLM_MAX_CONNECTIONS: int = 32     # 连接池最大连接数
+    LLM_MAX_KEEPALIVE: int = 16       # 保持长连接的最大数量
+    LLM_KEEPALIVE_EXPIRY: float = 30.0  # 空闲长连接保留时间（秒）
+    LLM_CONNECT_TIMEOUT: float = 5.0  # 建立连接超时（秒）
+    LLM_TIMEOUT: float = 30.0         # 单次调用默认超时（秒）
+
+    # 自适应并发 (AIMD) 与熔断
+    LLM_INITIAL_CONCURRENCY: int = 8      # 初始并发上限，在 [LLM_MIN_CONCURRENCY, LLM_MAX_CONCURRENCY] 内自适应
+    LLM_MIN_CONCURRENCY: int = 1
+    LLM_LATENCY_TOLERANCE: float = 2.0    # 延迟超过基线多少倍视为拥塞
+    LLM_QUEUE_TIMEOUT: float = 5.0        # 等待并发名额的最长时间（秒）
+    LLM_BREAKER_ERROR_RATE: float = 0.5   # 熔断的失败比例
+    LLM_BREAKER_WINDOW: int = 20          # 统计最近多少次调用
+    LLM_BREAKER_MIN_REQUESTS: int = 10    # 至少多少次调用才判断熔断
+    LLM_BREAKER_RESET_TIMEOUT: float = 15.0  # 熔断后多久尝试恢复（秒）
+    LLM_SLOW_CALL_THRESHOLD: float = 3.0     # 超过该耗时的调用计为失败（秒），须小于 SUGGESTION_LATENCY_BUDGET；流式按首 token 计，离线批量不计
+
+    # Prompt token 预算
+    LLM_CONTEXT_TOKEN_BUDGET: int = 600   # 对话上下文上限，超出时丢弃/摘要最早的轮次
+    LLM_INPUT_TOKEN_BUDGET: int = 400     # 单段用户输入上限
+    LLM_QUOTES_TOKEN_BUDGET: int = 300    # 参考金句上限
+
+    # 延迟预算与对冲请求
+    SUGGESTION_LATENCY_BUDGET: float = 4.0  # 每轮建议的延迟预算（秒），超出后使用本地兜底建议
+    LLM_HEDGE_ENABLED: bool = True
+    LLM_HEDGE_PERCENTILE: float = 0.9       # 超过历史该分位延迟仍未返回时发出对冲请求
+    LLM_HEDGE_MIN_DELAY: float = 0.8        # 对冲前的最短等待（秒）
+
+    # LLM 响应缓存配置
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_MAX_ENTRIES: int = 1024     # 最大缓存条目数 (LRU 淘汰)
+    LLM_CACHE_TTL: float = 600.0          # 缓存有效期（秒）
+    LLM_CACHE_SIMILARITY: float = 0.92    # 语义命中的最小余弦相似度
+
+    # LLM 微批处理配置 (默认关闭；开启后流式建议也参与合并，结果整段返回)
+    LLM_BATCH_ENABLED: bool = False
+    LLM_BATCH_MAX_SIZE: int = 8           # 单批最多合并的请求数
+    LLM_BATCH_MAX_WAIT_MS: float = 20.0   # 首个请求到达后最长等待（毫秒）
+
+    # 流式输入时的推测式建议生成
+    SPECULATIVE_ENABLED: bool = True
+    SPECULATIVE_MIN_CHARS: int = 6        # 开始推测所需的最少字数
+    SPECULATIVE_STABLE_MS: float = 400.0  # 文本保持不变多久后开始推测（毫秒）
+    SPECULATIVE_MATCH_RATIO: float = 0.9  # 复用推测结果所需的最小文本相似度
+
     # 数据库配置 (后续使用)
     # CHROMA_DB_PATH: str = "./chroma_db"
 
+    # RAG 检索线程池与微批配置
+    RAG_WORKERS: int = 2              # embedding + 向量查询的专用线程数
+    RAG_BATCH_WAIT_MS: float = 5.0    # 首个查询到达后最长等待（毫秒），用于合并并发查询
+    RAG_MAX_BATCH_SIZE: int = 32      # 单批最多合并的查询数
+    RAG_EMBEDDING_CACHE_SIZE: int = 4096  # 查询向量 LRU 缓存条目数
+    RAG_BATCH_CHUNK_SIZE: int = 256       # 批量接口每次向量化检索的查询数
+
+    # 向量检索后端: chroma (默认) 或 numpy (进程内 mmap 矩阵，适合小语料)
+    RAG_BACKEND: str = "chroma"
+    RAG_NUMPY_INDEX_PATH: str = "./vector_index"
+    RAG_NUMPY_DTYPE: str = "float32"      # float32 或 float16
+    RAG_NUMPY_QUANTIZATION: str = ""      # 空、int8 或 binary：压缩码常驻内存粗排，原始向量精排
+    RAG_RERANK_FACTOR: int = 10           # 量化粗排取 top_k 的多少倍候选做精排
+
+    # 混合检索：字符 n-gram BM25 与向量结果做倒数排名融合 (RRF)
+    RAG_HYBRID_ENABLED: bool = True
+    RAG_HYBRID_CANDIDATES: int = 4        # 每路召回 top_k 的多少倍参与融合
+    RAG_RRF_K: int = 60
+    RAG_LEXICAL_FASTPATH_DEPTH: int = 8   # 检索队列积压达到该深度时只走词法检索，0 表示关闭
+
+    # 预计算向量产物目录 (scripts/export_embeddings.py 生成)；为空则不加载
+    RAG_EMBEDDINGS_ARTIFACT: str = ""
+
+    # 流式语音识别
+    ASR_STREAM_MIN_CHUNK_S: float = 1.0   # 两次增量解码之间至少新增的音频（秒）
+    ASR_STREAM_MAX_WINDOW_S: float = 15.0 # 解码窗口上限（秒），超出后丢弃已确认部分
+
+    # 语音识别推理池
+    ASR_WORKERS: int = 2                  # 并行推理数 (CTranslate2 num_workers)
+    ASR_CPU_THREADS: int = 0              # 每个推理使用的 CPU 线程数，0 为自动
+    ASR_QUEUE_SIZE: int = 32              # 等待队列上限，满时拒绝请求
+    ASR_SHED_PARTIAL_DEPTH: int = 4       # 队列积压达到该值时跳过流式临时解码
+    ASR_BATCH_SIZE: int = 8               # 长语音批量解码的批大小
+    ASR_BATCHED_MIN_SECONDS: float = 30.0 # 超过该时长的语音用批量解码
+
+    # 识别配置 (见 app/core/asr_profiles.py：fast / balanced / accurate)
+    ASR_PROFILE: str = "balanced"         # 最终结果默认配置
+    ASR_PARTIAL_PROFILE: str = "fast"     # 流式临时结果默认配置
+    ASR_DOWNGRADE_LOAD: float = 0.5       # 推理池负载每达到该值降级一档，0 为不降级
+
+    # Whisper 模型加载
+    ASR_MODEL_DIR: str = ""               # 模型缓存目录，为空时使用 Hugging Face 默认缓存
+    ASR_LOAD_TIMEOUT_S: float = 60.0      # 模型加载期间请求的最长等待时间（秒）
+
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
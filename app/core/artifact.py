@@ -0,0 +1,148 @@
+"""
+预计算向量产物 - 导出/加载金句 embedding，新节点启动时无需重新计算
+"""
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+import numpy as np
+
+# 产物格式版本；格式不兼容时递增
+ARTIFACT_VERSION = 1
+
+MANIFEST_FILE = "manifest.json"
+EMBEDDINGS_FILE = "embeddings.npy"
+METADATA_FILE = "metadata.jsonl"
+
+
+class ArtifactError(Exception):
+    """产物缺失、版本不符或内容损坏"""
+
+
+def export_artifact(
+    path: str,
+    batches: Iterable[Tuple[List[str], List[List[float]], List[Dict]]],
+    count: int,
+    model: str,
+    dtype: str = "float16"
+) -> Dict:
+    """
+    流式写出向量产物
+
+    Args:
+        path: 产物目录
+        batches: 逐批产出的 (ids, embeddings, metadatas)
+        count: 总条数，用于预分配 .npy
+        model: 生成向量的 embedding 模型名
+        dtype: 向量存储精度 (float16 / float32)
+
+    Returns:
+        写出的 manifest
+    """
+    directory = Path(path)
+    directory.mkdir(parents=True, exist_ok=True)
+    embeddings_tmp = directory / f"{EMBEDDINGS_FILE}.tmp"
+    metadata_tmp = directory / f"{METADATA_FILE}.tmp"
+
+    matrix = None
+    written = 0
+    with open(metadata_tmp, "w", encoding="utf-8") as meta_file:
+        for ids, embeddings, metadatas in batches:
+            block = np.asarray(embeddings, dtype=np.float32)
+            if matrix is None:
+                matrix = np.lib.format.open_memmap(
+                    embeddings_tmp, mode="w+", dtype=np.dtype(dtype), shape=(count, block.shape[1])
+                )
+            if written + len(ids) > count:
+                raise ArtifactError(f"导出过程中数据增加: 超过预期的 {count} 条")
+            matrix[written:written + len(ids)] = block
+            for id_, metadata in zip(ids, metadatas):
+                meta_file.write(json.dumps({"id": id_, "metadata": metadata}, ensure_ascii=False) + "\n")
+            written += len(ids)
+
+    if matrix is None:
+        raise ArtifactError("没有可导出的向量")
+    if written != count:
+        raise ArtifactError(f"导出条数 {written} 与预期 {count} 不符")
+    matrix.flush()
+    dim = int(matrix.shape[1])
+    del matrix
+
+    manifest = {
+        "version": ARTIFACT_VERSION,
+        "model": model,
+        "count": count,
+        "dim": dim,
+        "dtype": dtype,
+        "sha256": _file_sha256(embeddings_tmp),
+        "created_at": int(time.time())
+    }
+    os.replace(embeddings_tmp, directory / EMBEDDINGS_FILE)
+    os.replace(metadata_tmp, directory / METADATA_FILE)
+    with open(directory / MANIFEST_FILE, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
+
+
+def read_manifest(path: str) -> Dict:
+    """读取并校验 manifest"""
+    manifest_file = Path(path) / MANIFEST_FILE
+    if not manifest_file.exists():
+        raise ArtifactError(f"未找到向量产物: {manifest_file}")
+    with open(manifest_file, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != ARTIFACT_VERSION:
+        raise ArtifactError(f"向量产物版本 {manifest.get('version')} 与当前版本 {ARTIFACT_VERSION} 不兼容")
+    return manifest
+
+
+def iter_artifact(
+    path: str,
+    batch_size: int = 4096,
+    verify: bool = False
+) -> Iterator[Tuple[List[str], np.ndarray, List[Dict]]]:
+    """
+    以 mmap 方式逐批读取产物，返回 (ids, embeddings, metadatas)
+
+    Args:
+        verify: 是否校验 embeddings.npy 的 sha256
+    """
+    directory = Path(path)
+    manifest = read_manifest(path)
+    embeddings_file = directory / EMBEDDINGS_FILE
+    if verify and _file_sha256(embeddings_file) != manifest["sha256"]:
+        raise ArtifactError("向量产物校验失败: sha256 不匹配")
+
+    matrix = np.load(embeddings_file, mmap_mode="r")
+    if matrix.shape != (manifest["count"], manifest["dim"]):
+        raise ArtifactError(f"向量矩阵形状 {matrix.shape} 与 manifest 不符")
+
+    offset = 0
+    ids: List[str] = []
+    metadatas: List[Dict] = []
+    with open(directory / METADATA_FILE, "r", encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            ids.append(record["id"])
+            metadatas.append(record["metadata"])
+            if len(ids) >= batch_size:
+                yield ids, np.asarray(matrix[offset:offset + len(ids)], dtype=np.float32), metadatas
+                offset += len(ids)
+                ids, metadatas = [], []
+    if ids:
+        yield ids, np.asarray(matrix[offset:offset + len(ids)], dtype=np.float32), metadatas
+        offset += len(ids)
+
+    if offset != manifest["count"]:
+        raise ArtifactError(f"元数据条数 {offset} 与 manifest 中的 {manifest['count']} 不符")
+
+
+def _file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
@@ -0,0 +1,169 @@
+"""
+语音识别推理池 - 专用线程、有界队列与过载保护，统计队列深度与实时率 (RTF)
+"""
+import asyncio
+import itertools
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional
+
+
+class ASROverloadedError(Exception):
+    """识别队列已满，请求被拒绝"""
+
+
+# 优先级：最终结果优先，流式临时结果在积压时最先被丢弃
+PRIORITY_FINAL = "final"
+PRIORITY_PARTIAL = "partial"
+_PRIORITY_RANK = {PRIORITY_FINAL: 0, PRIORITY_PARTIAL: 1}
+
+
+@dataclass
+class _Job:
+    fn: Callable[[], Any]
+    audio_seconds: float
+    priority: str
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class ASRWorkerPool:
+    """
+    Whisper 推理池
+
+    workers 个调度协程从有界优先队列取任务 (最终识别先于临时解码，同优先级先进先出)，
+    交给同样大小的专用线程池执行；模型以 num_workers=workers 加载，CTranslate2 可并行处理这些请求。
+    队列满时拒绝最终识别请求；积压超过 shed_partial_depth 时丢弃流式临时解码。
+    """
+
+    def __init__(
+        self,
+        workers: int = 2,
+        queue_size: int = 32,
+        shed_partial_depth: int = 8,
+        window: int = 256
+    ):
+        """
+        Args:
+            workers: 并行推理数
+            queue_size: 等待队列上限
+            shed_partial_depth: 队列深度达到该值时拒绝流式临时解码
+            window: 统计最近多少次推理的实时率
+        """
+        self.workers = workers
+        self.queue_size = queue_size
+        self.shed_partial_depth = shed_partial_depth
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="asr")
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._seq = itertools.count()
+        self._tasks = []
+
+        # 统计
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.shed = 0
+        self.audio_seconds = 0.0
+        self.busy_seconds = 0.0
+        self._rtf = deque(maxlen=window)
+        self._queue_wait = deque(maxlen=window)
+
+    def _ensure_started(self):
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue(maxsize=self.queue_size)
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    @property
+    def depth(self) -> int:
+        """等待中的任务数"""
+        return self._queue.qsize() if self._queue else 0
+
+    def load(self) -> float:
+        """负载 (0~1)：排队与在途任务相对容量的比例"""
+        return min((self.depth + self.in_flight) / (self.workers + self.queue_size), 1.0)
+
+    async def submit(self, fn: Callable[[], Any], audio_seconds: float, priority: str = PRIORITY_FINAL) -> Any:
+        """
+        提交一次推理
+
+        Args:
+            fn: 在推理线程中执行的函数
+            audio_seconds: 音频时长，用于计算实时率
+            priority: PRIORITY_FINAL 或 PRIORITY_PARTIAL
+
+        Raises:
+            ASROverloadedError: 队列已满，或积压时的流式临时解码
+        """
+        self._ensure_started()
+        if priority == PRIORITY_PARTIAL and self.depth >= self.shed_partial_depth:
+            self.shed += 1
+            raise ASROverloadedError(f"识别队列积压 ({self.depth})，跳过临时解码")
+
+        job = _Job(fn, audio_seconds, priority, asyncio.get_running_loop().create_future())
+        try:
+            self._queue.put_nowait((_PRIORITY_RANK.get(priority, 0), next(self._seq), job))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise ASROverloadedError(f"识别队列已满 ({self.queue_size})")
+        return await job.future
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            _, _, job = await self._queue.get()
+            if job.future.cancelled():
+                continue
+            self._queue_wait.append(time.monotonic() - job.enqueued_at)
+            self.in_flight += 1
+            started = time.perf_counter()
+            try:
+                result = await loop.run_in_executor(self._executor, job.fn)
+            except Exception as e:
+                self.failed += 1
+                if not job.future.done():
+                    job.future.set_exception(e)
+            else:
+                elapsed = time.perf_counter() - started
+                self.completed += 1
+                self.audio_seconds += job.audio_seconds
+                self.busy_seconds += elapsed
+                if job.audio_seconds > 0:
+                    self._rtf.append(elapsed / job.audio_seconds)
+                if not job.future.done():
+                    job.future.set_result(result)
+            finally:
+                self.in_flight -= 1
+
+    @staticmethod
+    def _percentile(values, p: float) -> Optional[float]:
+        if not values:
+            return None
+        ordered = sorted(values)
+        return round(ordered[min(int(p * len(ordered)), len(ordered) - 1)], 3)
+
+    def get_stats(self) -> Dict:
+        """队列深度、吞吐与实时率 (处理耗时 / 音频时长，小于 1 表示快于实时)"""
+        return {
+            "workers": self.workers,
+            "queue_depth": self.depth,
+            "queue_size": self.queue_size,
+            "in_flight": self.in_flight,
+            "load": round(self.load(), 3),
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "shed_partials": self.shed,
+            "audio_seconds": round(self.audio_seconds, 1),
+            "rtf": round(self.busy_seconds / self.audio_seconds, 3) if self.audio_seconds else None,
+            "rtf_p50": self._percentile(self._rtf, 0.5),
+            "rtf_p90": self._percentile(self._rtf, 0.9),
+            "queue_wait_p90": self._percentile(self._queue_wait, 0.9)
+        }
+
+    def close(self):
+        for task in self._tasks:
+            task.cancel()
+        self._executor.shutdown(wait=False)
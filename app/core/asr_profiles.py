@@ -0,0 +1,73 @@
+"""
+语音识别解码配置 - 按延迟/精度分级的命名配置，负载高时自动降级
+"""
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+
+@dataclass(frozen=True)
+class DecodingProfile:
+    """一组 Whisper 解码参数"""
+    name: str
+    model_size: str                   # tiny / base / small / medium / large-v3 ...
+    beam_size: int = 1                # 1 为贪心解码
+    best_of: int = 1
+    language: Optional[str] = "zh"    # None 为自动检测
+    vad_filter: bool = True
+    vad_min_silence_ms: int = 300
+    fallback: Optional[str] = None    # 负载高时降级到的配置
+
+    def transcribe_options(self) -> Dict[str, Any]:
+        """转为 WhisperModel.transcribe 的参数"""
+        options = dict(
+            language=self.language,
+            beam_size=self.beam_size,
+            best_of=self.best_of,
+            vad_filter=self.vad_filter
+        )
+        if self.vad_filter:
+            options["vad_parameters"] = dict(min_silence_duration_ms=self.vad_min_silence_ms)
+        return options
+
+
+# 内置配置：从快到准
+PROFILES: Dict[str, DecodingProfile] = {
+    profile.name: profile for profile in (
+        DecodingProfile("fast", "tiny"),
+        DecodingProfile("balanced", "base", beam_size=3, fallback="fast"),
+        DecodingProfile("accurate", "small", beam_size=5, best_of=3, fallback="balanced"),
+    )
+}
+
+
+def get_profile(name: str) -> DecodingProfile:
+    """按名称获取配置，不存在时抛出 ValueError"""
+    try:
+        return PROFILES[name]
+    except KeyError:
+        raise ValueError(f"未知的识别配置: {name} (可选: {', '.join(PROFILES)})")
+
+
+def fallback_chain(name: str) -> List[DecodingProfile]:
+    """配置本身及其全部降级配置，按降级顺序排列"""
+    chain = [get_profile(name)]
+    while chain[-1].fallback:
+        chain.append(PROFILES[chain[-1].fallback])
+    return chain
+
+
+def select_profile(name: str, load: float, downgrade_load: float) -> DecodingProfile:
+    """
+    按当前负载选择实际使用的配置
+
+    Args:
+        name: 会话请求的配置名
+        load: 推理池负载 (0~1)
+        downgrade_load: 负载每达到该值一次，沿 fallback 降一级；<= 0 时不降级
+    """
+    profile = get_profile(name)
+    steps = int(load / downgrade_load) if downgrade_load > 0 else 0
+    while steps > 0 and profile.fallback:
+        profile = PROFILES[profile.fallback]
+        steps -= 1
+    return profile
@@ -2,7 +2,7 @@
 对话辅助助手 - 整合语音识别、LLM、RAG和新闻服务，提供实时对话建议
 """
 import asyncio
-from typing import List, Dict, Optional, Callable, Any
+from typing import List, Dict, Optional, Callable, Any, AsyncIterator, Awaitable
 from dataclasses import dataclass, field
 from datetime import datetime
 from enum import Enum
@@ -11,6 +11,10 @@ from app.core.speech import speech_service, TranscriptSegment, ConversationConte
 from app.core.llm import llm_service
 from app.core.rag import rag_service
 from app.core.news import news_service, NewsItem
+from app.core.prompts import build_assistant_messages
+from app.core.fallback import build_local_suggestions
+from app.core.registry import service_registry
+from app.config import settings
 
 
 class SuggestionType(str, Enum):
@@ -154,7 +158,8 @@ class ConversationAssistant:
     async def process_text(
         self,
         text: str,
-        speaker: str = "other"
+        speaker: str = "other",
+        use_cache: bool = True
     ) -> AssistantResponse:
         """
         直接处理文本输入 (用于测试或文本输入模式)
@@ -176,7 +181,7 @@ class ConversationAssistant:
         context_text = context.get_recent_text(n=5)
         topics = context.get_topics()
         
-        suggestions = await self._generate_suggestions(transcript, context)
+        suggestions = await self._generate_suggestions(transcript, context, use_cache=use_cache)
         related_news = await self._get_related_news(context_text)
         
         return AssistantResponse(
@@ -187,18 +192,71 @@ class ConversationAssistant:
             related_news=[{"title": n.title, "summary": n.summary, "source": n.source} for n in related_news]
         )
     
+    async def preview_text(
+        self,
+        text: str,
+        speaker: str = "other",
+        use_cache: bool = True
+    ) -> AssistantResponse:
+        """
+        基于尚未确认的文本预先生成建议 (用于推测执行)
+        
+        使用上下文的副本，不会把文本写入对话历史；确认采用后调用 commit_transcript
+        """
+        transcript = TranscriptSegment(
+            text=text,
+            speaker=speaker,
+            start_time=0,
+            end_time=len(text) * 0.1,
+            confidence=1.0
+        )
+        
+        current = self.speech.get_context()
+        context = ConversationContext(
+            segments=list(current.segments),
+            max_segments=current.max_segments
+        )
+        context.add_segment(transcript)
+        context_text = context.get_recent_text(n=5)
+        topics = context.get_topics()
+        
+        suggestions, related_news = await asyncio.gather(
+            self._generate_suggestions(transcript, context, use_cache=use_cache),
+            self._get_related_news(context_text)
+        )
+        
+        return AssistantResponse(
+            transcript=transcript,
+            suggestions=suggestions,
+            context_summary=context_text,
+            topics=topics,
+            related_news=[{"title": n.title, "summary": n.summary, "source": n.source} for n in related_news]
+        )
+    
+    def current_turn(self) -> int:
+        """当前对话历史的轮次，对话历史有写入或重置时变化"""
+        return self.speech.get_context().turn
+    
+    def commit_transcript(self, transcript: TranscriptSegment):
+        """将预先生成建议时使用的文本写入对话历史"""
+        self.speech.context.add_segment(transcript)
+    
     async def _generate_suggestions(
         self,
         transcript: TranscriptSegment,
-        context: ConversationContext
+        context: ConversationContext,
+        use_cache: bool = True
     ) -> List[ConversationSuggestion]:
         """生成多类型建议"""
         suggestions = []
         
+        # 金句检索只做一次：既用于名言建议，也用于 LLM 超时时的本地兜底
+        quotes_task = asyncio.ensure_future(self._search_quotes(transcript.text))
+        
         # 并行获取各类建议
         tasks = [
-            self._get_quote_suggestion(transcript.text),
-            self._get_llm_suggestions(transcript, context),
+            self._get_quote_suggestion(quotes_task),
+            self._get_llm_suggestions(transcript, context, use_cache=use_cache, quotes_task=quotes_task),
         ]
         
         results = await asyncio.gather(*tasks, return_exceptions=True)
@@ -213,10 +271,18 @@ class ConversationAssistant:
         
         return suggestions
     
-    async def _get_quote_suggestion(self, text: str) -> Optional[ConversationSuggestion]:
-        """从 RAG 获取相关名言"""
+    async def _search_quotes(self, text: str, top_k: int = 3) -> List[Dict]:
+        """从 RAG 检索相关名言"""
+        try:
+            return await self.rag.search(text, top_k=top_k)
+        except Exception as e:
+            print(f"检索名言失败: {e}")
+            return []
+    
+    async def _get_quote_suggestion(self, quotes_task: Awaitable[List[Dict]]) -> Optional[ConversationSuggestion]:
+        """从检索结果中取最相关的名言"""
         try:
-            quotes = self.rag.search(text, top_k=1)
+            quotes = await quotes_task
             if quotes:
                 quote = quotes[0]
                 return ConversationSuggestion(
@@ -229,81 +295,222 @@ class ConversationAssistant:
             print(f"获取名言失败: {e}")
         return None
     
-    async def _get_llm_suggestions(
+    def _build_llm_messages(
         self,
         transcript: TranscriptSegment,
         context: ConversationContext
+    ) -> List[Dict]:
+        """构建 LLM 建议的对话消息 (上下文受 token 预算约束)"""
+        last_other = context.get_last_other_message()
+        return build_assistant_messages(
+            context.segments,
+            last_other or transcript.text,
+            context_budget=settings.LLM_CONTEXT_TOKEN_BUDGET,
+            text_budget=settings.LLM_INPUT_TOKEN_BUDGET
+        )
+    
+    def _parse_llm_line(self, line: str) -> Optional[ConversationSuggestion]:
+        """解析一行以[类型]开头的 LLM 输出"""
+        type_mapping = {
+            "[深度]": SuggestionType.INSIGHT,
+            "[幽默]": SuggestionType.HUMOR,
+            "[追问]": SuggestionType.QUESTION,
+        }
+        
+        line = line.strip()
+        for prefix, stype in type_mapping.items():
+            if line.startswith(prefix):
+                return ConversationSuggestion(
+                    type=stype,
+                    content=line.replace(prefix, "").strip(),
+                    source="AI 建议",
+                    confidence=0.8
+                )
+        return None
+    
+    async def _fallback_llm_suggestions(
+        self,
+        quotes_task: Optional[Awaitable[List[Dict]]],
+        exclude: Optional[List[SuggestionType]] = None
+    ) -> List[ConversationSuggestion]:
+        """LLM 失败或超出延迟预算时，基于已检索的金句生成本地建议"""
+        quotes = []
+        if quotes_task is not None:
+            try:
+                quotes = await quotes_task
+            except Exception:
+                quotes = []
+        
+        type_mapping = {
+            "insight": SuggestionType.INSIGHT,
+            "humor": SuggestionType.HUMOR,
+            "question": SuggestionType.QUESTION,
+        }
+        exclude = exclude or []
+        
+        return [
+            ConversationSuggestion(
+                type=type_mapping[kind],
+                content=text,
+                source="本地建议" if quotes else "默认回复",
+                confidence=0.6 if quotes else 0.5
+            )
+            for kind, text in build_local_suggestions(quotes)
+            if type_mapping[kind] not in exclude
+        ]
+    
+    async def _get_llm_suggestions(
+        self,
+        transcript: TranscriptSegment,
+        context: ConversationContext,
+        use_cache: bool = True,
+        quotes_task: Optional[Awaitable[List[Dict]]] = None
     ) -> List[ConversationSuggestion]:
-        """使用 LLM 生成多类型建议"""
+        """使用 LLM 生成多类型建议，超出延迟预算时使用本地建议"""
         suggestions = []
         
         try:
-            # 构建增强的提示
-            context_text = context.get_recent_text(n=5)
-            last_other = context.get_last_other_message()
-            
-            prompt = f"""你是一个实时对话辅助助手。用户正在与他人对话，你需要帮助用户提供有深度的回应。
-
-当前对话上下文：
-{context_text}
-
-对方最新说的话："{last_other or transcript.text}"
-
-请生成 3 个不同类型的回应建议：
-1. [深度] 一个展现思考深度的回应，可引用名人名言或哲理
-2. [幽默] 一个风趣幽默但不失礼貌的回应
-3. [追问] 一个有启发性的追问，推动对话深入
-
-要求：
-- 每个建议不超过 30 字
-- 自然流畅，符合口语表达
-- 与当前话题紧密相关
-
-格式：每行一个建议，以[类型]开头"""
-
-            # 调用 LLM
-            response = self.llm.client.chat.completions.create(
-                model=self.llm.model,
-                messages=[
-                    {"role": "system", "content": "你是一个专业的对话辅助助手，帮助用户在社交场合展现智慧。"},
-                    {"role": "user", "content": prompt}
-                ],
+            content = await self.llm.chat(
+                messages=self._build_llm_messages(transcript, context),
                 temperature=0.8,
-                max_tokens=300
+                max_tokens=300,
+                use_cache=use_cache,
+                cache_namespace="assistant",
+                semantic_key=context.get_recent_text(n=5),
+                budget=settings.SUGGESTION_LATENCY_BUDGET
             )
             
-            content = response.choices[0].message.content
             lines = [line.strip() for line in content.split('\n') if line.strip()]
             
-            type_mapping = {
-                "[深度]": SuggestionType.INSIGHT,
-                "[幽默]": SuggestionType.HUMOR,
-                "[追问]": SuggestionType.QUESTION,
-            }
-            
             for line in lines[:3]:
-                for prefix, stype in type_mapping.items():
-                    if line.startswith(prefix):
-                        suggestions.append(ConversationSuggestion(
-                            type=stype,
-                            content=line.replace(prefix, "").strip(),
-                            source="AI 建议",
-                            confidence=0.8
-                        ))
-                        break
+                suggestion = self._parse_llm_line(line)
+                if suggestion:
+                    suggestions.append(suggestion)
                         
         except Exception as e:
-            print(f"LLM 建议生成失败: {e}")
-            # 返回默认建议
-            suggestions.append(ConversationSuggestion(
-                type=SuggestionType.EMPATHY,
-                content="我理解你的想法，能说得更具体吗？",
-                source="默认回复",
-                confidence=0.5
-            ))
+            print(f"LLM 建议生成失败或超出延迟预算: {e!r}")
+            suggestions = await self._fallback_llm_suggestions(quotes_task)
         
         return suggestions
     
+    async def stream_llm_suggestions(
+        self,
+        transcript: TranscriptSegment,
+        context: ConversationContext,
+        use_cache: bool = True,
+        quotes_task: Optional[Awaitable[List[Dict]]] = None
+    ) -> AsyncIterator[ConversationSuggestion]:
+        """
+        以流式模式生成 LLM 建议，每解析完一行就产出一条建议
+        
+        超出延迟预算时，用本地建议补齐尚未生成的类型
+        """
+        buffer = ""
+        line_count = 0
+        produced: List[SuggestionType] = []
+        
+        stream = self.llm.stream_chat(
+            messages=self._build_llm_messages(transcript, context),
+            temperature=0.8,
+            max_tokens=300,
+            timeout=settings.SUGGESTION_LATENCY_BUDGET,
+            use_cache=use_cache,
+            cache_namespace="assistant",
+            semantic_key=context.get_recent_text(n=5)
+        )
+        
+        try:
+            async for delta in stream:
+                buffer += delta
+                while "\n" in buffer and line_count < 3:
+                    line, buffer = buffer.split("\n", 1)
+                    if not line.strip():
+                        continue
+                    line_count += 1
+                    suggestion = self._parse_llm_line(line)
+                    if suggestion:
+                        produced.append(suggestion.type)
+                        yield suggestion
+                if line_count >= 3:
+                    break
+            
+            # 最后一行可能没有换行符
+            if line_count < 3 and buffer.strip():
+                suggestion = self._parse_llm_line(buffer)
+                if suggestion:
+                    produced.append(suggestion.type)
+                    yield suggestion
+                    
+        except Exception as e:
+            print(f"LLM 流式建议生成失败或超出延迟预算: {e!r}")
+            for suggestion in await self._fallback_llm_suggestions(quotes_task, exclude=produced):
+                yield suggestion
+        finally:
+            # 提前结束时及时释放连接和并发名额
+            await stream.aclose()
+    
+    async def process_text_stream(
+        self,
+        text: str,
+        speaker: str = "other",
+        on_suggestion: Optional[Callable[[ConversationSuggestion], Any]] = None,
+        use_cache: bool = True
+    ) -> AssistantResponse:
+        """
+        流式处理文本输入：每生成一条建议就通过 on_suggestion 回调推送
+        
+        Returns:
+            包含全部建议的 AssistantResponse
+        """
+        transcript = TranscriptSegment(
+            text=text,
+            speaker=speaker,
+            start_time=0,
+            end_time=len(text) * 0.1,
+            confidence=1.0
+        )
+        self.speech.context.add_segment(transcript)
+        
+        context = self.speech.get_context()
+        context_text = context.get_recent_text(n=5)
+        topics = context.get_topics()
+        
+        suggestions: List[ConversationSuggestion] = []
+        
+        async def emit(suggestion: ConversationSuggestion):
+            suggestions.append(suggestion)
+            if on_suggestion:
+                await self._safe_callback(on_suggestion, suggestion)
+        
+        quotes_task = asyncio.ensure_future(self._search_quotes(transcript.text))
+        
+        async def quote_task():
+            quote = await self._get_quote_suggestion(quotes_task)
+            if quote:
+                await emit(quote)
+        
+        async def llm_task():
+            async for suggestion in self.stream_llm_suggestions(
+                transcript, context, use_cache=use_cache, quotes_task=quotes_task
+            ):
+                await emit(suggestion)
+        
+        results = await asyncio.gather(
+            quote_task(),
+            llm_task(),
+            self._get_related_news(context_text),
+            return_exceptions=True
+        )
+        related_news = results[2] if isinstance(results[2], list) else []
+        
+        return AssistantResponse(
+            transcript=transcript,
+            suggestions=suggestions,
+            context_summary=context_text,
+            topics=topics,
+            related_news=[{"title": n.title, "summary": n.summary, "source": n.source} for n in related_news]
+        )
+    
     async def _get_related_news(self, context_text: str) -> List[NewsItem]:
         """获取相关新闻"""
         try:
@@ -339,5 +546,5 @@ class ConversationAssistant:
         ]
 
 
-# 单例
-conversation_assistant = ConversationAssistant()
+# 单例：首次使用时创建
+conversation_assistant = service_registry.register("assistant", ConversationAssistant)
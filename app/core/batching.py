@@ -0,0 +1,200 @@
+"""
+LLM 请求微批处理 - 合并短时间内到达的多个建议请求为一次结构化调用
+"""
+import asyncio
+import json
+import re
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+# 发送单个请求的函数签名: (messages, temperature, max_tokens, timeout) -> 文本
+SendFunc = Callable[[List[Dict], float, int, Optional[float]], Awaitable[str]]
+
+BATCH_INSTRUCTION = """你将同时收到多个相互独立的任务，每个任务以【任务 N】开头。
+请分别完成每个任务，任务之间互不影响。
+以 JSON 对象返回结果：键为任务编号（字符串），值为该任务的完整回答文本（按原要求保留换行）。
+只返回 JSON，不要添加其他内容。"""
+
+
+@dataclass
+class _BatchItem:
+    """待合并的单个请求"""
+    messages: List[Dict]
+    max_tokens: int
+    timeout: Optional[float]
+    future: asyncio.Future
+
+
+class LLMBatcher:
+    """
+    跨客户端的 LLM 微批调度器
+
+    在 max_wait_ms 内到达的、系统提示与温度相同的请求 (含 WebSocket 流式建议)
+    会被合并成一次调用，单批最多 max_batch_size 个；结果按任务编号拆分回各调用方。
+    解析失败或缺失的任务会单独重新请求，不会丢弃。
+    """
+
+    def __init__(
+        self,
+        send: SendFunc,
+        max_batch_size: int = 8,
+        max_wait_ms: float = 20.0,
+        max_batch_tokens: int = 4000
+    ):
+        """
+        Args:
+            send: 发送单次请求的函数
+            max_batch_size: 单批最大请求数
+            max_wait_ms: 首个请求到达后的最长等待时间（毫秒）
+            max_batch_tokens: 合并请求的 max_tokens 上限
+        """
+        self.send = send
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_batch_tokens = max_batch_tokens
+
+        # (系统提示, 温度) -> 等待中的请求
+        self._pending: Dict[Tuple[str, float], List[_BatchItem]] = {}
+        self._timers: Dict[Tuple[str, float], asyncio.TimerHandle] = {}
+
+        # 统计
+        self.batches = 0
+        self.batched_items = 0
+        self.fallbacks = 0
+        self.dropped = 0    # 调用方已离开而未发送的请求
+
+    @staticmethod
+    def can_batch(messages: List[Dict]) -> bool:
+        """只有「系统提示 + 单条用户消息」的请求可以合并"""
+        roles = [m.get("role") for m in messages]
+        return roles in (["user"], ["system", "user"])
+
+    async def submit(
+        self,
+        messages: List[Dict],
+        temperature: float,
+        max_tokens: int,
+        timeout: Optional[float] = None
+    ) -> str:
+        """提交请求并等待属于自己的结果"""
+        if not self.can_batch(messages):
+            return await self.send(messages, temperature, max_tokens, timeout)
+
+        loop = asyncio.get_running_loop()
+        system = messages[0]["content"] if messages[0]["role"] == "system" else ""
+        group = (system, temperature)
+
+        item = _BatchItem(
+            messages=messages,
+            max_tokens=max_tokens,
+            timeout=timeout,
+            future=loop.create_future()
+        )
+        self._pending.setdefault(group, []).append(item)
+
+        if len(self._pending[group]) >= self.max_batch_size:
+            self._flush(group)
+        elif group not in self._timers:
+            self._timers[group] = loop.call_later(self.max_wait, self._flush, group)
+
+        # 不加 shield：调用方超时或取消时 future 随之取消，发送前会被过滤掉
+        return await item.future
+
+    def _flush(self, group: Tuple[str, float]):
+        """取出一组等待中的请求并发送"""
+        timer = self._timers.pop(group, None)
+        if timer:
+            timer.cancel()
+        items = self._pending.pop(group, [])
+        if items:
+            asyncio.ensure_future(self._run_batch(group, items))
+
+    async def _run_batch(self, group: Tuple[str, float], items: List[_BatchItem]):
+        """执行一批请求并把结果拆分给各调用方"""
+        system, temperature = group
+
+        # 调用方已超时或取消的请求不再发送
+        items = self._live(items)
+        if not items:
+            return
+
+        if len(items) == 1:
+            await self._run_single(items[0], temperature)
+            return
+
+        self.batches += 1
+        self.batched_items += len(items)
+
+        tasks = "\n\n".join(
+            f"【任务 {i}】\n{item.messages[-1]['content']}"
+            for i, item in enumerate(items, 1)
+        )
+        messages = [
+            {"role": "system", "content": f"{system}\n\n{BATCH_INSTRUCTION}".strip()},
+            {"role": "user", "content": tasks}
+        ]
+        max_tokens = min(sum(item.max_tokens for item in items), self.max_batch_tokens)
+        timeouts = [item.timeout for item in items if item.timeout]
+        timeout = max(timeouts) if timeouts else None
+
+        results: Dict[str, str] = {}
+        try:
+            content = await self.send(messages, temperature, max_tokens, timeout)
+            results = self._parse(content)
+        except Exception as e:
+            print(f"LLM 批量调用失败，改为逐个请求: {e}")
+
+        retry = []
+        for i, item in enumerate(items, 1):
+            text = results.get(str(i))
+            if isinstance(text, str) and text.strip():
+                if not item.future.done():
+                    item.future.set_result(text)
+            else:
+                retry.append(item)
+
+        retry = self._live(retry)
+        if retry:
+            self.fallbacks += len(retry)
+            await asyncio.gather(*(self._run_single(item, temperature) for item in retry))
+
+    def _live(self, items: List[_BatchItem]) -> List[_BatchItem]:
+        """过滤掉调用方已离开 (future 已完成或取消) 的请求"""
+        live = [item for item in items if not item.future.done()]
+        self.dropped += len(items) - len(live)
+        return live
+
+    async def _run_single(self, item: _BatchItem, temperature: float):
+        """单独发送一个请求"""
+        try:
+            content = await self.send(item.messages, temperature, item.max_tokens, item.timeout)
+            if not item.future.done():
+                item.future.set_result(content)
+        except Exception as e:
+            if not item.future.done():
+                item.future.set_exception(e)
+
+    @staticmethod
+    def _parse(content: str) -> Dict[str, str]:
+        """解析批量返回的 JSON，兼容 ```json 代码块包裹"""
+        content = content.strip()
+        fenced = re.search(r"```(?:json)?\s*(.*?)```", content, re.S)
+        if fenced:
+            content = fenced.group(1)
+        data = json.loads(content)
+        if not isinstance(data, dict):
+            return {}
+        return {str(k): v for k, v in data.items()}
+
+    def get_stats(self) -> Dict:
+        """获取批处理统计"""
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "pending": sum(len(items) for items in self._pending.values()),
+            "batches": self.batches,
+            "batched_items": self.batched_items,
+            "avg_batch_size": round(self.batched_items / self.batches, 2) if self.batches else 0.0,
+            "fallbacks": self.fallbacks,
+            "dropped": self.dropped
+        }
@@ -0,0 +1,245 @@
+"""
+缓存 - LLM 响应缓存 (精确哈希 + 语义相似度匹配，LRU/TTL 淘汰) 与查询向量缓存
+"""
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Any
+
+import numpy as np
+
+
+@dataclass
+class CacheEntry:
+    """缓存条目"""
+    namespace: str
+    value: str
+    embedding: Optional[np.ndarray] = None
+    created_at: float = field(default_factory=time.monotonic)
+
+
+def make_cache_key(*parts: Any) -> str:
+    """将任意可 JSON 序列化的内容哈希为缓存键"""
+    raw = json.dumps(parts, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    LLM 响应缓存
+
+    查找顺序：
+    1. 精确匹配：完整 prompt 的哈希
+    2. 语义匹配：同一命名空间内，语义文本的 embedding 余弦相似度超过阈值
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: float = 600.0,
+        similarity_threshold: float = 0.92,
+        embedding_function: Optional[Callable[[List[str]], Any]] = None
+    ):
+        """
+        Args:
+            max_entries: 最大缓存条目数，超出后按 LRU 淘汰
+            ttl: 条目存活时间（秒）
+            similarity_threshold: 语义命中的最小余弦相似度
+            embedding_function: 文本转向量函数，为 None 时只做精确匹配
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.embedding_function = embedding_function
+
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        # 最近一次计算的 embedding，避免未命中后写入时重复计算
+        self._last_embedding: Optional[tuple] = None
+
+        # 统计
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    async def get(
+        self,
+        key: str,
+        namespace: str,
+        semantic_text: Optional[str] = None
+    ) -> Optional[str]:
+        """查找缓存，未命中返回 None"""
+        self._expire()
+
+        entry = self._entries.get(key)
+        if entry:
+            self._entries.move_to_end(key)
+            self.exact_hits += 1
+            return entry.value
+
+        if semantic_text and self.embedding_function:
+            embedding = await self._embed(semantic_text)
+            if embedding is not None:
+                match_key = self._find_similar(namespace, embedding)
+                if match_key:
+                    self._entries.move_to_end(match_key)
+                    self.semantic_hits += 1
+                    return self._entries[match_key].value
+
+        self.misses += 1
+        return None
+
+    async def set(
+        self,
+        key: str,
+        namespace: str,
+        value: str,
+        semantic_text: Optional[str] = None
+    ):
+        """写入缓存"""
+        embedding = None
+        if semantic_text and self.embedding_function:
+            embedding = await self._embed(semantic_text)
+
+        self._entries[key] = CacheEntry(
+            namespace=namespace,
+            value=value,
+            embedding=embedding
+        )
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _find_similar(self, namespace: str, embedding: np.ndarray) -> Optional[str]:
+        """在同一命名空间内查找最相似的条目"""
+        keys = []
+        vectors = []
+        for key, entry in self._entries.items():
+            if entry.namespace == namespace and entry.embedding is not None:
+                keys.append(key)
+                vectors.append(entry.embedding)
+
+        if not vectors:
+            return None
+
+        scores = np.stack(vectors) @ embedding
+        best = int(np.argmax(scores))
+        if scores[best] >= self.similarity_threshold:
+            return keys[best]
+        return None
+
+    async def _embed(self, text: str) -> Optional[np.ndarray]:
+        """在线程池中计算归一化的 embedding"""
+        if self._last_embedding and self._last_embedding[0] == text:
+            return self._last_embedding[1]
+        try:
+            loop = asyncio.get_running_loop()
+            vectors = await loop.run_in_executor(None, self.embedding_function, [text])
+            vector = np.asarray(vectors[0], dtype=np.float32)
+            norm = np.linalg.norm(vector)
+            if norm > 0:
+                vector = vector / norm
+            self._last_embedding = (text, vector)
+            return vector
+        except Exception as e:
+            print(f"缓存 embedding 计算失败: {e}")
+            return None
+
+    def _expire(self):
+        """淘汰过期条目"""
+        now = time.monotonic()
+        expired = [k for k, e in self._entries.items() if now - e.created_at > self.ttl]
+        for key in expired:
+            del self._entries[key]
+            self.evictions += 1
+
+    def clear(self):
+        """清空缓存"""
+        self._entries.clear()
+
+    def get_stats(self) -> Dict:
+        """获取命中统计"""
+        hits = self.exact_hits + self.semantic_hits
+        total = hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(hits / total, 4) if total else 0.0
+        }
+
+
+class EmbeddingLRUCache:
+    """
+    文本 → embedding 向量的 LRU 缓存 (线程安全)
+
+    只缓存向量本身，命中时可直接用 query_embeddings 查询，跳过模型推理
+    """
+
+    def __init__(self, embedding_function: Callable[[List[str]], Any], max_entries: int = 4096):
+        """
+        Args:
+            embedding_function: 批量文本转向量函数
+            max_entries: 最大缓存条目数
+        """
+        self.embedding_function = embedding_function
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # 统计
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, texts: List[str]) -> List[List[float]]:
+        """批量获取向量，只对未命中的文本调用模型"""
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        missing: Dict[str, List[int]] = {}
+
+        with self._lock:
+            for i, text in enumerate(texts):
+                vector = self._entries.get(text)
+                if vector is not None:
+                    self._entries.move_to_end(text)
+                    results[i] = vector
+                    self.hits += 1
+                else:
+                    missing.setdefault(text, []).append(i)
+                    self.misses += 1
+
+        if missing:
+            unique = list(missing.keys())
+            vectors = [
+                np.asarray(v, dtype=np.float32).tolist()
+                for v in self.embedding_function(unique)
+            ]
+            with self._lock:
+                for text, vector in zip(unique, vectors):
+                    self._entries[text] = vector
+                    self._entries.move_to_end(text)
+                    for i in missing[text]:
+                        results[i] = vector
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+
+        return results
+
+    def get_stats(self) -> Dict:
+        """获取命中统计"""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
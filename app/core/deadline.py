@@ -0,0 +1,159 @@
+"""
+延迟预算与对冲请求 - 在截止时间内拿到最快的一次 LLM 响应
+"""
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class LatencyTracker:
+    """记录最近一段时间的调用耗时，用于估算分位延迟"""
+
+    def __init__(self, window: int = 256, min_samples: int = 10):
+        """
+        Args:
+            window: 保留的最近样本数
+            min_samples: 给出分位数所需的最少样本数
+        """
+        self._samples = deque(maxlen=window)
+        self.min_samples = min_samples
+
+    def record(self, seconds: float):
+        """记录一次成功调用的耗时（秒）"""
+        self._samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """返回 p 分位 (0~1) 的耗时，样本不足时返回 None"""
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        index = min(int(p * len(ordered)), len(ordered) - 1)
+        return ordered[index]
+
+    def get_stats(self) -> Dict:
+        """获取延迟统计"""
+        return {
+            "samples": len(self._samples),
+            "p50": self.percentile(0.5),
+            "p90": self.percentile(0.9),
+            "p99": self.percentile(0.99)
+        }
+
+
+class HedgedCaller:
+    """
+    对冲调用
+
+    先发出一次请求；若超过历史 p 分位延迟仍未返回，再发出第二次请求，
+    取先成功的结果并取消另一个。整体超过预算时抛出 asyncio.TimeoutError。
+    allow_hedge 返回 False 时 (如下游已熔断或饱和) 不发出对冲，避免加重负载。
+    """
+
+    def __init__(
+        self,
+        tracker: LatencyTracker,
+        percentile: float = 0.9,
+        min_delay: float = 0.8,
+        allow_hedge: Optional[Callable[[], bool]] = None
+    ):
+        """
+        Args:
+            tracker: 延迟统计
+            percentile: 触发对冲的历史延迟分位
+            min_delay: 对冲前的最短等待（秒），样本不足时也用于估算
+            allow_hedge: 发出对冲前的检查，返回 False 时跳过对冲
+        """
+        self.tracker = tracker
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.allow_hedge = allow_hedge
+
+        # 统计
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.hedges_suppressed = 0
+        self.deadline_exceeded = 0
+
+    def hedge_delay(self, budget: float) -> float:
+        """计算发出对冲请求前的等待时间"""
+        observed = self.tracker.percentile(self.percentile)
+        delay = max(observed or 0.0, self.min_delay)
+        # 至少给对冲请求留出一半预算
+        return min(delay, budget / 2)
+
+    async def call(
+        self,
+        factory: Callable[[float], Awaitable[T]],
+        budget: float,
+        discard: Optional[Callable[[T], Awaitable[None]]] = None
+    ) -> T:
+        """
+        在预算内执行调用
+
+        Args:
+            factory: 接收本次尝试剩余超时（秒）并发起请求的函数
+            budget: 总延迟预算（秒）
+            discard: 释放落败尝试结果的函数 (如关闭已打开的流)
+        """
+        self.calls += 1
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + budget
+        delay = self.hedge_delay(budget)
+
+        primary = asyncio.ensure_future(factory(budget))
+        tasks = [primary]
+        hedged = False
+        last_error: Optional[BaseException] = None
+
+        try:
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    self.deadline_exceeded += 1
+                    raise asyncio.TimeoutError()
+
+                wait = remaining if hedged else min(remaining, delay)
+                done, _ = await asyncio.wait(
+                    tasks, timeout=wait, return_when=asyncio.FIRST_COMPLETED
+                )
+
+                for task in done:
+                    tasks.remove(task)
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.hedge_wins += 1
+                        return task.result()
+                    last_error = task.exception()
+
+                # 超过对冲延迟仍未返回，或首个请求已失败：发出对冲请求
+                if not hedged:
+                    hedged = True
+                    if self.allow_hedge is None or self.allow_hedge():
+                        self.hedges += 1
+                        remaining = max(deadline - loop.time(), 0.001)
+                        tasks.append(asyncio.ensure_future(factory(remaining)))
+                    else:
+                        self.hedges_suppressed += 1
+
+                if not tasks:
+                    raise last_error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                elif discard and not task.cancelled() and task.exception() is None:
+                    # 与胜出者同时完成的尝试，结果需要单独释放
+                    asyncio.ensure_future(discard(task.result()))
+
+    def get_stats(self) -> Dict:
+        """获取对冲统计"""
+        return {
+            "calls": self.calls,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "hedges_suppressed": self.hedges_suppressed,
+            "deadline_exceeded": self.deadline_exceeded
+        }
@@ -0,0 +1,44 @@
+"""
+本地兜底建议 - LLM 超时或不可用时，基于已检索到的金句即时生成回复
+"""
+from typing import Dict, List, Sequence, Tuple
+
+# (建议类型, 模板)；模板可用字段：quote, source, author
+LOCAL_TEMPLATES: List[Tuple[str, str]] = [
+    ("insight", "{author}说过：「{quote}」"),
+    ("humor", "借《{source}》一句：{quote}，你品，你细品。"),
+    ("question", "如果按「{quote}」来看，你会怎么选？"),
+]
+
+DEFAULT_SUGGESTIONS: List[Tuple[str, str]] = [
+    ("insight", "听过很多道理，依然过不好这一生。"),
+    ("humor", "生活就像一盒巧克力，你永远不知道下一颗是什么味道。"),
+    ("question", "我理解你的想法，能说得更具体吗？"),
+]
+
+
+def build_local_suggestions(quotes: Sequence[Dict], limit: int = 3) -> List[Tuple[str, str]]:
+    """
+    用检索到的金句套用模板生成建议
+
+    Returns:
+        [(建议类型, 内容), ...]，金句不足时用默认建议补齐
+    """
+    suggestions = []
+    for i, (kind, template) in enumerate(LOCAL_TEMPLATES[:limit]):
+        if not quotes:
+            break
+        quote = quotes[i % len(quotes)]
+        suggestions.append((kind, template.format(
+            quote=quote.get("quote", ""),
+            source=quote.get("source", ""),
+            author=quote.get("author", "")
+        )))
+
+    for kind, text in DEFAULT_SUGGESTIONS:
+        if len(suggestions) >= limit:
+            break
+        if all(kind != k for k, _ in suggestions):
+            suggestions.append((kind, text))
+
+    return suggestions[:limit]
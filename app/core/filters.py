@@ -0,0 +1,126 @@
+"""
+元数据过滤 - 按 category/type/author/source 预先建立倒排 (posting list)，过滤检索无需先多取再筛
+"""
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple, Union
+
+# 支持过滤的金句字段
+FILTER_FIELDS = ("category", "type", "author", "source")
+
+FilterValue = Union[str, Iterable[str]]
+Filters = Dict[str, Tuple[str, ...]]
+
+
+def normalize_filters(filters: Optional[Dict[str, Optional[FilterValue]]]) -> Optional[Filters]:
+    """
+    规范化过滤条件：字段内取并集 (任一值匹配)，字段之间取交集
+
+    Returns:
+        {字段: (值, ...)}，没有有效条件时返回 None
+    """
+    if not filters:
+        return None
+    normalized = {}
+    for field, values in filters.items():
+        if field not in FILTER_FIELDS:
+            raise ValueError(f"不支持按 {field} 过滤，可选字段: {', '.join(FILTER_FIELDS)}")
+        if values is None:
+            continue
+        if isinstance(values, str):
+            values = [values]
+        values = tuple(sorted(set(values)))
+        if values:
+            normalized[field] = values
+    return normalized or None
+
+
+def filters_key(filters: Optional[Filters]) -> Tuple:
+    """可哈希的过滤条件，用于合并相同查询"""
+    return tuple(sorted(filters.items())) if filters else ()
+
+
+def to_chroma_where(filters: Optional[Filters]) -> Optional[Dict]:
+    """转换为 ChromaDB 的 where 条件"""
+    if not filters:
+        return None
+    clauses = [{field: {"$in": list(values)}} for field, values in filters.items()]
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+class MetadataPostings:
+    """字段 → 值 → 行号集合"""
+
+    def __init__(self, max_cached: int = 256):
+        self._postings: Dict[str, Dict[str, Set[int]]] = {field: {} for field in FILTER_FIELDS}
+        # 过滤条件 → 排好序的行号，供向量索引直接切片
+        self._sorted_rows: Dict[Tuple, List[int]] = {}
+        # 过滤条件 → 行号集合，供词法检索逐行判断
+        self._row_sets: Dict[Tuple, FrozenSet[int]] = {}
+        self.max_cached = max_cached
+
+    def _invalidate(self):
+        self._sorted_rows.clear()
+        self._row_sets.clear()
+
+    def clear(self):
+        for values in self._postings.values():
+            values.clear()
+        self._invalidate()
+
+    def add(self, row: int, metadata: Dict):
+        self._invalidate()
+        for field, values in self._postings.items():
+            value = metadata.get(field)
+            if value is not None:
+                values.setdefault(str(value), set()).add(row)
+
+    def discard(self, row: int, metadata: Dict):
+        self._invalidate()
+        for field, values in self._postings.items():
+            value = metadata.get(field)
+            if value is not None and str(value) in values:
+                values[str(value)].discard(row)
+
+    def rows(self, filters: Optional[Filters]) -> Optional[Set[int]]:
+        """满足条件的行号；没有条件时返回 None 表示不过滤"""
+        if not filters:
+            return None
+        result: Optional[Set[int]] = None
+        # 先处理最小的集合，交集越早变小越省事
+        candidates: List[Set[int]] = []
+        for field, values in filters.items():
+            postings = self._postings[field]
+            candidates.append(set().union(*(postings.get(value, set()) for value in values)))
+        for rows in sorted(candidates, key=len):
+            result = rows if result is None else result & rows
+            if not result:
+                return set()
+        return result
+
+    def sorted_rows(self, filters: Optional[Filters]) -> Optional[List[int]]:
+        """同 rows()，返回升序行号列表并缓存"""
+        if not filters:
+            return None
+        key = filters_key(filters)
+        cached = self._sorted_rows.get(key)
+        if cached is None:
+            cached = sorted(self.rows(filters))
+            if len(self._sorted_rows) >= self.max_cached:
+                self._sorted_rows.clear()
+            self._sorted_rows[key] = cached
+        return cached
+
+    def row_set(self, filters: Optional[Filters]) -> Optional[FrozenSet[int]]:
+        """同 rows()，返回不可变集合并缓存"""
+        if not filters:
+            return None
+        key = filters_key(filters)
+        cached = self._row_sets.get(key)
+        if cached is None:
+            cached = frozenset(self.rows(filters))
+            if len(self._row_sets) >= self.max_cached:
+                self._row_sets.clear()
+            self._row_sets[key] = cached
+        return cached
+
+    def get_stats(self) -> Dict:
+        return {field: len(values) for field, values in self._postings.items()}
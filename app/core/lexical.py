@@ -0,0 +1,150 @@
+"""
+词法检索 - 中文字符 bigram/trigram 倒排索引 + BM25 打分，无需模型推理
+"""
+import math
+import re
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from app.core.filters import Filters, MetadataPostings
+
+# 连续的中日韩字符切 n-gram，字母数字按整词
+_TOKEN_PATTERN = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff]+|[a-z0-9]+")
+
+# 参与建索引的金句字段
+INDEXED_FIELDS = ("quote", "context", "category")
+
+
+def tokenize(text: str) -> List[str]:
+    """把文本切成字符 bigram/trigram (中文) 与整词 (英文/数字)"""
+    terms = []
+    for run in _TOKEN_PATTERN.findall((text or "").lower()):
+        if not ("\u3400" <= run[0] <= "\u9fff"):
+            terms.append(run)
+            continue
+        if len(run) == 1:
+            terms.append(run)
+            continue
+        for n in (2, 3):
+            terms.extend(run[i:i + n] for i in range(len(run) - n + 1))
+    return terms
+
+
+class LexicalIndex:
+    """
+    内存倒排索引，BM25 打分
+
+    文档按 id 去重；覆盖写入时旧文档打上删除标记，检索时跳过。
+    出现在过多文档中的词 (df 占比超过 max_df_ratio) 区分度很低，检索时直接忽略以控制耗时。
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, max_df_ratio: float = 0.5):
+        self.k1 = k1
+        self.b = b
+        self.max_df_ratio = max_df_ratio
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        """清空索引"""
+        self._postings: Dict[str, List[Tuple[int, int]]] = {}
+        self._doc_lengths: List[int] = []
+        self._metadatas: List[Dict] = []
+        self._rows: Dict[str, int] = {}
+        self._deleted = set()
+        self._total_length = 0
+        self._filter_postings = MetadataPostings()
+
+    def count(self) -> int:
+        """有效文档数"""
+        return len(self._rows)
+
+    def add(self, ids: Sequence[str], metadatas: Sequence[Dict]):
+        """加入或覆盖文档"""
+        with self._lock:
+            for id_, metadata in zip(ids, metadatas):
+                old = self._rows.get(id_)
+                if old is not None:
+                    self._deleted.add(old)
+                    self._total_length -= self._doc_lengths[old]
+                    self._filter_postings.discard(old, self._metadatas[old])
+
+                text = " ".join(str(metadata.get(field, "")) for field in INDEXED_FIELDS)
+                terms = Counter(tokenize(text))
+                row = len(self._metadatas)
+                for term, tf in terms.items():
+                    self._postings.setdefault(term, []).append((row, tf))
+                length = sum(terms.values())
+                self._doc_lengths.append(length)
+                self._metadatas.append(metadata)
+                self._rows[id_] = row
+                self._total_length += length
+                self._filter_postings.add(row, metadata)
+
+    def search(self, query: str, top_k: int, filters: Optional[Filters] = None) -> List[Tuple[Dict, float]]:
+        """
+        BM25 检索
+
+        Args:
+            filters: 元数据过滤条件，只对满足条件的文档打分
+
+        Returns:
+            [(金句元数据, 分数), ...]，按分数降序；没有任何词命中时为空
+        """
+        n_docs = self.count()
+        if n_docs == 0 or top_k <= 0:
+            return []
+        avg_length = self._total_length / n_docs
+        max_df = max(self.max_df_ratio * n_docs, 1)
+        allowed = self._filter_postings.row_set(filters)
+        if allowed is not None and not allowed:
+            return []
+
+        scores: Dict[int, float] = {}
+        for term, query_tf in Counter(tokenize(query)).items():
+            postings = self._postings.get(term)
+            if not postings or len(postings) > max_df:
+                continue
+            df = len(postings)
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            for row, tf in postings:
+                if row in self._deleted or (allowed is not None and row not in allowed):
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self._doc_lengths[row] / avg_length)
+                scores[row] = scores.get(row, 0.0) + query_tf * idf * tf * (self.k1 + 1) / (tf + norm)
+
+        top = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        return [(self._metadatas[row], score) for row, score in top]
+
+    def get_stats(self) -> Dict:
+        """获取索引统计"""
+        return {
+            "documents": self.count(),
+            "terms": len(self._postings),
+            "deleted": len(self._deleted)
+        }
+
+
+def reciprocal_rank_fusion(
+    rankings: Sequence[Sequence[Dict]],
+    key,
+    k: int = 60
+) -> List[Dict]:
+    """
+    倒数排名融合 (RRF)：score = Σ 1 / (k + rank)
+
+    Args:
+        rankings: 多路检索结果，每路按相关度降序
+        key: 从结果中取出去重键的函数
+        k: 平滑常数，越大越弱化头部名次的差异
+    """
+    scores: Dict[str, float] = {}
+    items: Dict[str, Dict] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            item_key = key(item)
+            scores[item_key] = scores.get(item_key, 0.0) + 1.0 / (k + rank + 1)
+            items.setdefault(item_key, item)
+    ordered = sorted(scores, key=lambda item_key: scores[item_key], reverse=True)
+    return [items[item_key] for item_key in ordered]
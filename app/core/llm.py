@@ -1,98 +1,512 @@
-from openai import OpenAI
+import asyncio
+import sys
+import time
+from contextlib import AsyncExitStack, asynccontextmanager
+from dataclasses import dataclass
+import httpx
+from openai import AsyncOpenAI
 from app.config import settings
-from typing import List, Dict
+from app.core.batching import LLMBatcher
+from app.core.cache import LLMResponseCache, make_cache_key
+from app.core.deadline import LatencyTracker, HedgedCaller
+from app.core.fallback import build_local_suggestions
+from app.core.prompts import build_suggestion_messages
+from app.core.resilience import (
+    AdaptiveConcurrencyLimiter, CircuitBreaker, ConcurrencyLimitTimeout
+)
+from app.core.singleflight import SingleFlight, request_key_text
+from app.core.rag import rag_service
+from app.core.registry import service_registry
+from typing import List, Dict, Optional, AsyncIterator, Tuple
+
+
+# 计时器可能略早于截止时间触发，此范围内的取消仍视为预算超时
+DEADLINE_SLACK = 0.05
+
+
+class LLMNotConfiguredError(Exception):
+    """未配置 API Key，调用方直接走降级路径"""
+
+
+@dataclass
+class _CallMetrics:
+    """单次受保护调用的观测值"""
+    latency: Optional[float] = None   # 显式上报的延迟（秒），为 None 时取持有名额的时长
+
 
 class LLMService:
     """LLM 服务类 - 负责与 DeepSeek API 交互"""
-    
+
     def __init__(self):
-        self.client = OpenAI(
-            api_key=settings.OPENAI_API_KEY,
-            base_url=settings.OPENAI_BASE_URL
+        # 复用长连接的 HTTP 连接池，避免每次请求重新握手
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.LLM_MAX_KEEPALIVE,
+                keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY
+            ),
+            timeout=httpx.Timeout(settings.LLM_TIMEOUT, connect=settings.LLM_CONNECT_TIMEOUT)
+        )
+        if not settings.OPENAI_API_KEY:
+            print("⚠️ 未配置 OPENAI_API_KEY，LLM 建议将使用本地兜底")
+        self.client = AsyncOpenAI(
+            api_key=settings.OPENAI_API_KEY or "not-configured",
+            base_url=settings.OPENAI_BASE_URL,
+            http_client=self.http_client,
+            max_retries=0  # 超时由调用方控制，不在 SDK 内部重试
         )
         self.model = settings.LLM_MODEL_NAME
-    
-    def generate_suggestion(self, user_text: str, related_quotes: List[Dict], parent_content: str = None) -> List[str]:
+        self.timeout = settings.LLM_TIMEOUT
+
+        # 按观测到的延迟和错误率自适应调整在途请求数 (AIMD)
+        self.limiter = AdaptiveConcurrencyLimiter(
+            initial_limit=min(settings.LLM_INITIAL_CONCURRENCY, settings.LLM_MAX_CONCURRENCY),
+            min_limit=settings.LLM_MIN_CONCURRENCY,
+            max_limit=settings.LLM_MAX_CONCURRENCY,
+            tolerance=settings.LLM_LATENCY_TOLERANCE,
+            queue_timeout=settings.LLM_QUEUE_TIMEOUT
+        )
+
+        # 提供方持续出错或变慢时熔断，调用方快速走降级路径
+        self.breaker = CircuitBreaker(
+            error_rate=settings.LLM_BREAKER_ERROR_RATE,
+            window=settings.LLM_BREAKER_WINDOW,
+            min_requests=settings.LLM_BREAKER_MIN_REQUESTS,
+            reset_timeout=settings.LLM_BREAKER_RESET_TIMEOUT,
+            slow_call_threshold=settings.LLM_SLOW_CALL_THRESHOLD
+        )
+
+        # 响应缓存：复用 RAG 服务已加载的 embedding 模型做语义匹配
+        self.cache = LLMResponseCache(
+            max_entries=settings.LLM_CACHE_MAX_ENTRIES,
+            ttl=settings.LLM_CACHE_TTL,
+            similarity_threshold=settings.LLM_CACHE_SIMILARITY,
+            embedding_function=lambda texts: rag_service.embed_queries(texts)
+        ) if settings.LLM_CACHE_ENABLED else None
+
+        # 合并相同的在途请求
+        self._flights = SingleFlight()
+
+        # 延迟统计与对冲请求
+        self.latency = LatencyTracker()
+        self.hedger = HedgedCaller(
+            self.latency,
+            percentile=settings.LLM_HEDGE_PERCENTILE,
+            min_delay=settings.LLM_HEDGE_MIN_DELAY,
+            allow_hedge=self._may_hedge
+        ) if settings.LLM_HEDGE_ENABLED else None
+
+        # 流式请求按首 token 延迟单独统计和对冲
+        self.stream_latency = LatencyTracker()
+        self.stream_hedger = HedgedCaller(
+            self.stream_latency,
+            percentile=settings.LLM_HEDGE_PERCENTILE,
+            min_delay=settings.LLM_HEDGE_MIN_DELAY,
+            allow_hedge=self._may_hedge
+        ) if settings.LLM_HEDGE_ENABLED else None
+
+        # 可选的跨客户端微批调度
+        self.batcher = LLMBatcher(
+            send=self._send,
+            max_batch_size=settings.LLM_BATCH_MAX_SIZE,
+            max_wait_ms=settings.LLM_BATCH_MAX_WAIT_MS
+        ) if settings.LLM_BATCH_ENABLED else None
+
+    def _may_hedge(self) -> bool:
+        """熔断未关闭或并发已饱和时不发出对冲，避免加重提供方负载"""
+        return self.breaker.state == CircuitBreaker.CLOSED and not self.limiter.saturated()
+
+    def _cache_keys(
+        self,
+        messages: List[Dict],
+        temperature: float,
+        max_tokens: int,
+        cache_namespace: Optional[str]
+    ):
+        """
+        计算精确缓存键和语义匹配的命名空间
+
+        消息内容先规范化 (空白、大小写、标点)，该键同时用于缓存和单飞合并
+        """
+        normalized = [
+            {"role": m.get("role"), "content": request_key_text(m.get("content") or "")}
+            for m in messages
+        ]
+        key = make_cache_key(self.model, temperature, max_tokens, normalized)
+        namespace = make_cache_key(self.model, temperature, max_tokens, cache_namespace)
+        return key, namespace
+
+    async def chat(
+        self,
+        messages: List[Dict],
+        temperature: float = 0.8,
+        max_tokens: int = 500,
+        timeout: Optional[float] = None,
+        use_cache: bool = True,
+        cache_namespace: Optional[str] = None,
+        semantic_key: Optional[str] = None,
+        budget: Optional[float] = None
+    ) -> str:
+        """
+        调用 Chat Completions 接口并返回文本内容
+
+        Args:
+            messages: 对话消息列表
+            temperature: 采样温度
+            max_tokens: 最大生成 token 数
+            timeout: 本次调用超时（秒），默认使用 LLM_TIMEOUT
+            use_cache: 是否使用响应缓存，为 False 时总是请求新结果
+            cache_namespace: 语义匹配的命名空间 (通常为 prompt 模板名)
+            semantic_key: 用于语义匹配的可变文本，为 None 时只做精确匹配
+            budget: 延迟预算（秒），设置后启用对冲请求，超出预算抛出 asyncio.TimeoutError
+
+        Returns:
+            模型返回的文本
+        """
+        if not use_cache:
+            # 需要新结果时既不读缓存，也不与其他请求合并
+            return await self._call(messages, temperature, max_tokens, timeout, budget)
+
+        key, namespace = self._cache_keys(messages, temperature, max_tokens, cache_namespace)
+        if self.cache:
+            cached = await self.cache.get(key, namespace, semantic_key)
+            if cached is not None:
+                return cached
+
+        async def call() -> str:
+            content = await self._call(messages, temperature, max_tokens, timeout, budget)
+            if self.cache and content:
+                await self.cache.set(key, namespace, content, semantic_key)
+            return content
+
+        return await self._flights.do(key, call)
+
+    async def _call(
+        self,
+        messages: List[Dict],
+        temperature: float,
+        max_tokens: int,
+        timeout: Optional[float],
+        budget: Optional[float]
+    ) -> str:
+        """按是否有延迟预算选择普通请求或对冲请求"""
+        if budget is None:
+            return await self._create(messages, temperature, max_tokens, timeout)
+        if self.hedger is None:
+            return await asyncio.wait_for(
+                self._create(messages, temperature, max_tokens, budget),
+                timeout=budget
+            )
+        return await self.hedger.call(
+            lambda remaining: self._create(messages, temperature, max_tokens, remaining),
+            budget
+        )
+
+    async def _create(
+        self,
+        messages: List[Dict],
+        temperature: float,
+        max_tokens: int,
+        timeout: Optional[float]
+    ) -> str:
+        """发起一次非流式请求，启用微批时交给批处理调度器"""
+        if self.batcher:
+            return await self.batcher.submit(messages, temperature, max_tokens, timeout)
+        return await self._send(messages, temperature, max_tokens, timeout)
+
+    @asynccontextmanager
+    async def _guarded(self, deadline: Optional[float] = None, track_latency: bool = True):
+        """
+        熔断检查并获取并发名额，调用结果反馈给熔断器和限流器
+
+        deadline 为本次调用的截止时间 (loop.time())；到达截止时间后被取消
+        (对冲调用方或外层 wait_for 的预算超时) 计为超时失败，而不是普通取消。
+        产出的 _CallMetrics 可由调用方显式上报延迟 (流式调用上报首 token 延迟)，
+        否则按持有名额的时长计算；track_latency 为 False 时 (离线批量) 成功调用
+        不参与慢调用判定和 AIMD 延迟基线，只有失败会被计入
+        """
+        if not settings.OPENAI_API_KEY:
+            raise LLMNotConfiguredError("未配置 OPENAI_API_KEY")
+        self.breaker.before_call()
+        try:
+            async with self.limiter.acquire():
+                started = time.monotonic()
+                metrics = _CallMetrics()
+                try:
+                    yield metrics
+                except (asyncio.CancelledError, GeneratorExit):
+                    loop = asyncio.get_running_loop()
+                    if deadline is not None and loop.time() >= deadline - DEADLINE_SLACK:
+                        self.breaker.record(False)
+                        self.limiter.on_failure()
+                    else:
+                        # 截止前被取消 (如对冲落败、流提前结束) 不代表提供方异常
+                        self.breaker.on_cancel()
+                    raise
+                except Exception:
+                    self.breaker.record(False)
+                    self.limiter.on_failure()
+                    raise
+                if not track_latency:
+                    self.breaker.record(True)
+                    return
+                latency = metrics.latency if metrics.latency is not None else time.monotonic() - started
+                self.breaker.record(True, latency)
+                self.limiter.on_success(latency)
+        except ConcurrencyLimitTimeout:
+            self.breaker.on_cancel()
+            raise
+
+    async def _send(
+        self,
+        messages: List[Dict],
+        temperature: float,
+        max_tokens: int,
+        timeout: Optional[float]
+    ) -> str:
+        """
+        直接向提供方发送一次非流式请求
+
+        未指定 timeout 的调用 (离线批量) 不计入延迟统计和慢调用判定
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (timeout or self.timeout)
+        track_latency = timeout is not None
+        async with self._guarded(deadline, track_latency=track_latency):
+            started = time.monotonic()
+            # 排队等待并发名额的时间也计入超时
+            remaining = max(deadline - loop.time(), 0.001)
+            response = await asyncio.wait_for(
+                self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    timeout=remaining
+                ),
+                timeout=remaining
+            )
+            if track_latency:
+                self.latency.record(time.monotonic() - started)
+        return response.choices[0].message.content or ""
+
+    async def stream_chat(
+        self,
+        messages: List[Dict],
+        temperature: float = 0.8,
+        max_tokens: int = 500,
+        timeout: Optional[float] = None,
+        use_cache: bool = True,
+        cache_namespace: Optional[str] = None,
+        semantic_key: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """
+        以流式模式调用 Chat Completions 接口，逐段产出增量文本
+
+        timeout 为整次调用的总时长上限（秒），超时抛出 asyncio.TimeoutError；
+        缓存命中时一次性产出缓存内容，完整结束的流会写入缓存
+        """
+        cache = self.cache if use_cache else None
+        if cache:
+            key, namespace = self._cache_keys(messages, temperature, max_tokens, cache_namespace)
+            cached = await cache.get(key, namespace, semantic_key)
+            if cached is not None:
+                yield cached
+                return
+
+        timeout = timeout or self.timeout
+
+        if self.batcher and self.batcher.can_batch(messages):
+            # 启用微批时流式请求也参与合并：批量调用无法逐 token 返回，
+            # 以首 token 延迟换吞吐，整段结果一次性产出
+            content = await asyncio.wait_for(
+                self.batcher.submit(messages, temperature, max_tokens, timeout),
+                timeout=timeout
+            )
+            if content:
+                yield content
+                if cache:
+                    await cache.set(key, namespace, content, semantic_key)
+            return
+
+        parts: List[str] = []
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+
+        # 打开流并等到首个 token；超过首 token 的历史分位延迟时发出对冲请求
+        if self.stream_hedger is None:
+            opened = await asyncio.wait_for(
+                self._open_stream(messages, temperature, max_tokens, timeout),
+                timeout=timeout
+            )
+        else:
+            opened = await self.stream_hedger.call(
+                lambda remaining: self._open_stream(messages, temperature, max_tokens, remaining),
+                timeout,
+                discard=self._discard_stream
+            )
+        guard, chunks, first = opened
+
+        async with guard:
+            if first:
+                parts.append(first)
+                yield first
+            while first is not None:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError()
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), timeout=remaining)
+                except StopAsyncIteration:
+                    break
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+
+        if cache and parts:
+            await cache.set(key, namespace, "".join(parts), semantic_key)
+
+    async def _open_stream(
+        self,
+        messages: List[Dict],
+        temperature: float,
+        max_tokens: int,
+        timeout: float
+    ) -> Tuple[AsyncExitStack, AsyncIterator, Optional[str]]:
+        """
+        发起一次流式请求并读到首个有内容的增量
+
+        Returns:
+            (guard, chunks, first)：guard 退出时关闭流并归还并发名额；
+            first 为首段文本，流在产出内容前结束时为 None
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        guard = AsyncExitStack()
+        metrics = await guard.enter_async_context(self._guarded(deadline))
+        try:
+            started = time.monotonic()
+            remaining = max(deadline - loop.time(), 0.001)
+            stream = await asyncio.wait_for(
+                self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    timeout=remaining,
+                    stream=True
+                ),
+                timeout=remaining
+            )
+            guard.push_async_callback(stream.close)
+            chunks = stream.__aiter__()
+            first = None
+            while first is None:
+                try:
+                    chunk = await asyncio.wait_for(
+                        chunks.__anext__(), timeout=max(deadline - loop.time(), 0)
+                    )
+                except StopAsyncIteration:
+                    break
+                if chunk.choices and chunk.choices[0].delta.content:
+                    first = chunk.choices[0].delta.content
+            # 流会持有名额直到结束，熔断与 AIMD 按首 token 延迟判断提供方是否变慢
+            metrics.latency = time.monotonic() - started
+            self.stream_latency.record(metrics.latency)
+        except BaseException:
+            await guard.__aexit__(*sys.exc_info())
+            raise
+        return guard, chunks, first
+
+    @staticmethod
+    async def _discard_stream(opened: Tuple[AsyncExitStack, AsyncIterator, Optional[str]]):
+        """关闭对冲落败但已打开的流"""
+        guard, _, _ = opened
+        await guard.aclose()
+
+    async def generate_suggestion(self, user_text: str, related_quotes: List[Dict], parent_content: str = None, use_cache: bool = True, budget: Optional[float] = None) -> List[str]:
         """
         根据用户输入和相关金句生成回复建议
-        
+
         Args:
             user_text: 用户说的话 (或当前会话上下文)
             related_quotes: RAG 检索出的相关金句列表
             parent_content: 父节点内容 (如果是在进行思维延展)
-        
+            use_cache: 是否允许复用缓存结果
+            budget: 延迟预算（秒），默认使用 SUGGESTION_LATENCY_BUDGET
+
         Returns:
             建议回复列表
         """
-        # 构建上下文
-        quotes_context = "\n".join([
-            f"- {q['quote']} (出自《{q['source']}》，适用场景：{q['context']})"
-            for q in related_quotes
-        ])
-        
-        # Prompt 设计
-        if parent_content:
-            # 思维延展模式
-            prompt = f"""你是一个深度思维助手，正在帮助用户进行思维发散。
-
-当前思维节点："{parent_content}"
-用户补充/上下文："{user_text}"
-
-请基于当前节点，结合以下金句灵感，生成 3 个后续思维发展方向（候选节点）：
-{quotes_context}
-
-要求：
-1. 必须是基于“当前思维节点”的进一步延伸或反转。
-2. 结合金句的智慧，但不要生硬引用。
-3. 三个方向要有差异（例如：一个是深入分析，一个是幽默反转，一个是行动建议）。
-4. 每个选项不超过 20 字。
-
-直接返回 3 条建议，每条一行。"""
-        else:
-            # 普通建议模式
-            prompt = f"""你是一个社交对话助手，帮助用户在聊天时展现智慧和幽默。
-
-用户正在说："{user_text}"
-
-以下是一些相关的金句供参考：
-{quotes_context}
+        suggestions, _ = await self.generate_suggestion_result(
+            user_text, related_quotes, parent_content, use_cache=use_cache, budget=budget
+        )
+        return suggestions
 
-请给出 3 条回复建议：
-1. 一条幽默风趣的回复（可以结合金句改编）
-2. 一条展现深度的回复（引用金句或哲理）
-3. 一条温暖真诚的回复
+    async def generate_suggestion_result(
+        self,
+        user_text: str,
+        related_quotes: List[Dict],
+        parent_content: str = None,
+        use_cache: bool = True,
+        budget: Optional[float] = None,
+        offline: bool = False
+    ) -> Tuple[List[str], bool]:
+        """
+        生成回复建议，并标明结果是否来自本地兜底
 
-要求：
-- 简短有力，不超过 30 字
-- 既要引用恰当，又要展现个人智慧
-- 避免生硬堆砌，要自然流畅
+        Args:
+            offline: 离线批量生成，不使用交互延迟预算和对冲请求，只受 LLM_TIMEOUT 约束
 
-直接返回 3 条建议，每条一行，不需要编号。"""
+        Returns:
+            (建议回复列表, 是否为本地兜底建议)
+        """
+        # 静态指令在前、可变内容在后，便于命中提供方的前缀缓存
+        messages = build_suggestion_messages(
+            user_text,
+            related_quotes,
+            parent_content=parent_content,
+            text_budget=settings.LLM_INPUT_TOKEN_BUDGET,
+            quotes_budget=settings.LLM_QUOTES_TOKEN_BUDGET
+        )
 
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "你是一个专业的社交对话助手。"},
-                    {"role": "user", "content": prompt}
-                ],
+            content = await self.chat(
+                messages=messages,
                 temperature=0.8,
-                max_tokens=500
+                max_tokens=500,
+                use_cache=use_cache,
+                cache_namespace="expand" if parent_content else "suggestion",
+                semantic_key=f"{parent_content}\n{user_text}" if parent_content else user_text,
+                budget=None if offline else (budget or settings.SUGGESTION_LATENCY_BUDGET)
             )
-            
+
             # 解析返回结果
-            content = response.choices[0].message.content
             suggestions = [line.strip() for line in content.split('\n') if line.strip()]
-            
-            return suggestions[:3]  # 确保只返回 3 条
-            
+
+            return suggestions[:3], False  # 确保只返回 3 条
+
         except Exception as e:
-            print(f"LLM 调用失败: {e}")
-            return [
-                "生活就像一盒巧克力，你永远不知道下一颗是什么味道。",
-                "听过很多道理，依然过不好这一生。",
-                "真诚是永远的通行证。"
-            ]
-
-# 单例模式
-llm_service = LLMService()
+            print(f"LLM 调用失败或超出延迟预算: {e!r}，使用本地建议")
+            return [text for _, text in build_local_suggestions(related_quotes)], True
+
+    def get_stats(self) -> Dict:
+        """获取 LLM 服务运行统计"""
+        return {
+            "concurrency": self.limiter.get_stats(),
+            "circuit_breaker": self.breaker.get_stats(),
+            "cache": self.cache.get_stats() if self.cache else None,
+            "single_flight": self._flights.get_stats(),
+            "batching": self.batcher.get_stats() if self.batcher else None,
+            "hedging": self.hedger.get_stats() if self.hedger else None,
+            "latency": self.latency.get_stats(),
+            "stream_hedging": self.stream_hedger.get_stats() if self.stream_hedger else None,
+            "stream_first_token_latency": self.stream_latency.get_stats()
+        }
+
+    async def close(self):
+        """关闭连接池"""
+        await self.client.close()
+
+# 单例模式：首次使用时创建
+llm_service = service_registry.register("llm", LLMService)
@@ -282,4 +282,8 @@ class NewsService:
 
 # 单例 (可通过环境变量配置 API Key)
 import os
-news_service = NewsService(api_key=os.getenv("NEWS_API_KEY"))
+from app.core.registry import service_registry
+news_service = service_registry.register(
+    "news",
+    lambda: NewsService(api_key=os.getenv("NEWS_API_KEY"))
+)
@@ -0,0 +1,203 @@
+"""
+Prompt 组装 - 控制 token 预算，并保持静态指令前缀稳定以命中提供方的前缀缓存
+
+所有固定指令都放在 system 消息中，逐字节保持不变；
+每次变化的内容 (对话上下文、金句、用户输入) 统一放在最后一条 user 消息里。
+"""
+import math
+import re
+from typing import Dict, List, Optional, Sequence
+
+from app.core.speech import TranscriptSegment
+
+# ============ 静态指令前缀 ============
+
+SUGGESTION_SYSTEM_PROMPT = """你是一个专业的社交对话助手，帮助用户在聊天时展现智慧和幽默。
+
+你会收到用户正在说的话，以及一些相关的金句供参考。
+请给出 3 条回复建议：
+1. 一条幽默风趣的回复（可以结合金句改编）
+2. 一条展现深度的回复（引用金句或哲理）
+3. 一条温暖真诚的回复
+
+要求：
+- 简短有力，不超过 30 字
+- 既要引用恰当，又要展现个人智慧
+- 避免生硬堆砌，要自然流畅
+
+直接返回 3 条建议，每条一行，不需要编号。"""
+
+EXPAND_SYSTEM_PROMPT = """你是一个深度思维助手，正在帮助用户进行思维发散。
+
+你会收到当前思维节点、用户补充/上下文，以及一些金句灵感。
+请基于当前节点，结合金句灵感，生成 3 个后续思维发展方向（候选节点）。
+
+要求：
+1. 必须是基于“当前思维节点”的进一步延伸或反转。
+2. 结合金句的智慧，但不要生硬引用。
+3. 三个方向要有差异（例如：一个是深入分析，一个是幽默反转，一个是行动建议）。
+4. 每个选项不超过 20 字。
+
+直接返回 3 条建议，每条一行。"""
+
+ASSISTANT_SYSTEM_PROMPT = """你是一个实时对话辅助助手，帮助用户在社交场合展现智慧。用户正在与他人对话，你需要帮助用户提供有深度的回应。
+
+你会收到当前对话上下文和对方最新说的话。
+请生成 3 个不同类型的回应建议：
+1. [深度] 一个展现思考深度的回应，可引用名人名言或哲理
+2. [幽默] 一个风趣幽默但不失礼貌的回应
+3. [追问] 一个有启发性的追问，推动对话深入
+
+要求：
+- 每个建议不超过 30 字
+- 自然流畅，符合口语表达
+- 与当前话题紧密相关
+
+格式：每行一个建议，以[类型]开头"""
+
+# 中日韩统一表意文字及全角标点
+_CJK_PATTERN = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    估算文本的 token 数
+
+    中文字符按 1 个 token 计 (偏保守)，其余字符按 4 个字符 1 个 token 计
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    other = len(text) - cjk
+    return cjk + math.ceil(other / 4)
+
+
+def count_message_tokens(messages: Sequence[Dict]) -> int:
+    """估算消息列表的 token 数 (每条消息额外计 4 个格式 token)"""
+    return sum(estimate_tokens(m.get("content", "")) + 4 for m in messages)
+
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    """按 token 预算截断文本"""
+    if estimate_tokens(text) <= budget:
+        return text
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if estimate_tokens(text[:mid]) + 1 <= budget:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo] + "…"
+
+
+def format_turn(segment: TranscriptSegment) -> str:
+    """格式化单轮对话"""
+    speaker_label = "👤 你" if segment.speaker == "user" else "🧑 对方"
+    return f"{speaker_label}: {segment.text}"
+
+
+def fit_turns(
+    segments: Sequence[TranscriptSegment],
+    budget: int,
+    summary_ratio: float = 0.2
+) -> str:
+    """
+    在 token 预算内组装对话上下文
+
+    从最新一轮往前保留完整对话；放不下的更早轮次压缩成一行摘要
+    (每轮只保留开头几个字)，摘要最多占预算的 summary_ratio。
+    """
+    if not segments:
+        return ""
+
+    summary_budget = int(budget * summary_ratio)
+    kept: List[str] = []
+    used = 0
+
+    for i in range(len(segments) - 1, -1, -1):
+        line = format_turn(segments[i])
+        # 更早还有轮次时，需要为摘要预留空间
+        limit = budget if i == 0 else budget - summary_budget
+        if not kept:
+            # 最新一轮总是保留，过长时截断
+            line = truncate_to_tokens(line, limit)
+        cost = estimate_tokens(line) + 1
+        if kept and used + cost > limit:
+            break
+        kept.append(line)
+        used += cost
+
+    lines = list(reversed(kept))
+    dropped = segments[:len(segments) - len(kept)]
+    if dropped:
+        heads = "；".join(seg.text[:8] for seg in dropped)
+        summary = truncate_to_tokens(
+            f"（更早的 {len(dropped)} 轮对话摘要：{heads}）",
+            max(budget - used, 0)
+        )
+        if summary:
+            lines.insert(0, summary)
+
+    return "\n".join(lines)
+
+
+def format_quotes(quotes: Sequence[Dict], budget: int) -> str:
+    """在 token 预算内列出参考金句，相关度高的排在前面"""
+    lines = []
+    used = 0
+    for q in quotes:
+        line = f"- {q['quote']} (出自《{q['source']}》，适用场景：{q['context']})"
+        cost = estimate_tokens(line) + 1
+        if used + cost > budget:
+            break
+        lines.append(line)
+        used += cost
+    return "\n".join(lines)
+
+
+def build_suggestion_messages(
+    user_text: str,
+    related_quotes: Sequence[Dict],
+    parent_content: Optional[str] = None,
+    text_budget: int = 400,
+    quotes_budget: int = 300
+) -> List[Dict]:
+    """构建 /api/suggestion 的消息列表 (普通建议或思维延展)"""
+    quotes_context = format_quotes(related_quotes, quotes_budget)
+    user_text = truncate_to_tokens(user_text, text_budget)
+
+    if parent_content:
+        content = (
+            f"当前思维节点：\"{truncate_to_tokens(parent_content, text_budget)}\"\n"
+            f"用户补充/上下文：\"{user_text}\"\n\n"
+            f"金句灵感：\n{quotes_context}"
+        )
+        system = EXPAND_SYSTEM_PROMPT
+    else:
+        content = (
+            f"用户正在说：\"{user_text}\"\n\n"
+            f"相关金句：\n{quotes_context}"
+        )
+        system = SUGGESTION_SYSTEM_PROMPT
+
+    return [
+        {"role": "system", "content": system},
+        {"role": "user", "content": content}
+    ]
+
+
+def build_assistant_messages(
+    segments: Sequence[TranscriptSegment],
+    latest_text: str,
+    context_budget: int = 600,
+    text_budget: int = 200
+) -> List[Dict]:
+    """构建实时对话建议的消息列表"""
+    context_text = fit_turns(segments, context_budget)
+    latest_text = truncate_to_tokens(latest_text, text_budget)
+
+    return [
+        {"role": "system", "content": ASSISTANT_SYSTEM_PROMPT},
+        {"role": "user", "content": f"当前对话上下文：\n{context_text}\n\n对方最新说的话：\"{latest_text}\""}
+    ]
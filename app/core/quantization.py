@@ -0,0 +1,133 @@
+"""
+向量量化 - int8 标量量化 / 二值 (符号位) 编码，用压缩码做粗排，再用原始向量精排
+"""
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+
+# 粗排时每次处理的行数，控制临时矩阵的内存占用
+SCAN_BLOCK_ROWS = 65536
+
+# 8 位整数中 1 的个数，用于计算汉明距离
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+class Int8Quantizer:
+    """
+    int8 标量量化：每个维度按该维绝对值最大值缩放到 [-127, 127]
+
+    内存为 float32 的 1/4；粗排分数为 (q * scale) · code，与内积同序近似
+    """
+
+    name = "int8"
+
+    def __init__(self, scale: Optional[np.ndarray] = None):
+        self.scale = scale
+
+    def fit(self, vectors: np.ndarray):
+        """按维度统计缩放系数 (分块读取，适用于 mmap 矩阵)"""
+        max_abs = np.zeros(vectors.shape[1], dtype=np.float32)
+        for start in range(0, len(vectors), SCAN_BLOCK_ROWS):
+            block = np.asarray(vectors[start:start + SCAN_BLOCK_ROWS], dtype=np.float32)
+            np.maximum(max_abs, np.abs(block).max(axis=0), out=max_abs)
+        self.scale = np.maximum(max_abs, 1e-12) / 127.0
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        codes = np.empty(vectors.shape, dtype=np.int8)
+        for start in range(0, len(vectors), SCAN_BLOCK_ROWS):
+            block = np.asarray(vectors[start:start + SCAN_BLOCK_ROWS], dtype=np.float32)
+            codes[start:start + len(block)] = np.clip(np.rint(block / self.scale), -127, 127)
+        return codes
+
+    def scores(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """近似内积，越大越相似"""
+        scaled = queries * self.scale
+        out = np.empty((len(queries), len(codes)), dtype=np.float32)
+        for start in range(0, len(codes), SCAN_BLOCK_ROWS):
+            block = codes[start:start + SCAN_BLOCK_ROWS].astype(np.float32)
+            out[:, start:start + len(block)] = scaled @ block.T
+        return out
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {"scale": self.scale}
+
+
+class BinaryQuantizer:
+    """
+    二值量化：每个维度只保留符号位，按位打包
+
+    内存为 float32 的 1/32；粗排分数为负汉明距离
+    """
+
+    name = "binary"
+
+    def __init__(self, **_):
+        pass
+
+    def fit(self, vectors: np.ndarray):
+        pass
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        n_bytes = (vectors.shape[1] + 7) // 8
+        codes = np.empty((len(vectors), n_bytes), dtype=np.uint8)
+        for start in range(0, len(vectors), SCAN_BLOCK_ROWS):
+            block = np.asarray(vectors[start:start + SCAN_BLOCK_ROWS])
+            codes[start:start + len(block)] = np.packbits(block > 0, axis=1)
+        return codes
+
+    def scores(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """负汉明距离，越大越相似"""
+        packed = np.packbits(queries > 0, axis=1)
+        out = np.empty((len(queries), len(codes)), dtype=np.float32)
+        block_rows = max(SCAN_BLOCK_ROWS // 16, 1)
+        for start in range(0, len(codes), block_rows):
+            block = codes[start:start + block_rows]
+            distance = _POPCOUNT[packed[:, None, :] ^ block[None, :, :]].sum(axis=2, dtype=np.int32)
+            out[:, start:start + len(block)] = -distance
+        return out
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {}
+
+
+QUANTIZERS = {
+    Int8Quantizer.name: Int8Quantizer,
+    BinaryQuantizer.name: BinaryQuantizer,
+}
+
+
+class QuantizedCodes:
+    """量化器 + 全部向量的压缩码 (常驻内存)"""
+
+    def __init__(self, quantizer, codes: np.ndarray):
+        self.quantizer = quantizer
+        self.codes = codes
+
+    @classmethod
+    def build(cls, name: str, vectors: np.ndarray) -> "QuantizedCodes":
+        """对整个矩阵拟合量化参数并编码"""
+        if name not in QUANTIZERS:
+            raise ValueError(f"不支持的量化方式: {name}，可选: {', '.join(QUANTIZERS)}")
+        quantizer = QUANTIZERS[name]()
+        quantizer.fit(vectors)
+        return cls(quantizer, quantizer.encode(vectors))
+
+    def save(self, path: Path):
+        with open(path, "wb") as f:
+            np.savez(f, codes=self.codes, **self.quantizer.state())
+
+    @classmethod
+    def load(cls, name: str, path: Path) -> "QuantizedCodes":
+        with np.load(path) as data:
+            state = {key: data[key] for key in data.files if key != "codes"}
+            return cls(QUANTIZERS[name](**state), data["codes"])
+
+    def scores(self, queries: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """粗排分数；rows 不为空时只计算这些行"""
+        codes = self.codes if rows is None else self.codes[rows]
+        return self.quantizer.scores(queries, codes)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.codes.nbytes)
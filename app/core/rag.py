@@ -1,9 +1,28 @@
+import asyncio
+import hashlib
 import chromadb
+import numpy as np
 from chromadb.config import Settings
 from chromadb.utils import embedding_functions
 import json
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
+
+from app.config import settings
+from app.core.artifact import ArtifactError, iter_artifact, read_manifest
+from app.core.cache import EmbeddingLRUCache
+from app.core.filters import Filters, filters_key, normalize_filters, to_chroma_where
+from app.core.lexical import LexicalIndex, reciprocal_rank_fusion
+from app.core.registry import service_registry
+from app.core.singleflight import SingleFlight, normalize_text
+from app.core.vector_index import NumpyVectorIndex
+
+# 旧版 init_db 按位置生成的 id
+LEGACY_ID_PATTERN = re.compile(r"quote_\d+")
+
 
 class RAGService:
     """RAG 服务类 - 负责向量检索"""
@@ -19,6 +38,13 @@ class RAGService:
         # 使用默认的 embedding 函数（sentence-transformers）
         # 这是一个本地模型，不需要 API
         default_ef = embedding_functions.DefaultEmbeddingFunction()
+        self.embedding_function = default_ef
+        
+        # 规范化查询文本 → 向量的 LRU 缓存，重复查询不再跑模型
+        self.query_embeddings = EmbeddingLRUCache(
+            default_ef,
+            max_entries=settings.RAG_EMBEDDING_CACHE_SIZE
+        )
         
         # 获取或创建集合
         try:
@@ -34,51 +60,441 @@ class RAGService:
                 metadata={"description": "ChatBuff 金句库"}
             )
             print(f"✨ 创建新集合: {self.collection_name}")
+        
+        # 可选的进程内 NumPy 索引，启用后检索与写入都走该索引
+        self.backend = settings.RAG_BACKEND
+        self.index = None
+        if self.backend == "numpy":
+            self.index = NumpyVectorIndex(
+                settings.RAG_NUMPY_INDEX_PATH,
+                dtype=settings.RAG_NUMPY_DTYPE,
+                quantization=settings.RAG_NUMPY_QUANTIZATION,
+                rerank_factor=settings.RAG_RERANK_FACTOR
+            )
+            if self.index.count() == 0 and self.collection.count() > 0:
+                self._import_from_chroma()
+            print(f"✅ NumPy 向量索引: {self.index.count()} 条")
+        elif self.backend != "chroma":
+            raise ValueError(f"未知的 RAG_BACKEND: {self.backend}")
+        
+        # 词法倒排索引，创建完向量库后从已有数据构建
+        self.lexical = None
+        
+        # 预计算向量产物：向量库条数与产物不一致时批量导入，无需在本机计算 embedding
+        if settings.RAG_EMBEDDINGS_ARTIFACT:
+            try:
+                self.load_artifact(settings.RAG_EMBEDDINGS_ARTIFACT)
+            except ArtifactError as e:
+                print(f"⚠️ 向量产物不可用: {e}")
+        
+        if settings.RAG_HYBRID_ENABLED:
+            self.lexical = LexicalIndex()
+            self._build_lexical()
+        self.hybrid_candidates = settings.RAG_HYBRID_CANDIDATES
+        self.rrf_k = settings.RAG_RRF_K
+        self.fastpath_depth = settings.RAG_LEXICAL_FASTPATH_DEPTH
+        self._fastpath_hits = 0
+        
+        # 合并并发的相同检索
+        self._flights = SingleFlight()
+        
+        # embedding 与向量查询在专用线程池中执行，并发查询合并成一次批量查询
+        self.workers = settings.RAG_WORKERS
+        self.batch_wait = settings.RAG_BATCH_WAIT_MS / 1000.0
+        self.max_batch_size = settings.RAG_MAX_BATCH_SIZE
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="rag")
+        self._pending: List[Tuple[str, int, Optional[Filters], asyncio.Future]] = []
+        self._flush_handle = None
+        
+        # 队列统计
+        self._queued_batches = 0   # 已提交线程池但尚未开始执行的批次
+        self._running_batches = 0
+        self._batches = 0
+        self._batched_queries = 0
+    
+    @staticmethod
+    def build_document(quote: Dict) -> str:
+        """将金句的各字段组合成用于 embedding 的文档"""
+        return f"{quote['quote']} {quote['context']} {quote['category']}"
+    
+    @staticmethod
+    def quote_id(quote: Dict) -> str:
+        """基于内容生成稳定的 id，重复导入同一条金句会覆盖而不是重复"""
+        key = f"{quote['quote']}\x1f{quote.get('source', '')}\x1f{quote.get('author', '')}"
+        return "quote_" + hashlib.sha1(key.encode("utf-8")).hexdigest()[:20]
+    
+    @staticmethod
+    def is_legacy_id(id_: str) -> bool:
+        """旧版按位置编号的 id (quote_0, quote_1, ...)，与内容哈希 id 不兼容"""
+        return LEGACY_ID_PATTERN.fullmatch(id_) is not None
+    
+    def migrate_legacy_ids(self) -> int:
+        """
+        把旧版位置编号 id 的金句改为内容哈希 id，沿用已有向量，无需重新计算 embedding
+        
+        迁移后重复导入同一批金句会覆盖而不是重复写入
+        
+        Returns:
+            迁移的条数
+        """
+        if self.index is not None:
+            ids, vectors, metadatas = [], [], []
+            for batch_ids, batch_vectors, batch_metadatas in self.index.iter_batches():
+                ids.extend(batch_ids)
+                vectors.append(np.asarray(batch_vectors, dtype=np.float32))
+                metadatas.extend(batch_metadatas)
+            migrated = sum(1 for id_ in ids if self.is_legacy_id(id_))
+            if not migrated:
+                return 0
+            new_ids = [self.quote_id(m) if self.is_legacy_id(id_) else id_ for id_, m in zip(ids, metadatas)]
+            self.index.clear()
+            self.index.upsert(new_ids, np.concatenate(vectors), metadatas)
+        else:
+            legacy = [id_ for id_ in self.collection.get(include=[])["ids"] if self.is_legacy_id(id_)]
+            if not legacy:
+                return 0
+            data = self.collection.get(ids=legacy, include=["embeddings", "metadatas", "documents"])
+            migrated = len(data["ids"])
+            self.collection.upsert(
+                ids=[self.quote_id(m) for m in data["metadatas"]],
+                embeddings=data["embeddings"],
+                documents=data["documents"],
+                metadatas=data["metadatas"]
+            )
+            self.collection.delete(ids=data["ids"])
+        
+        if self.lexical is not None:
+            self._build_lexical()
+        return migrated
+    
+    def prepare_quotes(self, quotes: List[Dict]) -> Tuple[List[str], List[str], List[Dict]]:
+        """
+        生成 (ids, documents, metadatas)，同一批内重复的金句只保留最后一条
+        """
+        unique: Dict[str, Dict] = {}
+        for quote in quotes:
+            unique[self.quote_id(quote)] = quote
+        ids = list(unique)
+        metadatas = list(unique.values())
+        documents = [self.build_document(quote) for quote in metadatas]
+        return ids, documents, metadatas
+    
+    def upsert_embeddings(
+        self,
+        ids: List[str],
+        documents: List[str],
+        embeddings: List[List[float]],
+        metadatas: List[Dict]
+    ):
+        """写入已算好 embedding 的金句 (按 id 插入或覆盖)"""
+        if self.index is not None:
+            self.index.upsert(ids, embeddings, metadatas)
+        else:
+            self.collection.upsert(
+                ids=ids,
+                documents=documents,
+                embeddings=embeddings,
+                metadatas=metadatas
+            )
+        if self.lexical is not None:
+            self.lexical.add(ids, metadatas)
     
     def add_quotes(self, quotes: List[Dict]):
-        """批量添加金句到向量库"""
-        documents = []
-        metadatas = []
-        ids = []
-        
-        for i, quote in enumerate(quotes):
-            # 将所有信息组合成文档
-            doc = f"{quote['quote']} {quote['context']} {quote['category']}"
-            documents.append(doc)
-            metadatas.append(quote)
-            ids.append(f"quote_{i}")
-        
-        # ChromaDB 会自动生成 embedding（使用默认的 embedding function）
-        self.collection.add(
-            documents=documents,
-            metadatas=metadatas,
-            ids=ids
+        """批量添加金句到向量库 (幂等：按内容 id 插入或覆盖)"""
+        ids, documents, metadatas = self.prepare_quotes(quotes)
+        if not ids:
+            return
+        embeddings = self.embedding_function(documents)
+        self.upsert_embeddings(ids, documents, embeddings, metadatas)
+        
+        print(f"✅ 成功写入 {len(ids)} 条金句到向量库")
+    
+    def _import_from_chroma(self):
+        """NumPy 索引为空时，从已有的 ChromaDB 集合导入向量 (无需重新计算 embedding)"""
+        data = self.collection.get(include=["embeddings", "metadatas"])
+        if data["ids"]:
+            self.index.upsert(data["ids"], data["embeddings"], data["metadatas"])
+            print(f"📦 从 ChromaDB 导入 {len(data['ids'])} 条向量到 NumPy 索引")
+    
+    def _iter_metadatas(self, batch_size: int = 4096):
+        """逐批读出向量库中的 (ids, metadatas)"""
+        if self.index is not None:
+            for ids, _, metadatas in self.index.iter_batches(batch_size):
+                yield ids, metadatas
+            return
+        
+        for offset in range(0, self.collection.count(), batch_size):
+            data = self.collection.get(include=["metadatas"], limit=batch_size, offset=offset)
+            if not data["ids"]:
+                break
+            yield data["ids"], data["metadatas"]
+    
+    def _build_lexical(self):
+        """从向量库全量重建词法索引"""
+        started = time.perf_counter()
+        self.lexical.clear()
+        for ids, metadatas in self._iter_metadatas():
+            self.lexical.add(ids, metadatas)
+        print(f"✅ 词法索引: {self.lexical.count()} 条 ({time.perf_counter() - started:.2f}s)")
+    
+    @property
+    def embedding_model(self) -> str:
+        """当前 embedding 模型名，用于校验预计算向量是否兼容"""
+        return getattr(self.embedding_function, "MODEL_NAME", type(self.embedding_function).__name__)
+    
+    def iter_embeddings(self, batch_size: int = 4096):
+        """逐批读出向量库中的 (ids, embeddings, metadatas)，用于导出产物"""
+        if self.index is not None:
+            yield from self.index.iter_batches(batch_size)
+            return
+        
+        for offset in range(0, self.collection.count(), batch_size):
+            data = self.collection.get(
+                include=["embeddings", "metadatas"],
+                limit=batch_size,
+                offset=offset
+            )
+            if not data["ids"]:
+                break
+            yield data["ids"], data["embeddings"], data["metadatas"]
+    
+    def load_artifact(self, path: str, force: bool = False) -> int:
+        """
+        从预计算向量产物批量导入
+        
+        Args:
+            path: 产物目录
+            force: 即使条数一致也重新导入
+        
+        Returns:
+            导入的条数，无需导入时为 0
+        """
+        manifest = read_manifest(path)
+        if manifest["model"] != self.embedding_model:
+            raise ArtifactError(
+                f"产物的 embedding 模型 {manifest['model']} 与当前模型 {self.embedding_model} 不一致"
+            )
+        if not force and self.get_count() == manifest["count"]:
+            return 0
+        
+        started = time.perf_counter()
+        if self.index is not None:
+            # NumPy 索引每次写入都会重写文件，合并成一次写入
+            ids, embeddings, metadatas = [], [], []
+            for batch_ids, batch_embeddings, batch_metadatas in iter_artifact(path):
+                ids.extend(batch_ids)
+                embeddings.append(batch_embeddings)
+                metadatas.extend(batch_metadatas)
+            self.index.upsert(ids, np.concatenate(embeddings), metadatas)
+        else:
+            max_batch = getattr(self.client, "max_batch_size", 5000)
+            for ids, embeddings, metadatas in iter_artifact(path, batch_size=max_batch):
+                self.collection.upsert(
+                    ids=ids,
+                    embeddings=embeddings.tolist(),
+                    documents=[self.build_document(m) for m in metadatas],
+                    metadatas=metadatas
+                )
+        
+        if self.lexical is not None:
+            self._build_lexical()
+        print(f"📦 已从向量产物导入 {manifest['count']} 条金句 ({time.perf_counter() - started:.1f}s)")
+        return manifest["count"]
+    
+    def reset(self):
+        """清空向量库"""
+        if self.lexical is not None:
+            self.lexical.clear()
+        if self.index is not None:
+            self.index.clear()
+            return
+        self.client.delete_collection(self.collection_name)
+        self.collection = self.client.create_collection(
+            name=self.collection_name,
+            embedding_function=self.embedding_function,
+            metadata={"description": "ChatBuff 金句库"}
         )
+    
+    async def search(self, query: str, top_k: int = 3, filters: Optional[Dict] = None) -> List[Dict]:
+        """
+        异步检索与查询最相似的金句
+        
+        在专用线程池中执行，不阻塞事件循环；相同的并发查询只执行一次，
+        batch_wait 内到达的不同查询合并为一次批量查询；
+        检索队列积压时直接返回词法检索结果，不再排队等待 embedding
+        
+        Args:
+            filters: 元数据过滤，如 {"category": ["幽默"], "type": "电影台词"}；
+                同一字段内任一值匹配，不同字段需同时满足
+        """
+        filters = normalize_filters(filters)
+        if self._saturated():
+            hits = self.lexical.search(query, top_k, filters)
+            if hits:
+                self._fastpath_hits += 1
+                return [metadata for metadata, _ in hits]
+        
+        key = (normalize_text(query), top_k, filters_key(filters))
+        try:
+            return await self._flights.do(key, lambda: self._submit(query, top_k, filters))
+        except Exception as e:
+            print(f"❌ 检索失败: {e}")
+            return []
+    
+    def _queue_depth(self) -> int:
+        """等待中的查询与尚未开始执行的批次数"""
+        return len(self._pending) + self._queued_batches
+    
+    def _saturated(self) -> bool:
+        """检索线程池是否积压到需要走词法快速路径"""
+        return (
+            self.lexical is not None
+            and self.fastpath_depth > 0
+            and self._queue_depth() >= self.fastpath_depth
+        )
+    
+    def _submit(self, query: str, top_k: int, filters: Optional[Filters]) -> asyncio.Future:
+        """把查询加入待合并队列"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((query, top_k, filters, future))
+        
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.batch_wait, self._flush)
+        return future
+    
+    def _flush(self):
+        """把待合并的查询作为一批交给线程池"""
+        if self._flush_handle:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        pending, self._pending = self._pending, []
+        
+        # 过滤条件相同的查询才能合并成一次批量查询
+        batches: Dict[Tuple, List] = {}
+        for item in pending:
+            batches.setdefault(filters_key(item[2]), []).append(item)
+        for batch in batches.values():
+            asyncio.ensure_future(self._run_batch(batch))
+    
+    async def _run_batch(self, batch: List[Tuple[str, int, Optional[Filters], asyncio.Future]]):
+        """执行一批合并的查询，并把结果分发给各调用方"""
+        queries = [query for query, _, _, _ in batch]
+        n_results = max(top_k for _, top_k, _, _ in batch)
+        filters = batch[0][2]
+        
+        try:
+            results = await self._run_in_pool(queries, n_results, filters)
+        except Exception as e:
+            for _, _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
         
-        print(f"✅ 成功添加 {len(quotes)} 条金句到向量库")
+        for (_, top_k, _, future), metadatas in zip(batch, results):
+            if not future.done():
+                future.set_result(metadatas[:top_k])
     
-    def search(self, query: str, top_k: int = 3) -> List[Dict]:
+    async def search_many(
+        self,
+        queries: List[str],
+        top_k: int = 3,
+        filters: Optional[Dict] = None
+    ) -> List[List[Dict]]:
+        """
+        批量检索：在检索线程池中一次向量化完成全部查询的 embedding 和查询
+        
+        Returns:
+            与 queries 一一对应的相关金句列表
         """
-        检索与查询最相似的金句
+        if not queries:
+            return []
+        return await self._run_in_pool(queries, top_k, normalize_filters(filters))
+    
+    async def _run_in_pool(
+        self,
+        queries: List[str],
+        top_k: int,
+        filters: Optional[Filters] = None
+    ) -> List[List[Dict]]:
+        """在检索线程池中执行一批查询，并维护队列统计"""
+        loop = asyncio.get_running_loop()
+        self._queued_batches += 1
+        
+        def run():
+            self._queued_batches -= 1
+            self._running_batches += 1
+            try:
+                return self._query_batch(queries, top_k, filters)
+            finally:
+                self._running_batches -= 1
+        
+        results = await loop.run_in_executor(self._executor, run)
+        self._batches += 1
+        self._batched_queries += len(queries)
+        return results
+    
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """将查询文本规范化后转为向量，优先使用缓存 (同步)"""
+        return self.query_embeddings([normalize_text(q) for q in queries])
+    
+    def _query_batch(
+        self,
+        queries: List[str],
+        top_k: int,
+        filters: Optional[Filters] = None
+    ) -> List[List[Dict]]:
+        """一次批量查询多条文本 (同步)，启用混合检索时与词法结果融合"""
+        n_results = top_k * self.hybrid_candidates if self.lexical is not None else top_k
+        vector_results = self._vector_query(queries, n_results, filters)
+        if self.lexical is None:
+            return vector_results
+        
+        fused = []
+        for query, vector_hits in zip(queries, vector_results):
+            lexical_hits = [metadata for metadata, _ in self.lexical.search(query, n_results, filters)]
+            ranked = reciprocal_rank_fusion(
+                [vector_hits, lexical_hits],
+                key=self.quote_id,
+                k=self.rrf_k
+            )
+            fused.append(ranked[:top_k])
+        return fused
+    
+    def _vector_query(
+        self,
+        queries: List[str],
+        top_k: int,
+        filters: Optional[Filters] = None
+    ) -> List[List[Dict]]:
+        """纯向量检索 (同步)；NumPy 索引按元数据倒排过滤，ChromaDB 使用 where 条件"""
+        if self.index is not None:
+            return self.index.query(self.embed_queries(queries), top_k, filters)
+        
+        results = self.collection.query(
+            query_embeddings=self.embed_queries(queries),
+            n_results=top_k,
+            where=to_chroma_where(filters)
+        )
+        metadatas = results['metadatas'] or []
+        return [metadatas[i] if i < len(metadatas) else [] for i in range(len(queries))]
+    
+    def search_sync(self, query: str, top_k: int = 3, filters: Optional[Dict] = None) -> List[Dict]:
+        """
+        检索与查询最相似的金句 (同步)
         
         Args:
             query: 用户的输入文本
             top_k: 返回最相似的前 k 条
+            filters: 元数据过滤条件，同 search()
         
         Returns:
             相关金句列表
         """
         try:
-            # ChromaDB 会自动将查询文本转为向量
-            results = self.collection.query(
-                query_texts=[query],
-                n_results=top_k
-            )
-            
-            # 提取 metadata
-            if results['metadatas']:
-                return results['metadatas'][0]
-            return []
+            return self._query_batch([query], top_k, normalize_filters(filters))[0]
             
         except Exception as e:
             print(f"❌ 检索失败: {e}")
@@ -86,7 +502,35 @@ class RAGService:
     
     def get_count(self) -> int:
         """获取向量库中的金句数量"""
+        if self.index is not None:
+            return self.index.count()
         return self.collection.count()
+    
+    def get_stats(self) -> Dict:
+        """获取检索线程池与批处理统计"""
+        return {
+            "backend": self.backend,
+            "index": self.index.get_stats() if self.index is not None else None,
+            "workers": self.workers,
+            "pending_queries": len(self._pending),
+            "queued_batches": self._queued_batches,
+            "running_batches": self._running_batches,
+            "queue_depth": self._queue_depth(),
+            "lexical": self.lexical.get_stats() if self.lexical is not None else None,
+            "lexical_fastpath_hits": self._fastpath_hits,
+            "batches": self._batches,
+            "avg_batch_size": round(self._batched_queries / self._batches, 2) if self._batches else 0.0,
+            "embedding_cache": self.query_embeddings.get_stats(),
+            "single_flight": self._flights.get_stats()
+        }
+    
+    def close(self):
+        """关闭检索线程池"""
+        self._executor.shutdown(wait=False)
 
-# 单例模式
-rag_service = RAGService()
+# 单例模式：首次使用时创建，预热时跑一次 embedding 以加载 ONNX 模型
+rag_service = service_registry.register(
+    "rag",
+    RAGService,
+    warmup=lambda service: service.embed_queries(["预热"])
+)
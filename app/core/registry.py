@@ -0,0 +1,186 @@
+"""
+服务注册表 - 服务在首次使用时创建，或由 lifespan 在后台预热
+
+事件循环中访问尚未创建的服务不会同步等待 (创建可能需要数秒并持有锁)，
+而是转到后台创建并抛出 ServiceNotReadyError，由接口返回 503
+"""
+import asyncio
+import inspect
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+
+class ServiceNotReadyError(Exception):
+    """服务仍在后台创建中，稍后重试"""
+
+
+def _on_event_loop() -> bool:
+    """当前线程是否正在运行事件循环"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+@dataclass
+class ServiceState:
+    """单个服务的预热状态"""
+    name: str
+    factory: Callable[[], Any]
+    warmup: Optional[Callable[[Any], Any]] = None
+    instance: Any = None
+    state: str = "pending"          # pending / loading / warming / ready / failed
+    error: Optional[str] = None
+    load_seconds: Optional[float] = None
+    warmup_seconds: Optional[float] = None
+    task: Optional[asyncio.Future] = None    # 后台创建/预热任务
+
+    def to_dict(self) -> Dict:
+        return {
+            "state": self.state,
+            "error": self.error,
+            "load_seconds": round(self.load_seconds, 3) if self.load_seconds is not None else None,
+            "warmup_seconds": round(self.warmup_seconds, 3) if self.warmup_seconds is not None else None
+        }
+
+
+class LazyService:
+    """
+    服务代理：访问任意属性时才创建真实实例
+
+    模块级单例保持原有用法 (如 rag_service.search(...))，import 时不再加载模型
+    """
+
+    def __init__(self, registry: "ServiceRegistry", name: str):
+        object.__setattr__(self, "_registry", registry)
+        object.__setattr__(self, "_name", name)
+
+    def __getattr__(self, attr: str):
+        return getattr(self._registry.get(self._name), attr)
+
+    def __setattr__(self, attr: str, value: Any):
+        setattr(self._registry.get(self._name), attr, value)
+
+    def __repr__(self) -> str:
+        return f"<LazyService {self._name}: {self._registry.state(self._name)}>"
+
+
+class ServiceRegistry:
+    """懒加载服务注册表"""
+
+    def __init__(self):
+        self._services: Dict[str, ServiceState] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+
+    def register(
+        self,
+        name: str,
+        factory: Callable[[], Any],
+        warmup: Optional[Callable[[Any], Any]] = None
+    ) -> LazyService:
+        """
+        注册服务
+
+        Args:
+            name: 服务名
+            factory: 创建实例的函数 (可能较慢，预热时在线程中执行)
+            warmup: 实例创建后的预热函数 (同步或异步)，如加载模型、跑一次推理
+
+        Returns:
+            服务代理
+        """
+        self._services[name] = ServiceState(name=name, factory=factory, warmup=warmup)
+        self._locks[name] = threading.Lock()
+        return LazyService(self, name)
+
+    def get(self, name: str) -> Any:
+        """
+        获取服务实例，未创建时同步创建 (不执行预热)
+
+        在事件循环中调用时不阻塞：改为启动后台创建并抛出 ServiceNotReadyError
+        """
+        service = self._services[name]
+        if service.instance is not None:
+            return service.instance
+
+        if _on_event_loop():
+            self._start(service)
+            raise ServiceNotReadyError(f"{name} 服务正在加载，请稍后重试")
+
+        with self._locks[name]:
+            if service.instance is None:
+                service.state = "loading"
+                started = time.perf_counter()
+                try:
+                    instance = service.factory()
+                except Exception as e:
+                    service.state = "failed"
+                    service.error = str(e)
+                    raise
+                service.load_seconds = time.perf_counter() - started
+                service.instance = instance
+                service.state = "warming" if service.warmup else "ready"
+        return service.instance
+
+    def state(self, name: str) -> str:
+        return self._services[name].state
+
+    def is_ready(self, name: Optional[str] = None) -> bool:
+        """指定服务 (或全部服务) 是否已就绪"""
+        if name is not None:
+            return self._services[name].state == "ready"
+        return all(s.state == "ready" for s in self._services.values())
+
+    async def warm_up(self):
+        """后台并发预热所有服务，单个服务失败不影响其他服务"""
+        await asyncio.gather(*[self._start(s) for s in self._services.values()])
+
+    def _start(self, service: ServiceState) -> asyncio.Future:
+        """启动服务的后台创建与预热，已在进行中时复用同一任务"""
+        if service.task is None or service.task.done():
+            service.task = asyncio.ensure_future(self._warm(service))
+        return service.task
+
+    async def _warm(self, service: ServiceState):
+        try:
+            instance = await asyncio.to_thread(self.get, service.name)
+            if service.warmup and service.state == "warming":
+                started = time.perf_counter()
+                if inspect.iscoroutinefunction(service.warmup):
+                    result = service.warmup(instance)
+                else:
+                    result = await asyncio.to_thread(service.warmup, instance)
+                if inspect.isawaitable(result):
+                    await result
+                service.warmup_seconds = time.perf_counter() - started
+            service.state = "ready"
+            print(f"✅ {service.name} 服务就绪 "
+                  f"(创建 {service.load_seconds or 0:.2f}s, 预热 {service.warmup_seconds or 0:.2f}s)")
+        except Exception as e:
+            service.state = "failed"
+            service.error = str(e)
+            print(f"❌ {service.name} 服务预热失败: {e}")
+
+    async def close(self):
+        """关闭已创建的服务"""
+        for service in self._services.values():
+            close = getattr(service.instance, "close", None)
+            if close is None:
+                continue
+            try:
+                result = close()
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                print(f"⚠️ 关闭 {service.name} 服务失败: {e}")
+
+    def get_status(self) -> Dict:
+        """各服务的预热状态"""
+        return {name: s.to_dict() for name, s in self._services.items()}
+
+
+# 单例模式
+service_registry = ServiceRegistry()
@@ -0,0 +1,233 @@
+"""
+LLM 提供方保护 - AIMD 自适应并发限制 + 熔断器
+"""
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+
+class CircuitOpenError(Exception):
+    """熔断器打开，调用被快速拒绝"""
+
+
+class ConcurrencyLimitTimeout(Exception):
+    """等待并发名额超时"""
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD 自适应并发限制
+
+    - 成功且延迟正常：limit += 1 / limit (每轮约加 1)
+    - 出错或延迟超过基线的 tolerance 倍：limit *= backoff (乘性减小)
+
+    基线延迟取成功调用耗时的慢速 EWMA；两次减小之间至少间隔一个基线延迟，
+    避免同一波拥塞把限制连续砍到底。
+    """
+
+    def __init__(
+        self,
+        initial_limit: float = 8,
+        min_limit: float = 1,
+        max_limit: float = 64,
+        backoff: float = 0.7,
+        tolerance: float = 2.0,
+        queue_timeout: Optional[float] = None
+    ):
+        """
+        Args:
+            initial_limit: 初始并发上限
+            min_limit / max_limit: 并发上限的范围
+            backoff: 拥塞时的乘性减小系数
+            tolerance: 延迟超过基线多少倍视为拥塞
+            queue_timeout: 等待并发名额的最长时间（秒），None 表示一直等待
+        """
+        self.limit = float(initial_limit)
+        self.min_limit = float(min_limit)
+        self.max_limit = float(max_limit)
+        self.backoff = backoff
+        self.tolerance = tolerance
+        self.queue_timeout = queue_timeout
+
+        self.in_flight = 0
+        self.waiting = 0
+        self.baseline: Optional[float] = None
+        self._last_decrease = 0.0
+        self._condition = asyncio.Condition()
+
+        # 统计
+        self.rejected = 0
+
+    @asynccontextmanager
+    async def acquire(self):
+        """获取一个并发名额"""
+        async with self._condition:
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(
+                    self._condition.wait_for(lambda: self.in_flight < int(self.limit)),
+                    timeout=self.queue_timeout
+                )
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise ConcurrencyLimitTimeout(f"等待 LLM 并发名额超时 (limit={int(self.limit)})")
+            finally:
+                self.waiting -= 1
+            self.in_flight += 1
+
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self.in_flight -= 1
+                self._condition.notify_all()
+
+    def saturated(self) -> bool:
+        """并发名额已用满或有请求在排队"""
+        return self.waiting > 0 or self.in_flight >= int(self.limit)
+
+    def on_success(self, latency: float):
+        """记录一次成功调用"""
+        if self.baseline is None:
+            self.baseline = latency
+        elif latency <= self.baseline * self.tolerance:
+            self.baseline = 0.95 * self.baseline + 0.05 * latency
+
+        if latency > self.baseline * self.tolerance:
+            self._decrease()
+        else:
+            self.limit = min(self.limit + 1.0 / self.limit, self.max_limit)
+
+    def on_failure(self):
+        """记录一次失败调用"""
+        self._decrease()
+
+    def _decrease(self):
+        now = time.monotonic()
+        if self.baseline and now - self._last_decrease < self.baseline:
+            return
+        self._last_decrease = now
+        self.limit = max(self.limit * self.backoff, self.min_limit)
+
+    def get_stats(self) -> Dict:
+        """获取限流统计"""
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "baseline_latency": round(self.baseline, 3) if self.baseline else None,
+            "rejected": self.rejected
+        }
+
+
+class CircuitBreaker:
+    """
+    熔断器
+
+    closed: 正常放行；最近 window 次调用中失败 (含慢调用) 比例超过阈值时打开
+    open: 直接抛出 CircuitOpenError；reset_timeout 秒后进入 half_open
+    half_open: 只放行 half_open_max 个探测请求，全部成功则关闭，任一失败重新打开
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        error_rate: float = 0.5,
+        window: int = 20,
+        min_requests: int = 10,
+        reset_timeout: float = 15.0,
+        half_open_max: int = 2,
+        slow_call_threshold: Optional[float] = None
+    ):
+        """
+        Args:
+            error_rate: 打开熔断的失败比例
+            window: 统计最近多少次调用
+            min_requests: 窗口内至少多少次调用才做判断
+            reset_timeout: 打开后多久尝试恢复（秒）
+            half_open_max: 半开状态下的探测请求数
+            slow_call_threshold: 耗时超过该值（秒）的成功调用也计为失败
+        """
+        self.error_rate = error_rate
+        self.min_requests = min_requests
+        self.reset_timeout = reset_timeout
+        self.half_open_max = half_open_max
+        self.slow_call_threshold = slow_call_threshold
+
+        self.state = self.CLOSED
+        self._outcomes = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probes = 0
+        self._probe_successes = 0
+
+        # 统计
+        self.rejected = 0
+        self.times_opened = 0
+
+    def before_call(self):
+        """调用前检查，熔断时抛出 CircuitOpenError"""
+        if self.state == self.OPEN:
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                self.rejected += 1
+                raise CircuitOpenError("LLM 服务熔断中，快速失败")
+            self.state = self.HALF_OPEN
+            self._probes = 0
+            self._probe_successes = 0
+
+        if self.state == self.HALF_OPEN:
+            if self._probes >= self.half_open_max:
+                self.rejected += 1
+                raise CircuitOpenError("LLM 服务恢复探测中，快速失败")
+            self._probes += 1
+
+    def record(self, success: bool, latency: Optional[float] = None):
+        """记录调用结果"""
+        if success and self.slow_call_threshold and latency and latency > self.slow_call_threshold:
+            success = False
+
+        if self.state == self.OPEN:
+            # 打开前发出的请求陆续返回，不影响熔断计时
+            return
+
+        if self.state == self.HALF_OPEN:
+            if not success:
+                self._open()
+                return
+            self._probe_successes += 1
+            if self._probe_successes >= self.half_open_max:
+                self.state = self.CLOSED
+                self._outcomes.clear()
+                print("✅ LLM 熔断器已关闭，服务恢复")
+            return
+
+        self._outcomes.append(success)
+        if len(self._outcomes) >= self.min_requests:
+            failures = self._outcomes.count(False)
+            if failures / len(self._outcomes) >= self.error_rate:
+                self._open()
+
+    def on_cancel(self):
+        """调用被取消 (如对冲落败)，不计入结果，归还探测名额"""
+        if self.state == self.HALF_OPEN and self._probes > 0:
+            self._probes -= 1
+
+    def _open(self):
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self.times_opened += 1
+        print(f"⚠️ LLM 熔断器已打开，{self.reset_timeout:.0f}s 后尝试恢复")
+
+    def get_stats(self) -> Dict:
+        """获取熔断统计"""
+        return {
+            "state": self.state,
+            "window_failures": self._outcomes.count(False),
+            "window_size": len(self._outcomes),
+            "times_opened": self.times_opened,
+            "rejected": self.rejected
+        }
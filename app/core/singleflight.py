@@ -0,0 +1,81 @@
+"""
+单飞 (single-flight) 合并 - 相同请求在执行期间只发起一次，其余调用方共享结果
+"""
+import asyncio
+import re
+import unicodedata
+from typing import Any, Awaitable, Callable, Dict, TypeVar
+
+T = TypeVar("T")
+
+
+def normalize_text(text: str) -> str:
+    """规范化请求文本：去除首尾空白、合并连续空白、统一小写"""
+    return re.sub(r"\s+", " ", text or "").strip().lower()
+
+
+def request_key_text(text: str) -> str:
+    """用于合并/缓存键的文本：统一小写并去掉全部空白和标点，只差空白或标点的请求视为相同"""
+    return "".join(
+        ch for ch in (text or "").lower()
+        if not ch.isspace() and not unicodedata.category(ch).startswith("P")
+    )
+
+
+class SingleFlight:
+    """
+    合并并发的相同请求
+
+    同一 key 在执行期间的所有调用方都会等待同一个任务。
+    某个调用方被取消不会影响共享任务，其余调用方照常拿到结果；
+    最后一个调用方也被取消时，共享任务随之取消，不再空跑。
+    """
+
+    def __init__(self):
+        self._calls: Dict[Any, asyncio.Task] = {}
+        self._waiters: Dict[asyncio.Task, int] = {}
+
+        # 统计
+        self.executed = 0   # 实际执行次数
+        self.shared = 0     # 复用在途结果的次数
+        self.cancelled = 0  # 所有调用方都已离开而取消的次数
+
+    async def do(self, key: Any, fn: Callable[[], Awaitable[T]]) -> T:
+        """执行 fn，若相同 key 已在执行中则等待其结果"""
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            self.executed += 1
+            task.add_done_callback(lambda t: self._done(key, t))
+        else:
+            self.shared += 1
+
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if self._waiters.get(task) == 1 and not task.done():
+                self.cancelled += 1
+                task.cancel()
+            raise
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
+
+    def _done(self, key: Any, task: asyncio.Task):
+        """任务结束后移除记录，并标记异常已被读取"""
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()
+
+    def get_stats(self) -> Dict:
+        """获取合并统计"""
+        return {
+            "in_flight": len(self._calls),
+            "executed": self.executed,
+            "shared": self.shared,
+            "cancelled": self.cancelled
+        }
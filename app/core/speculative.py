@@ -0,0 +1,171 @@
+"""
+推测式建议生成 - 在用户输入/说话过程中基于部分文本提前检索和生成建议
+"""
+import asyncio
+from difflib import SequenceMatcher
+from typing import Optional, Tuple
+
+from app.core.assistant import ConversationAssistant, AssistantResponse
+
+# 出现这些标点时认为部分文本已经稳定，可立即开始推测
+STABLE_PUNCTUATION = "。！？!?，,；;…"
+
+
+def text_similarity(a: str, b: str) -> float:
+    """计算两段文本的相似度 (0~1)"""
+    a, b = a.strip(), b.strip()
+    if a == b:
+        return 1.0
+    if not a or not b:
+        return 0.0
+    return SequenceMatcher(None, a, b).ratio()
+
+
+class SpeculativeGenerator:
+    """
+    单个会话的推测执行器
+
+    - update(): 每收到一段流式文本调用一次；文本停止变化 stable_delay 秒
+      或以标点结尾时，开始基于该文本生成建议
+    - resolve(): 输入完成时调用；说话人与对话轮次一致、且最终文本与推测文本
+      足够相似时复用结果，否则取消推测并返回 None，由调用方正常生成
+
+    每次推测以 (说话人, 对话轮次) 为键：说话人变化或期间有其他片段写入对话历史，
+    基于旧上下文的推测都不再复用
+    """
+
+    def __init__(
+        self,
+        assistant: ConversationAssistant,
+        min_chars: int = 6,
+        stable_delay: float = 0.4,
+        match_ratio: float = 0.9
+    ):
+        """
+        Args:
+            assistant: 对话助手
+            min_chars: 开始推测所需的最少字数
+            stable_delay: 文本保持不变多久后开始推测（秒）
+            match_ratio: 复用推测结果所需的最小文本相似度
+        """
+        self.assistant = assistant
+        self.min_chars = min_chars
+        self.stable_delay = stable_delay
+        self.match_ratio = match_ratio
+
+        self._text = ""
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._task: Optional[asyncio.Task] = None
+        self._task_text = ""
+        self._task_key: Optional[Tuple[str, int]] = None
+
+        # 统计
+        self.started = 0
+        self.reused = 0
+        self.discarded = 0
+
+    def update(self, text: str, speaker: str = "other", use_cache: bool = True):
+        """收到新的部分文本"""
+        text = text.strip()
+        self._text = text
+
+        if len(text) < self.min_chars:
+            return
+
+        # 正在进行的推测仍然足够接近，继续等待其结果
+        if self._task and self._reusable(speaker, text):
+            return
+
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+
+        if text[-1] in STABLE_PUNCTUATION:
+            self._start(text, speaker, use_cache)
+        else:
+            loop = asyncio.get_running_loop()
+            self._timer = loop.call_later(
+                self.stable_delay, self._start, text, speaker, use_cache
+            )
+
+    def _start(self, text: str, speaker: str, use_cache: bool):
+        """开始一次推测生成，替换之前的推测"""
+        self._timer = None
+        if text != self._text:
+            return
+        if self._task and self._task_text == text and self._task_key == self._key(speaker):
+            return
+
+        self._cancel_task()
+        self.started += 1
+        self._task_text = text
+        self._task_key = self._key(speaker)
+        self._task = asyncio.ensure_future(
+            self.assistant.preview_text(text, speaker, use_cache=use_cache)
+        )
+
+    async def resolve(self, final_text: str, speaker: str = "other") -> Optional[AssistantResponse]:
+        """
+        输入完成，尝试复用推测结果
+
+        Returns:
+            可复用的 AssistantResponse (已写入对话历史)，无法复用时返回 None
+        """
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+
+        task = self._task
+        reusable = task is not None and self._reusable(speaker, final_text.strip())
+        self._task = None
+        self._task_text = ""
+        self._task_key = None
+        self._text = ""
+
+        if not task:
+            return None
+
+        if not reusable:
+            task.cancel()
+            self.discarded += 1
+            return None
+
+        try:
+            result = await task
+        except Exception as e:
+            print(f"推测生成失败: {e}")
+            self.discarded += 1
+            return None
+
+        # 以最终文本写入对话历史
+        result.transcript.text = final_text.strip()
+        self.assistant.commit_transcript(result.transcript)
+        self.reused += 1
+        return result
+
+    def _key(self, speaker: str) -> Tuple[str, int]:
+        """推测的键：说话人与当前对话轮次"""
+        return speaker, self.assistant.current_turn()
+
+    def _reusable(self, speaker: str, text: str) -> bool:
+        """进行中的推测是否属于同一说话人和轮次，且文本足够接近"""
+        return (
+            self._task_key == self._key(speaker)
+            and text_similarity(self._task_text, text) >= self.match_ratio
+        )
+
+    def _cancel_task(self):
+        """取消进行中的推测"""
+        if self._task and not self._task.done():
+            self._task.cancel()
+            self.discarded += 1
+        self._task = None
+        self._task_text = ""
+        self._task_key = None
+
+    def cancel(self):
+        """取消所有待执行和进行中的推测 (会话结束时调用)"""
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        self._cancel_task()
@@ -4,14 +4,51 @@
 import io
 import base64
 import asyncio
-import tempfile
-import os
-from typing import Optional, Callable, List, Dict, Any
+import threading
+import time
+from typing import Optional, Callable, List, Dict, Any, Awaitable
 from dataclasses import dataclass, field
 from datetime import datetime
-import wave
 import struct
 
+import numpy as np
+
+from app.config import settings
+from app.core.asr_pool import PRIORITY_FINAL, PRIORITY_PARTIAL, ASROverloadedError, ASRWorkerPool
+from app.core.asr_profiles import DecodingProfile, fallback_chain, get_profile, select_profile
+from app.core.registry import service_registry
+from app.core.streaming_asr import (
+    SAMPLE_RATE, StreamingTranscriber, StreamingUpdate, Word, pcm16_to_float32
+)
+
+
+def is_container_audio(audio_data: bytes) -> bool:
+    """是否为 WebM/Ogg 等容器格式 (否则视为裸 PCM 16-bit)"""
+    is_webm = audio_data[:4] == b'\x1a\x45\xdf\xa3' or b'webm' in audio_data[:50].lower()
+    is_ogg = audio_data[:4] == b'OggS'
+    return is_webm or is_ogg
+
+
+def decode_audio_bytes(audio_data: bytes, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """
+    在内存中把音频解码为 16kHz 单声道 float32 数组，不落盘
+    
+    WebM/Ogg 通过 PyAV (faster_whisper.decode_audio) 从 BytesIO 解码并重采样；
+    裸 PCM 直接按 16-bit 小端解析
+    """
+    if is_container_audio(audio_data):
+        from faster_whisper import decode_audio
+        return decode_audio(io.BytesIO(audio_data), sampling_rate=SAMPLE_RATE)
+    return pcm16_to_float32(audio_data, sample_rate)
+
+
+class ASRNotReadyError(Exception):
+    """Whisper 模型在等待时间内未加载完成"""
+
+
+class ASRModelLoadError(Exception):
+    """Whisper 模型加载或预热失败，服务已降级为模拟模式"""
+
 
 @dataclass
 class TranscriptSegment:
@@ -29,8 +66,10 @@ class ConversationContext:
     """对话上下文 - 维护两人对话历史"""
     segments: List[TranscriptSegment] = field(default_factory=list)
     max_segments: int = 50  # 保留最近50轮对话
+    turn: int = 0  # 每写入一段或清空一次递增，用于判断基于旧上下文的结果是否过期
     
     def add_segment(self, segment: TranscriptSegment):
+        self.turn += 1
         self.segments.append(segment)
         # 保持窗口大小
         if len(self.segments) > self.max_segments:
@@ -60,6 +99,7 @@ class ConversationContext:
         return [all_text[:50]] if all_text else []
     
     def clear(self):
+        self.turn += 1
         self.segments.clear()
 
 
@@ -72,19 +112,37 @@ class SpeechRecognitionService:
     2. 在线模式：使用云端 ASR 服务 (如 Azure, Google)
     """
     
-    def __init__(self, mode: str = "offline", model_size: str = "base"):
+    def __init__(
+        self,
+        mode: str = "offline",
+        profile: Optional[str] = None,
+        partial_profile: Optional[str] = None
+    ):
         """
         初始化语音识别服务
         
         Args:
             mode: "offline" 使用本地 Whisper, "online" 使用云端服务
-            model_size: Whisper 模型大小 (tiny, base, small, medium, large)
+            profile: 默认的最终识别配置名 (见 app.core.asr_profiles)
+            partial_profile: 默认的流式临时结果配置名
         """
         self.mode = mode
-        self.model_size = model_size
-        self.model = None
-        self.is_initialized = False
+        self.profile = get_profile(profile or settings.ASR_PROFILE)
+        self.partial_profile = get_profile(partial_profile or settings.ASR_PARTIAL_PROFILE)
+        self.model = None           # 默认配置的模型，加载完成即可识别
+        self.models: Dict[str, Any] = {}
+        self.batched_models: Dict[str, Any] = {}
+        self._model_lock = threading.Lock()
+        self.profile_usage: Dict[str, int] = {}
+        self.pool = ASRWorkerPool(
+            workers=settings.ASR_WORKERS,
+            queue_size=settings.ASR_QUEUE_SIZE,
+            shed_partial_depth=settings.ASR_SHED_PARTIAL_DEPTH
+        )
         self.is_loading = False
+        self.warmup_seconds: Optional[float] = None
+        self.load_error: Optional[str] = None
+        self._load_task: Optional[asyncio.Task] = None
         self.context = ConversationContext()
         
         # 说话人检测状态
@@ -92,50 +150,145 @@ class SpeechRecognitionService:
         self._speaker_energy_threshold = 0.02
         
     async def initialize(self):
-        """异步初始化模型 - 懒加载，不阻塞启动"""
-        if self.is_initialized or self.is_loading:
-            return
-            
+        """
+        加载模型并预热，完成后返回
+        
+        由服务注册表在后台调用，预热推理结束后服务才报告就绪；
+        重复调用共享同一个加载任务
+        
+        Raises:
+            ASRModelLoadError: 模型加载或预热失败。识别请求仍以模拟模式应答，
+                但注册表会把服务标记为 failed，/ready 不会报告就绪
+        """
+        await asyncio.shield(self._start_loading())
+        if self.load_error:
+            raise ASRModelLoadError(self.load_error)
+    
+    def _start_loading(self) -> asyncio.Task:
+        """启动 (或返回已有的) 加载任务"""
+        if self._load_task is None:
+            self._load_task = asyncio.ensure_future(self._load())
+        return self._load_task
+    
+    async def _load(self):
         self.is_loading = True
+        try:
+            if self.mode == "offline":
+                # 在线程中加载模型，随后用合成音频跑一次推理，
+                # 让 CTranslate2 的延迟初始化不落在第一个真实请求上
+                print("🔄 正在后台加载 Whisper 模型...")
+                await asyncio.to_thread(self._load_whisper_model)
+                if self.model:
+                    started = time.perf_counter()
+                    await asyncio.to_thread(self._warm_up_model)
+                    self.warmup_seconds = time.perf_counter() - started
+                    print(f"✅ Whisper 预热完成 ({self.warmup_seconds:.2f}s)")
+        finally:
+            self.is_loading = False
+    
+    async def _wait_until_loaded(self):
+        """
+        等待模型加载完成，加载中到达的请求在此排队
         
-        if self.mode == "offline":
-            # 在后台线程中加载模型
-            print("🔄 正在后台加载 Whisper 模型...")
-            loop = asyncio.get_event_loop()
-            loop.run_in_executor(None, self._load_whisper_model)
+        Raises:
+            ASRNotReadyError: 超过 ASR_LOAD_TIMEOUT_S 仍未加载完成
+        """
+        task = self._start_loading()
+        if task.done():
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(task), timeout=settings.ASR_LOAD_TIMEOUT_S)
+        except asyncio.TimeoutError:
+            raise ASRNotReadyError(f"Whisper 模型加载中，{settings.ASR_LOAD_TIMEOUT_S:.0f}s 内未就绪")
         
-        # 先标记为已初始化，允许服务启动
-        self.is_initialized = True
+    def _preloaded_profiles(self) -> List[DecodingProfile]:
+        """
+        默认配置 (最终结果与临时结果) 及其降级链上的全部配置
         
+        负载升高时只会降级到这些配置，预先加载可避免高峰期在推理线程中加载模型
+        """
+        profiles: List[DecodingProfile] = []
+        for name in (self.partial_profile.name, self.profile.name):
+            for profile in fallback_chain(name):
+                if profile not in profiles:
+                    profiles.append(profile)
+        return profiles
+    
     def _load_whisper_model(self):
-        """在后台线程中加载 Whisper 模型"""
+        """在后台线程中加载默认配置及其降级链用到的 Whisper 模型"""
         try:
-            from faster_whisper import WhisperModel
-            
-            # 使用 CPU 模式 (也支持 CUDA)
-            self.model = WhisperModel(
-                self.model_size, 
-                device="cpu",
-                compute_type="int8"
-            )
-            print(f"✅ Whisper 模型已加载: {self.model_size}")
-            self.is_loading = False
+            for profile in self._preloaded_profiles():
+                self._get_model(profile.model_size)
+            self.model = self._get_model(self.profile.model_size)
             
         except ImportError:
             print("⚠️ faster-whisper 未安装，将使用模拟模式")
             self.mode = "mock"
-            self.is_loading = False
+            self.load_error = "faster-whisper 未安装"
             
         except Exception as e:
             print(f"⚠️ Whisper 加载失败: {e}，将使用模拟模式")
             self.mode = "mock"
-            self.is_loading = False
+            self.load_error = f"Whisper 加载失败: {e}"
+    
+    def _warm_up_model(self):
+        """用 1 秒合成音频 (低幅正弦 + 噪声) 对预加载的各配置推理一次；关闭 VAD 以确保解码器实际运行"""
+        t = np.arange(SAMPLE_RATE, dtype=np.float32) / SAMPLE_RATE
+        rng = np.random.default_rng(0)
+        audio = (0.1 * np.sin(2 * np.pi * 220 * t) + 0.01 * rng.standard_normal(SAMPLE_RATE)).astype(np.float32)
+        for profile in self._preloaded_profiles():
+            try:
+                self._decode_words(audio, None, profile)
+            except Exception as e:
+                print(f"⚠️ Whisper 预热失败 ({profile.name}): {e}")
+                self.load_error = f"Whisper 预热失败 ({profile.name}): {e}"
+    
+    def _get_model(self, model_size: str):
+        """
+        获取指定大小的模型，首次使用时加载 (在线程中执行)
+        
+        默认配置及其降级链的模型在启动时加载；显式请求的其他配置在首个请求时加载，
+        该请求会多等一次加载时间
+        """
+        if model_size in self.models:
+            return self.models[model_size]
+        with self._model_lock:
+            if model_size not in self.models:
+                from faster_whisper import WhisperModel
+                
+                # 使用 CPU 模式 (也支持 CUDA)；num_workers 与推理池并行度一致，
+                # 多个请求可同时在 CTranslate2 中解码
+                model = WhisperModel(
+                    model_size,
+                    device="cpu",
+                    compute_type="int8",
+                    cpu_threads=settings.ASR_CPU_THREADS,
+                    num_workers=settings.ASR_WORKERS,
+                    download_root=settings.ASR_MODEL_DIR or None
+                )
+                try:
+                    from faster_whisper import BatchedInferencePipeline
+                    self.batched_models[model_size] = BatchedInferencePipeline(model=model)
+                except ImportError:
+                    pass
+                self.models[model_size] = model
+                print(f"✅ Whisper 模型已加载: {model_size} (并行 {settings.ASR_WORKERS})")
+        return self.models[model_size]
+    
+    def _select_profile(self, name: Optional[str], partial: bool = False) -> DecodingProfile:
+        """按推理池负载选择实际使用的配置，并记录使用次数"""
+        default = self.partial_profile if partial else self.profile
+        profile = select_profile(name or default.name, self.pool.load(), settings.ASR_DOWNGRADE_LOAD)
+        key = f"{'partial' if partial else 'final'}:{profile.name}"
+        self.profile_usage[key] = self.profile_usage.get(key, 0) + 1
+        return profile
     
     async def transcribe_audio(
         self, 
         audio_data: bytes, 
         sample_rate: int = 16000,
-        detect_speaker: bool = True
+        detect_speaker: bool = True,
+        profile: Optional[str] = None
     ) -> Optional[TranscriptSegment]:
         """
         转录音频数据
@@ -144,40 +297,40 @@ class SpeechRecognitionService:
             audio_data: 原始音频字节 (PCM 16-bit)
             sample_rate: 采样率
             detect_speaker: 是否检测说话人
+            profile: 识别配置名，为空时使用默认配置
             
         Returns:
             转录结果片段
+            
+        Raises:
+            ASRNotReadyError: 模型在等待时间内未加载完成
         """
-        if not self.is_initialized:
-            await self.initialize()
-        
         if not audio_data or len(audio_data) < 1000:
             return None
         
+        # 模型加载中时排队等待，而不是返回模拟结果
+        await self._wait_until_loaded()
+        
         # 检测说话人 (基于简单的能量检测)
         speaker = await self._detect_speaker(audio_data) if detect_speaker else "user"
         
-        # 检查模型是否已加载
-        if self.mode == "offline":
-            if self.model:
-                return await self._transcribe_whisper(audio_data, sample_rate, speaker)
-            elif self.is_loading:
-                print("⏳ Whisper 模型正在加载中，使用模拟模式...")
-                return await self._transcribe_mock(audio_data, speaker)
-            else:
-                return await self._transcribe_mock(audio_data, speaker)
-        else:
-            return await self._transcribe_mock(audio_data, speaker)
+        # 加载失败或未安装 faster-whisper 时 mode 为 "mock"
+        if self.mode == "offline" and self.model:
+            return await self._transcribe_whisper(audio_data, sample_rate, speaker, profile)
+        return await self._transcribe_mock(audio_data, speaker)
     
     async def transcribe_base64(
         self, 
         base64_audio: str,
-        sample_rate: int = 16000
+        sample_rate: int = 16000,
+        profile: Optional[str] = None
     ) -> Optional[TranscriptSegment]:
         """从 Base64 编码的音频转录"""
         try:
             audio_bytes = base64.b64decode(base64_audio)
-            return await self.transcribe_audio(audio_bytes, sample_rate)
+            return await self.transcribe_audio(audio_bytes, sample_rate, profile=profile)
+        except (ASROverloadedError, ASRNotReadyError):
+            raise
         except Exception as e:
             print(f"Base64 解码失败: {e}")
             return None
@@ -186,45 +339,19 @@ class SpeechRecognitionService:
         self, 
         audio_data: bytes, 
         sample_rate: int,
-        speaker: str
+        speaker: str,
+        profile: Optional[str] = None
     ) -> Optional[TranscriptSegment]:
-        """使用 Whisper 模型转录"""
-        temp_file = None
+        """使用 Whisper 模型转录 (经推理池排队，队列满时抛出 ASROverloadedError)"""
         try:
-            # 检测音频格式
-            is_webm = audio_data[:4] == b'\x1a\x45\xdf\xa3' or b'webm' in audio_data[:50].lower()
-            is_ogg = audio_data[:4] == b'OggS'
-            
-            if is_webm or is_ogg:
-                # WebM/Opus 格式 - 保存为临时文件让 whisper 处理
-                suffix = '.webm' if is_webm else '.ogg'
-                temp_file = tempfile.NamedTemporaryFile(suffix=suffix, delete=False)
-                temp_file.write(audio_data)
-                temp_file.close()
-                audio_source = temp_file.name
-            else:
-                # PCM 数据 - 转换为 WAV
-                wav_buffer = io.BytesIO()
-                with wave.open(wav_buffer, 'wb') as wav_file:
-                    wav_file.setnchannels(1)
-                    wav_file.setsampwidth(2)  # 16-bit
-                    wav_file.setframerate(sample_rate)
-                    wav_file.writeframes(audio_data)
-                wav_buffer.seek(0)
-                audio_source = wav_buffer
-            
-            # 转录 - 在线程池中运行以避免阻塞
+            # 解码和转录都在线程池中运行以避免阻塞
             loop = asyncio.get_event_loop()
-            segments, info = await loop.run_in_executor(
-                None,
-                lambda: self.model.transcribe(
-                    audio_source,
-                    language="zh",
-                    vad_filter=True,
-                    vad_parameters=dict(min_silence_duration_ms=300),
-                    beam_size=5,
-                    best_of=3
-                )
+            audio_source = await loop.run_in_executor(None, decode_audio_bytes, audio_data, sample_rate)
+            selected = self._select_profile(profile)
+            segments = await self.pool.submit(
+                lambda: self._transcribe_segments(audio_source, selected),
+                audio_seconds=len(audio_source) / SAMPLE_RATE,
+                priority=PRIORITY_FINAL
             )
             
             # 合并所有片段
@@ -267,18 +394,142 @@ class SpeechRecognitionService:
             
             return result
             
+        except ASROverloadedError:
+            raise
         except Exception as e:
             print(f"Whisper 转录失败: {e}")
             import traceback
             traceback.print_exc()
             return None
-        finally:
-            # 清理临时文件
-            if temp_file and os.path.exists(temp_file.name):
-                try:
-                    os.unlink(temp_file.name)
-                except:
-                    pass
+    
+    def _transcribe_segments(self, audio: np.ndarray, profile: DecodingProfile) -> list:
+        """完整转录 (在推理线程中执行)；长语音切段后批量解码"""
+        model = self._get_model(profile.model_size)
+        batched = self.batched_models.get(profile.model_size)
+        options = profile.transcribe_options()
+        if batched and len(audio) / SAMPLE_RATE >= settings.ASR_BATCHED_MIN_SECONDS:
+            segments, _ = batched.transcribe(audio, batch_size=settings.ASR_BATCH_SIZE, **options)
+        else:
+            segments, _ = model.transcribe(audio, **options)
+        # segments 是惰性生成器，需在推理线程内消费完
+        return list(segments)
+    
+    def create_stream(
+        self,
+        on_update: Callable[[StreamingUpdate], Awaitable[None]],
+        profile: Optional[str] = None,
+        partial_profile: Optional[str] = None
+    ) -> StreamingTranscriber:
+        """
+        为一个会话创建流式识别器
+        
+        Args:
+            profile: 语音结束时最后一次解码使用的配置
+            partial_profile: 增量解码 (临时结果) 使用的配置
+        """
+        async def decode(samples: np.ndarray, initial_prompt: Optional[str], final: bool = False):
+            return await self.decode_window(
+                samples, initial_prompt, final, profile if final else partial_profile
+            )
+        
+        return StreamingTranscriber(
+            decode=decode,
+            on_update=on_update,
+            min_chunk=settings.ASR_STREAM_MIN_CHUNK_S,
+            max_window=settings.ASR_STREAM_MAX_WINDOW_S
+        )
+    
+    async def decode_window(
+        self,
+        samples: np.ndarray,
+        initial_prompt: Optional[str] = None,
+        final: bool = False,
+        profile: Optional[str] = None
+    ) -> Optional[List[Word]]:
+        """
+        解码一段 16kHz float32 音频，返回带时间戳的词
+        
+        模拟模式下返回空列表，由 finish_stream 兜底；
+        模型加载中或推理池积压时跳过临时解码，返回 None (音频留在缓冲区，之后一并解码)
+        
+        Args:
+            final: 是否为语音结束时的最后一次解码 (不会被跳过，队列满时抛出 ASROverloadedError)
+            profile: 识别配置名，为空时按 final 使用默认的最终/临时配置
+        """
+        if self.mode == "offline" and not self.model:
+            if not final:
+                self._start_loading()
+                return None
+            await self._wait_until_loaded()
+        if self.mode != "offline" or not self.model:
+            return []
+        selected = self._select_profile(profile, partial=not final)
+        try:
+            return await self.pool.submit(
+                lambda: self._decode_words(samples, initial_prompt, selected),
+                audio_seconds=len(samples) / SAMPLE_RATE,
+                priority=PRIORITY_FINAL if final else PRIORITY_PARTIAL
+            )
+        except ASROverloadedError:
+            if final:
+                raise
+            return None
+    
+    def _decode_words(
+        self,
+        samples: np.ndarray,
+        initial_prompt: Optional[str],
+        profile: DecodingProfile
+    ) -> List[Word]:
+        """增量解码 (在推理线程中执行)：词级时间戳，不依赖上一窗口的输出；窗口已是语音段，不做 VAD"""
+        options = profile.transcribe_options()
+        options.pop("vad_parameters", None)
+        options.update(vad_filter=False, word_timestamps=True, condition_on_previous_text=False)
+        segments, _ = self._get_model(profile.model_size).transcribe(
+            samples, initial_prompt=initial_prompt, **options
+        )
+        words = []
+        for segment in segments:
+            for word in segment.words or []:
+                words.append((word.start, word.end, word.word))
+        return words
+    
+    async def finish_stream(
+        self,
+        stream: StreamingTranscriber,
+        speaker: Optional[str] = None
+    ) -> Optional[TranscriptSegment]:
+        """
+        结束一段流式语音，返回完整转录并加入对话上下文
+        
+        Args:
+            speaker: 客户端指定的说话人，为空时按语音能量判断
+            
+        Raises:
+            ASRNotReadyError: 模型在等待时间内未加载完成 (本段语音被丢弃)
+        """
+        try:
+            await self._wait_until_loaded()
+        except ASRNotReadyError:
+            stream.reset()
+            raise
+        energy = stream.mean_energy
+        update = await stream.finish()
+        speaker = speaker or self._speaker_from_energy(energy)
+        
+        if not update.committed:
+            if self.mode != "offline":
+                return await self._transcribe_mock(b"", speaker)
+            return None
+        
+        result = TranscriptSegment(
+            text=update.committed,
+            speaker=speaker,
+            start_time=0,
+            end_time=0
+        )
+        self.context.add_segment(result)
+        return result
     
     async def _transcribe_mock(
         self, 
@@ -328,18 +579,42 @@ class SpeechRecognitionService:
         try:
             samples = struct.unpack(f'{len(audio_data)//2}h', audio_data)
             energy = sum(abs(s) for s in samples) / len(samples) / 32768.0
-            
-            # 简单的交替检测逻辑
-            # 实际应用中需要更复杂的说话人识别
-            if energy > self._speaker_energy_threshold:
-                # 交替说话人
-                self._current_speaker = "other" if self._current_speaker == "user" else "user"
-            
-            return self._current_speaker
+            return self._speaker_from_energy(energy)
             
         except Exception:
             return "user"
     
+    def _speaker_from_energy(self, energy: float) -> str:
+        """根据平均能量 (0~1) 判断说话人"""
+        # 简单的交替检测逻辑
+        # 实际应用中需要更复杂的说话人识别
+        if energy > self._speaker_energy_threshold:
+            # 交替说话人
+            self._current_speaker = "other" if self._current_speaker == "user" else "user"
+        
+        return self._current_speaker
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """识别服务统计：模型状态与推理池队列深度、实时率"""
+        return {
+            "mode": self.mode,
+            "profile": self.profile.name,
+            "partial_profile": self.partial_profile.name,
+            "models_loaded": sorted(self.models),
+            "model_loaded": self.model is not None,
+            "loading": self.is_loading,
+            "load_error": self.load_error,
+            "warmup_seconds": round(self.warmup_seconds, 3) if self.warmup_seconds is not None else None,
+            "profile_usage": dict(self.profile_usage),
+            "pool": self.pool.get_stats()
+        }
+    
+    def close(self):
+        """停止加载任务与推理池"""
+        if self._load_task and not self._load_task.done():
+            self._load_task.cancel()
+        self.pool.close()
+    
     def get_context(self) -> ConversationContext:
         """获取当前对话上下文"""
         return self.context
@@ -350,5 +625,9 @@ class SpeechRecognitionService:
         self._current_speaker = "user"
 
 
-# 单例
-speech_service = SpeechRecognitionService(mode="offline", model_size="base")
+# 单例：首次使用时创建，预热时开始加载 Whisper 模型
+speech_service = service_registry.register(
+    "speech",
+    lambda: SpeechRecognitionService(mode="offline"),
+    warmup=lambda service: service.initialize()
+)
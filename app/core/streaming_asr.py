@@ -0,0 +1,296 @@
+"""
+流式语音识别 - 环形缓冲 + 滑动窗口增量解码 + 局部一致 (local agreement) 确认
+"""
+import asyncio
+from dataclasses import dataclass
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+import numpy as np
+
+# (开始秒, 结束秒, 文本)，时间为会话内的绝对时间
+Word = Tuple[float, float, str]
+
+SAMPLE_RATE = 16000
+
+
+def pcm16_to_float32(pcm: bytes, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """16-bit 小端 PCM 转 float32 (-1~1)，必要时线性重采样到 16kHz"""
+    samples = np.frombuffer(pcm[:len(pcm) // 2 * 2], dtype="<i2").astype(np.float32) / 32768.0
+    if sample_rate != SAMPLE_RATE and len(samples):
+        duration = len(samples) / sample_rate
+        target = np.linspace(0, duration, int(duration * SAMPLE_RATE), endpoint=False)
+        samples = np.interp(target, np.arange(len(samples)) / sample_rate, samples).astype(np.float32)
+    return samples
+
+
+class AudioRingBuffer:
+    """
+    固定容量的音频环形缓冲
+
+    只保留尚未确认的最近一段音频；offset 为缓冲起点在会话中的绝对时间（秒）
+    """
+
+    def __init__(self, max_seconds: float, sample_rate: int = SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self._data = np.zeros(int(max_seconds * sample_rate), dtype=np.float32)
+        self._start = 0
+        self._size = 0
+        self.offset = 0.0
+
+    @property
+    def duration(self) -> float:
+        return self._size / self.sample_rate
+
+    @property
+    def end_time(self) -> float:
+        return self.offset + self.duration
+
+    def append(self, samples: np.ndarray):
+        """追加音频；超出容量时丢弃最早的部分"""
+        capacity = len(self._data)
+        if len(samples) >= capacity:
+            dropped = self._size + len(samples) - capacity
+            self._data[:] = samples[-capacity:]
+            self._start, self._size = 0, capacity
+            self.offset += dropped / self.sample_rate
+            return
+
+        overflow = self._size + len(samples) - capacity
+        if overflow > 0:
+            self._consume(overflow)
+        end = (self._start + self._size) % capacity
+        first = min(len(samples), capacity - end)
+        self._data[end:end + first] = samples[:first]
+        self._data[:len(samples) - first] = samples[first:]
+        self._size += len(samples)
+
+    def trim_until(self, seconds: float):
+        """丢弃绝对时间 seconds 之前的音频"""
+        samples = int((seconds - self.offset) * self.sample_rate)
+        if samples > 0:
+            self._consume(min(samples, self._size))
+
+    def window(self) -> np.ndarray:
+        """当前缓冲内容 (连续数组)"""
+        capacity = len(self._data)
+        end = self._start + self._size
+        if end <= capacity:
+            return self._data[self._start:end].copy()
+        return np.concatenate([self._data[self._start:], self._data[:end - capacity]])
+
+    def clear(self):
+        self.offset = self.end_time
+        self._start = self._size = 0
+
+    def _consume(self, samples: int):
+        self._start = (self._start + samples) % len(self._data)
+        self._size -= samples
+        self.offset += samples / self.sample_rate
+
+
+class LocalAgreement:
+    """
+    局部一致确认 (LocalAgreement-2)
+
+    相邻两次解码结果的公共前缀视为稳定，确认后不再改变；其余部分作为临时结果展示
+    """
+
+    def __init__(self):
+        self.committed: List[Word] = []
+        self._previous: List[Word] = []
+
+    @property
+    def committed_end(self) -> float:
+        return self.committed[-1][1] if self.committed else 0.0
+
+    def update(self, hypothesis: List[Word]) -> Tuple[List[Word], List[Word]]:
+        """
+        用新一次解码结果更新
+
+        Returns:
+            (本次新确认的词, 未确认的临时词)
+        """
+        # 去掉与已确认部分重叠的词
+        hypothesis = [w for w in hypothesis if w[1] > self.committed_end + 0.01]
+
+        agreed = 0
+        for old, new in zip(self._previous, hypothesis):
+            if old[2].strip() != new[2].strip():
+                break
+            agreed += 1
+
+        newly_committed = hypothesis[:agreed]
+        self.committed.extend(newly_committed)
+        self._previous = hypothesis[agreed:]
+        return newly_committed, self._previous
+
+    def flush(self) -> List[Word]:
+        """结束时确认所有剩余的临时词"""
+        remaining, self._previous = self._previous, []
+        self.committed.extend(remaining)
+        return remaining
+
+    def reset(self):
+        self.committed.clear()
+        self._previous = []
+
+
+@dataclass
+class StreamingUpdate:
+    """一次增量识别结果"""
+    committed: str        # 已确认的完整文本
+    partial: str          # 未确认的临时文本
+    new_committed: str    # 本次新确认的文本
+    is_final: bool = False
+
+    @property
+    def text(self) -> str:
+        return self.committed + self.partial
+
+
+def _join(words: List[Word]) -> str:
+    return "".join(w[2] for w in words).strip()
+
+
+class StreamingTranscriber:
+    """
+    单个会话的流式识别器
+
+    feed() 追加 PCM 后立即返回；累计到 min_chunk 秒新音频且没有进行中的解码时，
+    在后台对整个缓冲窗口解码一次，通过 on_update 推送临时/确认文本。
+    窗口超过 max_window 秒时丢弃已确认部分的音频，保证每次解码耗时有上限。
+    """
+
+    def __init__(
+        self,
+        decode: Callable[..., Awaitable[Optional[List[Tuple[float, float, str]]]]],
+        on_update: Callable[[StreamingUpdate], Awaitable[None]],
+        min_chunk: float = 1.0,
+        max_window: float = 15.0,
+        prompt_chars: int = 100
+    ):
+        """
+        Args:
+            decode: 解码函数 decode(audio, prompt, final=...)，输入 16kHz float32 音频与提示文本，
+                返回窗口内相对时间的词列表；返回 None 表示本轮被跳过 (识别繁忙)
+            on_update: 有新结果时的回调
+            min_chunk: 两次解码之间至少新增的音频（秒）
+            max_window: 解码窗口上限（秒）
+            prompt_chars: 作为上下文提示的已确认文本长度
+        """
+        self.decode = decode
+        self.on_update = on_update
+        self.min_chunk = min_chunk
+        self.max_window = max_window
+        self.prompt_chars = prompt_chars
+
+        # 留出余量，解码进行中到达的音频不会被覆盖
+        self.buffer = AudioRingBuffer(max_window * 2)
+        self.agreement = LocalAgreement()
+        self._decoded_until = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._finishing = False
+        self._energy = 0.0
+        self._samples = 0
+
+    @property
+    def mean_energy(self) -> float:
+        """本段语音的平均能量，用于说话人判断"""
+        return self._energy / self._samples if self._samples else 0.0
+
+    def feed(self, samples: np.ndarray):
+        """追加 16kHz float32 音频"""
+        if not len(samples):
+            return
+        self.buffer.append(samples)
+        self._energy += float(np.abs(samples).sum())
+        self._samples += len(samples)
+        self._schedule()
+
+    def _schedule(self):
+        """积累了足够的新音频且没有进行中的解码时，启动一次后台解码"""
+        if self._task is None and not self._finishing \
+                and self.buffer.end_time - self._decoded_until >= self.min_chunk:
+            self._task = asyncio.create_task(self._decode_and_publish())
+
+    async def _decode_and_publish(self):
+        try:
+            update = await self._step()
+            if update and (update.new_committed or update.partial):
+                await self.on_update(update)
+        except Exception as e:
+            print(f"⚠️ 流式识别失败: {e}")
+        finally:
+            self._task = None
+        # 解码期间又积累了足够音频，继续下一轮
+        self._schedule()
+
+    async def _step(self) -> Optional[StreamingUpdate]:
+        """对当前窗口解码一次并更新确认状态"""
+        audio = self.buffer.window()
+        offset = self.buffer.offset
+        self._decoded_until = self.buffer.end_time
+        if not len(audio):
+            return None
+
+        committed_text = _join(self.agreement.committed)
+        prompt = committed_text[-self.prompt_chars:] or None
+        words = await self.decode(audio, prompt, final=self._finishing)
+        if words is None:
+            # 识别繁忙，本轮跳过；音频仍在缓冲中，下次解码时一并处理
+            return None
+        hypothesis = [(offset + start, offset + end, text) for start, end, text in words]
+
+        newly_committed, partial = self.agreement.update(hypothesis)
+
+        # 窗口过长：丢弃已确认部分的音频；没有可丢弃的内容时强制确认
+        if self.buffer.duration > self.max_window:
+            if self.agreement.committed_end <= self.buffer.offset:
+                newly_committed = newly_committed + self.agreement.flush()
+                partial = []
+            self.buffer.trim_until(self.agreement.committed_end)
+        elif newly_committed:
+            self.buffer.trim_until(self.agreement.committed_end)
+
+        return StreamingUpdate(
+            committed=_join(self.agreement.committed),
+            partial=_join(partial),
+            new_committed=_join(newly_committed)
+        )
+
+    async def finish(self) -> StreamingUpdate:
+        """语音结束：等待进行中的解码，对剩余音频做最后一次解码并确认全部结果"""
+        self._finishing = True
+        if self._task:
+            try:
+                await self._task
+            except Exception:
+                pass
+        # 确认上一次的临时结果之前，再解码一次剩余音频
+        if self.buffer.end_time > self.agreement.committed_end and self.buffer.duration > 0.2:
+            try:
+                await self._step()
+            except Exception as e:
+                print(f"⚠️ 流式识别失败: {e}")
+        remaining = self.agreement.flush()
+
+        update = StreamingUpdate(
+            committed=_join(self.agreement.committed),
+            partial="",
+            new_committed=_join(remaining),
+            is_final=True
+        )
+        self.reset()
+        return update
+
+    def reset(self):
+        """开始新的一段语音"""
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        self.buffer.clear()
+        self.agreement.reset()
+        self._decoded_until = self.buffer.end_time
+        self._finishing = False
+        self._energy = 0.0
+        self._samples = 0
@@ -0,0 +1,285 @@
+"""
+NumPy 向量索引 - 金句向量常驻为一块连续矩阵，矩阵乘法 + argpartition 求 top-k
+"""
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.core.filters import Filters, MetadataPostings
+from app.core.quantization import QuantizedCodes
+
+
+class _Snapshot(NamedTuple):
+    """索引的一份完整快照；写入时整体替换，读取方无需加锁"""
+    vectors: Optional[np.ndarray]
+    ids: List[str]
+    metadatas: List[Dict]
+    postings: MetadataPostings
+    codes: Optional[QuantizedCodes] = None
+
+
+_EMPTY = _Snapshot(None, [], [], MetadataPostings())
+
+
+def _top_k(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """按行取分数最高的 k 列，返回 (列号, 分数)，均按分数降序"""
+    if k < scores.shape[1]:
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.broadcast_to(np.arange(scores.shape[1]), (len(scores), scores.shape[1]))
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1)
+    return np.take_along_axis(candidates, order, axis=1), np.take_along_axis(candidate_scores, order, axis=1)
+
+
+class NumpyVectorIndex:
+    """
+    进程内向量索引
+
+    向量按行归一化后存为 vectors.npy，以 mmap 方式加载 (多进程共享页缓存)；
+    id 与元数据存于 metadata.json。相似度为余弦相似度 (归一化后的内积)。
+    加载时按 category/type/author/source 建立倒排，过滤检索只对命中的行做矩阵乘法。
+
+    启用量化时，压缩码 (int8 / 二值) 常驻内存做粗排，取 top_k * rerank_factor 个候选
+    再从 mmap 的原始向量中读取这些行精排；原始向量不必整体载入内存。
+    写入时整体重写文件后原子替换，检索线程读到的始终是一份完整快照。
+    """
+
+    VECTORS_FILE = "vectors.npy"
+    METADATA_FILE = "metadata.json"
+    CODES_FILE = "codes_{}.npz"
+
+    def __init__(
+        self,
+        path: str,
+        dtype: str = "float32",
+        quantization: Optional[str] = None,
+        rerank_factor: int = 10
+    ):
+        """
+        Args:
+            path: 索引目录
+            dtype: 磁盘存储精度，float32 或 float16 (float16 体积减半，查询时升为 float32 计算)
+            quantization: None、"int8" (内存 1/4) 或 "binary" (内存 1/32)
+            rerank_factor: 量化粗排时取 top_k 的多少倍候选做精排
+        """
+        if dtype not in ("float32", "float16"):
+            raise ValueError(f"不支持的向量精度: {dtype}")
+        self.path = Path(path)
+        self.dtype = np.dtype(dtype)
+        self.quantization = quantization or None
+        self.rerank_factor = rerank_factor
+        self._lock = threading.Lock()
+        self._snapshot = _EMPTY
+        self.load()
+
+    def load(self):
+        """从磁盘加载索引，文件不存在时为空索引"""
+        vectors_file = self.path / self.VECTORS_FILE
+        metadata_file = self.path / self.METADATA_FILE
+        if not vectors_file.exists() or not metadata_file.exists():
+            self._snapshot = _EMPTY
+            return
+
+        with open(metadata_file, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        vectors = np.load(vectors_file, mmap_mode="r")
+        if len(vectors) != len(meta["ids"]):
+            raise ValueError(f"向量索引损坏: {len(vectors)} 行向量, {len(meta['ids'])} 条元数据")
+        postings = MetadataPostings()
+        for row, metadata in enumerate(meta["metadatas"]):
+            postings.add(row, metadata)
+        self._snapshot = _Snapshot(vectors, meta["ids"], meta["metadatas"], postings, self._load_codes(vectors))
+
+    def _load_codes(self, vectors: np.ndarray) -> Optional[QuantizedCodes]:
+        """加载量化码；文件缺失、早于向量文件或行数不符时重新编码并保存"""
+        if not self.quantization:
+            return None
+        codes_file = self.path / self.CODES_FILE.format(self.quantization)
+        vectors_mtime = (self.path / self.VECTORS_FILE).stat().st_mtime
+        if codes_file.exists() and codes_file.stat().st_mtime >= vectors_mtime:
+            codes = QuantizedCodes.load(self.quantization, codes_file)
+            if len(codes.codes) == len(vectors):
+                return codes
+        codes = QuantizedCodes.build(self.quantization, vectors)
+        tmp = codes_file.with_name(codes_file.name + ".tmp")
+        codes.save(tmp)
+        os.replace(tmp, codes_file)
+        return codes
+
+    @property
+    def vectors(self) -> Optional[np.ndarray]:
+        """归一化后的原始向量矩阵 (mmap)"""
+        return self._snapshot.vectors
+
+    def count(self) -> int:
+        """索引中的向量条数"""
+        return len(self._snapshot.ids)
+
+    def upsert(self, ids: Sequence[str], embeddings: Sequence[Sequence[float]], metadatas: Sequence[Dict]):
+        """插入或覆盖向量 (按 id)，并持久化到磁盘"""
+        new_vectors = self._normalize(np.asarray(embeddings, dtype=np.float32))
+        with self._lock:
+            snapshot = self._snapshot
+            all_ids = list(snapshot.ids)
+            all_metadatas = list(snapshot.metadatas)
+            rows = {id_: i for i, id_ in enumerate(all_ids)}
+
+            if snapshot.vectors is None:
+                matrix = np.empty((0, new_vectors.shape[1]), dtype=self.dtype)
+            else:
+                if snapshot.vectors.shape[1] != new_vectors.shape[1]:
+                    raise ValueError(f"向量维度不一致: {snapshot.vectors.shape[1]} != {new_vectors.shape[1]}")
+                matrix = np.array(snapshot.vectors)
+
+            appended = []
+            for id_, vector, metadata in zip(ids, new_vectors, metadatas):
+                if id_ in rows:
+                    matrix[rows[id_]] = vector
+                    all_metadatas[rows[id_]] = metadata
+                else:
+                    rows[id_] = len(all_ids)
+                    all_ids.append(id_)
+                    all_metadatas.append(metadata)
+                    appended.append(vector)
+            if appended:
+                matrix = np.vstack([matrix, np.asarray(appended, dtype=self.dtype)])
+
+            self._write(matrix.astype(self.dtype, copy=False), all_ids, all_metadatas)
+            self.load()
+
+    def clear(self):
+        """清空索引"""
+        with self._lock:
+            for name in (self.VECTORS_FILE, self.METADATA_FILE):
+                (self.path / name).unlink(missing_ok=True)
+            for codes_file in self.path.glob(self.CODES_FILE.format("*")):
+                codes_file.unlink(missing_ok=True)
+            self._snapshot = _EMPTY
+
+    def search(
+        self,
+        queries: Sequence[Sequence[float]],
+        top_k: int,
+        filters: Optional[Filters] = None,
+        exact: bool = False
+    ) -> List[List[Tuple[int, float]]]:
+        """
+        批量 top-k 检索：一次矩阵乘法算出全部相似度，argpartition 选出前 k 个再排序
+
+        Args:
+            filters: 元数据过滤条件 (见 app.core.filters)，只在满足条件的行中检索
+            exact: 为 True 时忽略量化码，直接用原始向量全量计算
+
+        Returns:
+            与 queries 一一对应的 [(行号, 相似度), ...]，按相似度降序
+        """
+        snapshot = self._snapshot
+        if snapshot.vectors is None or not snapshot.ids or top_k <= 0:
+            return [[] for _ in queries]
+
+        rows = None
+        allowed = snapshot.postings.sorted_rows(filters)
+        if allowed is not None:
+            if not allowed:
+                return [[] for _ in queries]
+            rows = np.asarray(allowed, dtype=np.int64)
+
+        matrix = self._normalize(np.asarray(queries, dtype=np.float32))
+        if snapshot.codes is not None and not exact:
+            top, top_scores = self._search_quantized(snapshot, matrix, top_k, rows)
+        else:
+            vectors = snapshot.vectors if rows is None else snapshot.vectors[rows]
+            # float16 存储时 numpy 会把矩阵升为 float32 再走 BLAS
+            top, top_scores = _top_k(matrix @ vectors.T, min(top_k, len(vectors)))
+            if rows is not None:
+                top = rows[top]
+
+        return [
+            [(int(row), float(score)) for row, score in zip(hit_rows, hit_scores)]
+            for hit_rows, hit_scores in zip(top, top_scores)
+        ]
+
+    def _search_quantized(
+        self,
+        snapshot: _Snapshot,
+        matrix: np.ndarray,
+        top_k: int,
+        rows: Optional[np.ndarray]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """量化码粗排取候选，再用原始向量精排"""
+        approx = snapshot.codes.scores(matrix, rows)
+        n_candidates = min(top_k * self.rerank_factor, approx.shape[1])
+        candidates, _ = _top_k(approx, n_candidates)
+        if rows is not None:
+            candidates = rows[candidates]
+
+        k = min(top_k, n_candidates)
+        top = np.empty((len(matrix), k), dtype=np.int64)
+        top_scores = np.empty((len(matrix), k), dtype=np.float32)
+        for i, query in enumerate(matrix):
+            # mmap 上只读取候选行，按行号排序让读取尽量顺序
+            ordered = np.sort(candidates[i])
+            exact_scores = np.asarray(snapshot.vectors[ordered], dtype=np.float32) @ query
+            best, best_scores = _top_k(exact_scores[None, :], k)
+            top[i] = ordered[best[0]]
+            top_scores[i] = best_scores[0]
+        return top, top_scores
+
+    def query(
+        self,
+        queries: Sequence[Sequence[float]],
+        top_k: int,
+        filters: Optional[Filters] = None
+    ) -> List[List[Dict]]:
+        """批量检索并返回元数据"""
+        metadatas = self._snapshot.metadatas
+        return [[metadatas[row] for row, _ in hits] for hits in self.search(queries, top_k, filters)]
+
+    def iter_batches(self, batch_size: int = 4096):
+        """逐批读出 (ids, 向量, 元数据)；向量为归一化后的值"""
+        snapshot = self._snapshot
+        for start in range(0, len(snapshot.ids), batch_size):
+            end = start + batch_size
+            yield snapshot.ids[start:end], snapshot.vectors[start:end], snapshot.metadatas[start:end]
+
+    def _write(self, matrix: np.ndarray, ids: List[str], metadatas: List[Dict]):
+        """写入临时文件后原子替换，避免检索线程读到半写的索引"""
+        self.path.mkdir(parents=True, exist_ok=True)
+        vectors_tmp = self.path / f"{self.VECTORS_FILE}.tmp"
+        metadata_tmp = self.path / f"{self.METADATA_FILE}.tmp"
+
+        with open(vectors_tmp, "wb") as f:
+            np.save(f, matrix)
+        with open(metadata_tmp, "w", encoding="utf-8") as f:
+            json.dump({"ids": ids, "metadatas": metadatas}, f, ensure_ascii=False)
+
+        os.replace(vectors_tmp, self.path / self.VECTORS_FILE)
+        os.replace(metadata_tmp, self.path / self.METADATA_FILE)
+
+    @staticmethod
+    def _normalize(matrix: np.ndarray) -> np.ndarray:
+        """按行 L2 归一化"""
+        if matrix.ndim == 1:
+            matrix = matrix[None, :]
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.maximum(norms, 1e-12)
+
+    def get_stats(self) -> Dict:
+        """获取索引统计"""
+        snapshot = self._snapshot
+        vectors = snapshot.vectors
+        return {
+            "count": self.count(),
+            "filter_values": snapshot.postings.get_stats(),
+            "dim": int(vectors.shape[1]) if vectors is not None else None,
+            "dtype": str(self.dtype),
+            "bytes": int(vectors.nbytes) if vectors is not None else 0,
+            "quantization": self.quantization,
+            "rerank_factor": self.rerank_factor if self.quantization else None,
+            "code_bytes": snapshot.codes.nbytes if snapshot.codes is not None else 0
+        }
@@ -1,21 +1,30 @@
 from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from contextlib import asynccontextmanager
+import asyncio
+import base64
+import json
 import uuid
 
 from app.config import settings
 from app.models.schemas import (
-    SuggestionRequest, SuggestionResponse, Quote,
+    SuggestionRequest, SuggestionResponse, Quote, BatchSuggestionRequest,
     TranscribeRequest, TranscribeResponse,
     TextInputRequest, AssistantResponseModel,
     NewsRequest, NewsItemModel
 )
 from app.core.rag import rag_service
 from app.core.llm import llm_service
-from app.core.speech import speech_service
+from app.core.speech import ASRNotReadyError, speech_service
+from app.core.asr_pool import ASROverloadedError
+from app.core.asr_profiles import get_profile
 from app.core.news import news_service
 from app.core.assistant import conversation_assistant
 from app.core.websocket import connection_manager
+from app.core.speculative import SpeculativeGenerator
+from app.core.streaming_asr import StreamingUpdate, pcm16_to_float32
+from app.core.registry import ServiceNotReadyError, service_registry
 
 
 @asynccontextmanager
@@ -23,10 +32,12 @@ async def lifespan(app: FastAPI):
     """应用生命周期管理"""
     # 启动时初始化
     print("🚀 ChatBuff 服务启动中...")
-    await conversation_assistant.initialize()
-    print("✅ 所有服务已就绪")
+    # 服务在后台预热，不阻塞接收连接；进度见 /ready
+    warm_up_task = asyncio.create_task(service_registry.warm_up())
     yield
     # 关闭时清理
+    warm_up_task.cancel()
+    await service_registry.close()
     print("👋 ChatBuff 服务关闭")
 
 
@@ -46,6 +57,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.exception_handler(ServiceNotReadyError)
+async def service_not_ready_handler(request, exc: ServiceNotReadyError):
+    """服务仍在后台加载：返回 503，提示客户端稍后重试"""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": "1"}
+    )
+
 @app.get("/")
 async def root():
     return {
@@ -53,13 +73,26 @@ async def root():
         "provider": settings.LLM_PROVIDER,
         "model": settings.LLM_MODEL_NAME,
         "status": "running",
-        "quotes_count": rag_service.get_count()
+        "quotes_count": rag_service.get_count() if service_registry.is_ready("rag") else None
     }
 
 @app.get("/health")
 async def health_check():
     return {"status": "ok"}
 
+@app.get("/ready")
+async def readiness_check():
+    """
+    就绪检查
+    
+    返回各服务的预热状态与耗时；全部就绪时返回 200，否则返回 503
+    """
+    ready = service_registry.is_ready()
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"ready": ready, "services": service_registry.get_status()}
+    )
+
 @app.post("/api/suggestion", response_model=SuggestionResponse)
 async def get_suggestion(request: SuggestionRequest):
     """
@@ -69,7 +102,11 @@ async def get_suggestion(request: SuggestionRequest):
     """
     try:
         # Step 1: RAG 检索相关金句
-        related_quotes = rag_service.search(request.text, top_k=3)
+        related_quotes = await rag_service.search(
+            request.text,
+            top_k=3,
+            filters=request.filters.model_dump(exclude_none=True) if request.filters else None
+        )
         
         if not related_quotes:
             raise HTTPException(
@@ -78,22 +115,92 @@ async def get_suggestion(request: SuggestionRequest):
             )
         
         # Step 2: LLM 生成建议
-        suggestions = llm_service.generate_suggestion(
+        suggestions, fallback = await llm_service.generate_suggestion_result(
             user_text=request.text, 
             related_quotes=related_quotes,
-            parent_content=request.parent_content
+            parent_content=request.parent_content,
+            use_cache=request.use_cache
         )
         
         # Step 3: 返回结果
         return SuggestionResponse(
             original_text=request.text,
             suggestions=suggestions,
-            related_quotes=[Quote(**q) for q in related_quotes]
+            related_quotes=[Quote(**q) for q in related_quotes],
+            fallback=fallback
         )
         
+    except ServiceNotReadyError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/suggestion/batch")
+async def get_suggestions_batch(request: BatchSuggestionRequest):
+    """
+    批量获取回复建议
+    
+    按块批量检索金句，并以受限并发调用 LLM；结果按完成顺序以 NDJSON 流式返回，
+    每行包含 index 字段对应请求中的位置。离线预计算不受交互延迟预算约束，
+    LLM 失败时 fallback 为 true，suggestions 为本地兜底建议
+    """
+    texts = request.texts
+    chunk_size = settings.RAG_BATCH_CHUNK_SIZE
+    filters = request.filters.model_dump(exclude_none=True) if request.filters else None
+    
+    async def generate():
+        semaphore = asyncio.Semaphore(request.concurrency)
+        results: asyncio.Queue = asyncio.Queue()
+        tasks = []
+        
+        async def suggest(index: int, text: str, quotes):
+            try:
+                suggestions, fallback = [], False
+                if quotes:
+                    async with semaphore:
+                        suggestions, fallback = await llm_service.generate_suggestion_result(
+                            user_text=text,
+                            related_quotes=quotes,
+                            use_cache=request.use_cache,
+                            offline=True
+                        )
+                item = SuggestionResponse(
+                    original_text=text,
+                    suggestions=suggestions,
+                    related_quotes=[Quote(**q) for q in quotes],
+                    fallback=fallback
+                ).model_dump()
+            except Exception as e:
+                item = {"original_text": text, "error": str(e)}
+            item["index"] = index
+            await results.put(item)
+        
+        async def produce():
+            for start in range(0, len(texts), chunk_size):
+                chunk = texts[start:start + chunk_size]
+                try:
+                    quotes_list = await rag_service.search_many(
+                        chunk, top_k=request.top_k, filters=filters
+                    )
+                except Exception as e:
+                    print(f"❌ 批量检索失败: {e}")
+                    quotes_list = [[] for _ in chunk]
+                for offset, (text, quotes) in enumerate(zip(chunk, quotes_list)):
+                    tasks.append(asyncio.ensure_future(suggest(start + offset, text, quotes)))
+        
+        producer = asyncio.ensure_future(produce())
+        try:
+            for _ in range(len(texts)):
+                item = await results.get()
+                yield json.dumps(item, ensure_ascii=False) + "\n"
+        finally:
+            # 客户端断开时取消剩余任务
+            producer.cancel()
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
 @app.get("/api/quotes")
 async def get_all_quotes():
     """获取向量库统计信息"""
@@ -104,6 +211,24 @@ async def get_all_quotes():
     }
 
 
+@app.get("/api/rag/stats")
+async def get_rag_stats():
+    """获取检索线程池队列深度与批处理统计"""
+    return rag_service.get_stats()
+
+
+@app.get("/api/llm/stats")
+async def get_llm_stats():
+    """获取 LLM 服务统计 (并发、缓存命中率等)"""
+    return llm_service.get_stats()
+
+
+@app.get("/api/asr/stats")
+async def get_asr_stats():
+    """获取语音识别推理池的队列深度与实时率 (RTF)"""
+    return speech_service.get_stats()
+
+
 # ============ 语音识别 API ============
 
 @app.post("/api/transcribe", response_model=TranscribeResponse)
@@ -113,10 +238,17 @@ async def transcribe_audio(request: TranscribeRequest):
     
     将 Base64 编码的音频数据转换为文字
     """
+    if request.profile:
+        try:
+            get_profile(request.profile)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    
     try:
         result = await speech_service.transcribe_base64(
             request.audio_data,
-            request.sample_rate
+            request.sample_rate,
+            profile=request.profile
         )
         
         if not result:
@@ -136,6 +268,10 @@ async def transcribe_audio(request: TranscribeRequest):
             timestamp=result.timestamp
         )
         
+    except (ASROverloadedError, ASRNotReadyError) as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except ServiceNotReadyError:
+        raise
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -178,6 +314,8 @@ async def process_conversation(request: TextInputRequest):
             related_news=result.related_news
         )
         
+    except ServiceNotReadyError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -228,6 +366,8 @@ async def get_news(request: NewsRequest):
             "count": len(news_items)
         }
         
+    except ServiceNotReadyError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -248,26 +388,140 @@ async def get_relevant_news(query: str, limit: int = 3):
                 for item in news_items
             ]
         }
+    except ServiceNotReadyError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 # ============ WebSocket 实时通信 ============
 
+async def _send_transcript(client_id: str, result):
+    """发送最终转录结果"""
+    await connection_manager.send_to_client(client_id, {
+        "type": "transcript",
+        "data": {
+            "text": result.text,
+            "speaker": result.speaker,
+            "confidence": result.confidence,
+            "timestamp": result.timestamp
+        }
+    })
+
+async def _send_asr_unavailable(client_id: str, error: Exception):
+    """识别队列已满或模型尚未就绪，通知客户端稍后重试"""
+    await connection_manager.send_to_client(client_id, {
+        "type": "error",
+        "code": "asr_not_ready" if isinstance(error, ASRNotReadyError) else "asr_overloaded",
+        "message": str(error)
+    })
+
+async def _send_service_unavailable(client_id: str, error: ServiceNotReadyError):
+    """服务仍在后台加载，通知客户端稍后重试"""
+    await connection_manager.send_to_client(client_id, {
+        "type": "error",
+        "code": "service_not_ready",
+        "message": str(error)
+    })
+
+async def _stream_suggestions(client_id: str, text: str, speaker: str, use_cache: bool = True):
+    """
+    流式生成建议并推送给客户端
+    
+    每生成一条建议推送一条 suggestion_delta，全部完成后推送 suggestion_done
+    """
+    index = 0
+    
+    async def on_suggestion(suggestion):
+        nonlocal index
+        await connection_manager.send_to_client(client_id, {
+            "type": "suggestion_delta",
+            "index": index,
+            "data": suggestion.to_dict()
+        })
+        index += 1
+    
+    result = await conversation_assistant.process_text_stream(
+        text, speaker, on_suggestion=on_suggestion, use_cache=use_cache
+    )
+    
+    await _send_suggestion_done(client_id, result)
+    return result
+
+
+async def _send_ready_suggestions(client_id: str, result):
+    """推送已生成好的建议 (如推测执行的结果)"""
+    for index, suggestion in enumerate(result.suggestions):
+        await connection_manager.send_to_client(client_id, {
+            "type": "suggestion_delta",
+            "index": index,
+            "data": suggestion.to_dict()
+        })
+    
+    await _send_suggestion_done(client_id, result, speculative=True)
+
+
+async def _send_suggestion_done(client_id: str, result, speculative: bool = False):
+    """推送建议完成消息，并为只处理整批建议的旧客户端补发 suggestions 消息"""
+    data = {
+        "suggestions": [s.to_dict() for s in result.suggestions],
+        "related_news": result.related_news,
+        "context_summary": result.context_summary,
+        "topics": result.topics
+    }
+    await connection_manager.send_to_client(client_id, {
+        "type": "suggestion_done",
+        "data": {**data, "speculative": speculative}
+    })
+    await connection_manager.send_to_client(client_id, {
+        "type": "suggestions",
+        "data": data
+    })
+
+
 @app.websocket("/ws/{client_id}")
 async def websocket_endpoint(websocket: WebSocket, client_id: str = None):
     """
     WebSocket 实时通信端点
     
-    支持实时语音流处理和建议推送
+    支持实时语音流处理和建议推送；握手时可通过查询参数选择识别配置：
+    /ws/{client_id}?asr_profile=accurate&asr_partial_profile=fast
     """
-    import asyncio
-    
     if not client_id:
         client_id = str(uuid.uuid4())[:8]
     
+    asr_profile = websocket.query_params.get("asr_profile")
+    asr_partial_profile = websocket.query_params.get("asr_partial_profile")
+    try:
+        for name in (asr_profile, asr_partial_profile):
+            if name:
+                get_profile(name)
+    except ValueError as e:
+        # 未接受连接前关闭即拒绝握手
+        await websocket.close(code=1008, reason=str(e))
+        return
+    
     session = await connection_manager.connect(websocket, client_id)
     
+    # 流式输入过程中提前生成建议
+    speculator = SpeculativeGenerator(
+        conversation_assistant,
+        min_chars=settings.SPECULATIVE_MIN_CHARS,
+        stable_delay=settings.SPECULATIVE_STABLE_MS / 1000.0,
+        match_ratio=settings.SPECULATIVE_MATCH_RATIO
+    ) if settings.SPECULATIVE_ENABLED else None
+    
+    async def send_partial_transcript(update: StreamingUpdate):
+        await connection_manager.send_to_client(client_id, {
+            "type": "streaming_text",
+            "text": update.text,
+            "committed": update.committed,
+            "partial": update.partial
+        })
+    
+    # 流式语音识别器，收到第一个音频块时创建
+    asr_stream = None
+    
     try:
         while True:
             # 接收消息
@@ -275,132 +529,123 @@ async def websocket_endpoint(websocket: WebSocket, client_id: str = None):
             
             msg_type = data.get("type", "")
             
-            if msg_type == "audio":
-                # 处理音频数据
-                audio_base64 = data.get("audio_data", "")
-                sample_rate = data.get("sample_rate", 16000)
+            # 服务仍在加载时只拒绝本条消息，不断开连接
+            try:
+                if msg_type == "audio":
+                    # 处理音频数据
+                    audio_base64 = data.get("audio_data", "")
+                    sample_rate = data.get("sample_rate", 16000)
                 
-                if audio_base64:
-                    # 模拟流式识别：先发送"正在识别..."状态
-                    await connection_manager.send_to_client(client_id, {
-                        "type": "streaming_text",
-                        "text": "正在识别语音..."
-                    })
-                    
-                    result = await speech_service.transcribe_base64(audio_base64, sample_rate)
-                    
-                    if result:
-                        # 模拟逐字显示效果
-                        text = result.text
-                        for i in range(1, len(text) + 1):
+                    if audio_base64:
+                        try:
+                            result = await speech_service.transcribe_base64(audio_base64, sample_rate, asr_profile)
+                        except (ASROverloadedError, ASRNotReadyError) as e:
+                            await _send_asr_unavailable(client_id, e)
+                            continue
+                        if result:
+                            await _send_transcript(client_id, result)
+                        
+                            # 流式生成并发送建议
+                            await _stream_suggestions(client_id, result.text, result.speaker)
+            
+                elif msg_type == "audio_chunk":
+                    # 流式音频：PCM 16-bit 小块，边说边识别
+                    pcm_base64 = data.get("pcm", "")
+                    sample_rate = data.get("sample_rate", 16000)
+                
+                    if pcm_base64:
+                        if asr_stream is None:
+                            asr_stream = speech_service.create_stream(
+                                send_partial_transcript, asr_profile, asr_partial_profile
+                            )
+                        asr_stream.feed(pcm16_to_float32(base64.b64decode(pcm_base64), sample_rate))
+            
+                elif msg_type == "audio_end":
+                    # 一段语音结束：确认全部文本后生成建议
+                    if asr_stream is not None:
+                        try:
+                            result = await speech_service.finish_stream(asr_stream, data.get("speaker"))
+                        except ASRNotReadyError as e:
+                            await _send_asr_unavailable(client_id, e)
+                            continue
+                        if result:
+                            await _send_transcript(client_id, result)
+                            await _stream_suggestions(client_id, result.text, result.speaker, data.get("use_cache", True))
+            
+                elif msg_type == "text":
+                    # 处理文本输入 - 支持流式分析
+                    text = data.get("text", "")
+                    speaker = data.get("speaker", "other")
+                    stream = data.get("stream", False)
+                    use_cache = data.get("use_cache", True)
+                
+                    if text:
+                        if stream:
+                            # 流式模式：文本输入时就开始分析
                             await connection_manager.send_to_client(client_id, {
                                 "type": "streaming_text",
-                                "text": text[:i]
+                                "text": text
                             })
-                            await asyncio.sleep(0.03)  # 30ms 延迟模拟打字效果
-                        
-                        # 发送最终转录结果
-                        await connection_manager.send_to_client(client_id, {
-                            "type": "transcript",
-                            "data": {
-                                "text": result.text,
-                                "speaker": result.speaker,
-                                "confidence": result.confidence,
-                                "timestamp": result.timestamp
-                            }
-                        })
-                        
-                        # 生成并发送建议
-                        assistant_response = await conversation_assistant.process_text(
-                            text=result.text,
-                            speaker=result.speaker
-                        )
-                        
-                        await connection_manager.send_to_client(client_id, {
-                            "type": "suggestions",
-                            "data": {
-                                "suggestions": [s.to_dict() for s in assistant_response.suggestions],
-                                "related_news": assistant_response.related_news,
-                                "topics": assistant_response.topics
-                            }
-                        })
+                            if speculator:
+                                speculator.update(text, speaker, use_cache)
+                        else:
+                            # 完整处理模式
+                            await _stream_suggestions(client_id, text, speaker, use_cache)
             
-            elif msg_type == "text":
-                # 处理文本输入 - 支持流式分析
-                text = data.get("text", "")
-                speaker = data.get("speaker", "other")
-                stream = data.get("stream", False)
+                elif msg_type == "stream_complete":
+                    # 流式输入完成，开始生成建议
+                    text = data.get("text", "")
+                    speaker = data.get("speaker", "other")
+                    use_cache = data.get("use_cache", True)
                 
-                if text:
-                    if stream:
-                        # 流式模式：文本输入时就开始分析
-                        await connection_manager.send_to_client(client_id, {
-                            "type": "streaming_text",
-                            "text": text
-                        })
-                    else:
-                        # 完整处理模式
-                        result = await conversation_assistant.process_text(text, speaker)
-                        
+                    if text:
+                        # 发送转录结果
                         await connection_manager.send_to_client(client_id, {
-                            "type": "suggestions",
+                            "type": "transcript",
                             "data": {
-                                "suggestions": [s.to_dict() for s in result.suggestions],
-                                "related_news": result.related_news,
-                                "context_summary": result.context_summary,
-                                "topics": result.topics
+                                "text": text,
+                                "speaker": speaker,
+                                "confidence": 1.0,
+                                "timestamp": None
                             }
                         })
-            
-            elif msg_type == "stream_complete":
-                # 流式输入完成，开始生成建议
-                text = data.get("text", "")
-                speaker = data.get("speaker", "other")
-                
-                if text:
-                    result = await conversation_assistant.process_text(text, speaker)
                     
-                    # 发送转录结果
+                        # 推测结果可复用时直接发送，否则流式生成
+                        result = await speculator.resolve(text, speaker) if speculator else None
+                        if result:
+                            await _send_ready_suggestions(client_id, result)
+                        else:
+                            await _stream_suggestions(client_id, text, speaker, use_cache)
+            
+                elif msg_type == "reset":
+                    # 重置会话
+                    if speculator:
+                        speculator.cancel()
+                    conversation_assistant.reset()
                     await connection_manager.send_to_client(client_id, {
-                        "type": "transcript",
-                        "data": {
-                            "text": text,
-                            "speaker": speaker,
-                            "confidence": 1.0,
-                            "timestamp": None
-                        }
+                        "type": "reset",
+                        "message": "会话已重置"
                     })
-                    
-                    # 发送建议
+            
+                elif msg_type == "ping":
+                    # 心跳
                     await connection_manager.send_to_client(client_id, {
-                        "type": "suggestions",
-                        "data": {
-                            "suggestions": [s.to_dict() for s in result.suggestions],
-                            "related_news": result.related_news,
-                            "topics": result.topics
-                        }
+                        "type": "pong",
+                        "timestamp": data.get("timestamp")
                     })
-            
-            elif msg_type == "reset":
-                # 重置会话
-                conversation_assistant.reset()
-                await connection_manager.send_to_client(client_id, {
-                    "type": "reset",
-                    "message": "会话已重置"
-                })
-            
-            elif msg_type == "ping":
-                # 心跳
-                await connection_manager.send_to_client(client_id, {
-                    "type": "pong",
-                    "timestamp": data.get("timestamp")
-                })
+            except ServiceNotReadyError as e:
+                await _send_service_unavailable(client_id, e)
                 
     except WebSocketDisconnect:
         connection_manager.disconnect(client_id)
     except Exception as e:
         print(f"WebSocket 错误: {e}")
         connection_manager.disconnect(client_id)
+    finally:
+        if speculator:
+            speculator.cancel()
+        if asr_stream is not None:
+            asr_stream.reset()
 
 
 @app.get("/api/ws/status")
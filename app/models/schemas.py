@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional
 from enum import Enum
 
@@ -23,11 +23,30 @@ class Quote(BaseModel):
     author: str
 
 
+class QuoteFilter(BaseModel):
+    """金句元数据过滤：同一字段内任一值匹配，不同字段需同时满足"""
+    category: Optional[List[str]] = None
+    type: Optional[List[str]] = None
+    author: Optional[List[str]] = None
+    source: Optional[List[str]] = None
+
+
 class SuggestionRequest(BaseModel):
     """建议请求模型"""
     text: str
     context: Optional[str] = None
     parent_content: Optional[str] = None  # 上级节点内容，用于思维延展
+    use_cache: bool = True  # 为 False 时跳过响应缓存，获取新的建议
+    filters: Optional[QuoteFilter] = None  # 只在满足条件的金句中检索
+
+
+class BatchSuggestionRequest(BaseModel):
+    """批量建议请求模型 (离线预计算)"""
+    texts: List[str] = Field(..., max_length=10000)
+    top_k: int = Field(3, ge=1, le=20)
+    concurrency: int = Field(8, ge=1, le=64)  # 同时进行的 LLM 调用数
+    use_cache: bool = True
+    filters: Optional[QuoteFilter] = None
 
 
 class SuggestionResponse(BaseModel):
@@ -35,6 +54,7 @@ class SuggestionResponse(BaseModel):
     original_text: str
     suggestions: List[str]
     related_quotes: List[Quote]
+    fallback: bool = False  # LLM 失败或超时时为 True，suggestions 为本地兜底建议
     
 
 class TranscribeRequest(BaseModel):
@@ -42,6 +62,7 @@ class TranscribeRequest(BaseModel):
     audio_data: str  # base64 编码的音频数据
     sample_rate: int = 16000
     format: Optional[str] = "webm"  # 音频格式：webm, wav, ogg
+    profile: Optional[str] = None  # 识别配置：fast, balanced, accurate
 
 
 class TranscribeResponse(BaseModel):
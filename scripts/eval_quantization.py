@@ -0,0 +1,84 @@
+"""
+量化召回率评估
+以原始向量的精确检索为基准，统计各量化方式在不同精排倍数下的 recall@k、单次查询耗时与内存占用
+
+用法：
+    python scripts/eval_quantization.py --queries 500 --top-k 10 --rerank 1,5,10,20
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.config import settings
+from app.core.quantization import QUANTIZERS
+from app.core.vector_index import NumpyVectorIndex
+
+
+def sample_queries(index: NumpyVectorIndex, n: int, noise: float, rng: np.random.Generator) -> np.ndarray:
+    """从库中抽样向量并加入高斯噪声作为查询，模拟“相近但不相同”的真实查询"""
+    vectors = index.vectors
+    rows = rng.choice(len(vectors), size=min(n, len(vectors)), replace=False)
+    queries = np.asarray(vectors[np.sort(rows)], dtype=np.float32)
+    queries += rng.normal(0, noise, size=queries.shape).astype(np.float32)
+    return queries
+
+
+def timed_search(index: NumpyVectorIndex, queries: np.ndarray, top_k: int, exact: bool = False):
+    started = time.perf_counter()
+    hits = [[row for row, _ in result] for result in index.search(queries, top_k, exact=exact)]
+    return hits, (time.perf_counter() - started) / len(queries)
+
+
+def recall(results, baseline) -> float:
+    total = sum(len(set(r) & set(b)) for r, b in zip(results, baseline))
+    return total / max(sum(len(b) for b in baseline), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="评估量化向量的召回率")
+    parser.add_argument("--index", default=settings.RAG_NUMPY_INDEX_PATH, help="NumPy 索引目录")
+    parser.add_argument("--queries", type=int, default=500, help="查询数")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--rerank", default="1,5,10,20", help="精排倍数，逗号分隔")
+    parser.add_argument("--noise", type=float, default=0.05, help="查询向量的噪声标准差")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    base = NumpyVectorIndex(args.index, dtype=settings.RAG_NUMPY_DTYPE)
+    if base.count() == 0:
+        print(f"❌ 索引为空: {args.index}，请先以 RAG_BACKEND=numpy 运行 scripts/init_db.py")
+        return
+
+    rng = np.random.default_rng(args.seed)
+    queries = sample_queries(base, args.queries, args.noise, rng)
+    baseline, baseline_latency = timed_search(base, queries, args.top_k, exact=True)
+    float_bytes = base.count() * base.vectors.shape[1] * 4
+
+    print("=" * 72)
+    print(f"索引: {args.index}  条数: {base.count()}  查询: {len(queries)}  k: {args.top_k}")
+    print(f"{'方式':<10}{'精排倍数':>8}{'recall@k':>12}{'单次耗时':>12}{'常驻内存':>14}{'压缩比':>10}")
+    print(f"{'float32':<10}{'-':>8}{1.0:>12.4f}{baseline_latency * 1000:>10.2f}ms"
+          f"{float_bytes / 2**20:>12.1f}MB{1:>9}x")
+
+    for name in QUANTIZERS:
+        for factor in (int(f) for f in args.rerank.split(",")):
+            index = NumpyVectorIndex(
+                args.index, dtype=settings.RAG_NUMPY_DTYPE, quantization=name, rerank_factor=factor
+            )
+            results, latency = timed_search(index, queries, args.top_k)
+            code_bytes = index.get_stats()["code_bytes"]
+            print(f"{name:<10}{factor:>8}{recall(results, baseline):>12.4f}{latency * 1000:>10.2f}ms"
+                  f"{code_bytes / 2**20:>12.1f}MB{float_bytes / code_bytes:>9.0f}x")
+    print("=" * 72)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""
+导出预计算向量产物
+在构建机上运行 init_db.py 建好向量库后执行，把向量和元数据导出为版本化产物；
+新节点设置 RAG_EMBEDDINGS_ARTIFACT 指向该目录即可在启动时直接导入，无需计算 embedding。
+
+用法：
+    python scripts/export_embeddings.py --output artifacts/quote_embeddings --dtype float16
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.core.artifact import export_artifact
+from app.core.rag import rag_service
+
+
+def main():
+    parser = argparse.ArgumentParser(description="导出 ChatBuff 预计算向量产物")
+    parser.add_argument("--output", type=Path, default=project_root / "artifacts" / "quote_embeddings")
+    parser.add_argument("--dtype", default="float16", choices=["float16", "float32"],
+                        help="向量存储精度，float16 体积减半")
+    parser.add_argument("--batch-size", type=int, default=4096)
+    args = parser.parse_args()
+
+    count = rag_service.get_count()
+    if count == 0:
+        print("❌ 向量库为空，请先运行 scripts/init_db.py")
+        return
+
+    print(f"📤 导出 {count} 条向量 (模型 {rag_service.embedding_model}, {args.dtype})...")
+    manifest = export_artifact(
+        str(args.output),
+        rag_service.iter_embeddings(args.batch_size),
+        count=count,
+        model=rag_service.embedding_model,
+        dtype=args.dtype
+    )
+    print(f"✅ 已导出到 {args.output} (版本 {manifest['version']}, 维度 {manifest['dim']}, sha256 {manifest['sha256'][:12]})")
+
+
+if __name__ == "__main__":
+    main()
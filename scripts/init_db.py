@@ -1,11 +1,27 @@
 """
 初始化向量数据库脚本
-运行一次即可将 quotes.json 的数据导入 ChromaDB
+将金句数据流式导入向量库：支持 JSON 数组或 JSONL（每行一条），
+按块并行计算 embedding 后批量 upsert；id 由内容哈希生成，重复导入不会产生重复数据。
+导入中断后再次运行会跳过已完成的块，不重复计算 embedding。
+旧版按位置编号 (quote_N) 的数据会先迁移为内容哈希 id，沿用已有向量。
+
+用法：
+    python scripts/init_db.py                               # 导入默认的 quotes.json
+    python scripts/init_db.py --file quotes.jsonl --workers 4 --chunk-size 512
+    python scripts/init_db.py --reset                       # 清空后重新导入
 """
 
+import argparse
 import json
+import os
+import shutil
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Dict, Iterator, List, Set
+
+import numpy as np
 
 # 添加项目根目录到路径
 project_root = Path(__file__).parent.parent
@@ -13,51 +29,258 @@ sys.path.insert(0, str(project_root))
 
 from app.core.rag import rag_service
 
+DEFAULT_FILE = project_root / "app" / "db" / "seeds" / "quotes.json"
+
+
+def iter_quotes(path: Path) -> Iterator[Dict]:
+    """逐条读取金句：.jsonl 按行流式读取，.json 数组整体读取"""
+    if path.suffix == ".jsonl":
+        with open(path, "r", encoding="utf-8") as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError as e:
+                    print(f"⚠️  跳过第 {line_no} 行: {e}")
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            yield from json.load(f)
+
+
+def iter_chunks(quotes: Iterator[Dict], chunk_size: int) -> Iterator[List[Dict]]:
+    """按固定大小分块"""
+    chunk = []
+    for quote in quotes:
+        chunk.append(quote)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class Checkpoint:
+    """
+    记录已写入的块，用于中断后续传；输入文件或分块大小变化时失效
+
+    已算好 embedding 但尚未写入索引的块暂存在 <断点文件>.spill/ 目录，
+    续传时直接读取，不重新计算
+    """
+
+    def __init__(self, path: Path, source: Path, chunk_size: int):
+        self.path = path
+        self.spill_dir = path.with_name(path.name + ".spill")
+        stat = source.stat()
+        self.fingerprint = {
+            "file": str(source.resolve()),
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "chunk_size": chunk_size
+        }
+        self.done: Set[int] = set()
+        self.spilled: Dict[int, int] = {}   # 块号 -> 条数
+        self.written = 0
+
+        data = {}
+        if path.exists():
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        if data.get("fingerprint") == self.fingerprint:
+            self.done = set(data.get("done", []))
+            self.spilled = {int(k): v for k, v in data.get("spilled", {}).items()}
+            self.written = data.get("written", 0)
+        else:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+    def spill(self, chunk_index: int, ids: List[str], documents: List[str], embeddings: np.ndarray, metadatas: List[Dict]):
+        """暂存一个已算好 embedding 的块"""
+        self.spill_dir.mkdir(parents=True, exist_ok=True)
+        np.save(self.spill_dir / f"{chunk_index}.npy", embeddings)
+        with open(self.spill_dir / f"{chunk_index}.json", "w", encoding="utf-8") as f:
+            json.dump({"ids": ids, "documents": documents, "metadatas": metadatas}, f, ensure_ascii=False)
+        self.spilled[chunk_index] = len(ids)
+        self._save()
+
+    def load_spilled(self, chunk_index: int):
+        """读取暂存的块，返回 (ids, documents, embeddings, metadatas)"""
+        with open(self.spill_dir / f"{chunk_index}.json", "r", encoding="utf-8") as f:
+            data = json.load(f)
+        embeddings = np.load(self.spill_dir / f"{chunk_index}.npy")
+        return data["ids"], data["documents"], embeddings, data["metadatas"]
+
+    def mark(self, chunk_indices: List[int], count: int):
+        """记录已写入索引的块，并删除它们的暂存文件"""
+        self.done.update(chunk_indices)
+        self.written += count
+        self._save()
+        for chunk_index in chunk_indices:
+            if self.spilled.pop(chunk_index, None) is not None:
+                (self.spill_dir / f"{chunk_index}.npy").unlink(missing_ok=True)
+                (self.spill_dir / f"{chunk_index}.json").unlink(missing_ok=True)
+
+    def _save(self):
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({
+                "fingerprint": self.fingerprint,
+                "done": sorted(self.done),
+                "spilled": self.spilled,
+                "written": self.written
+            }, f)
+        os.replace(tmp, self.path)
+
+    def clear(self):
+        self.path.unlink(missing_ok=True)
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+
+def embed_chunk(quotes: List[Dict]):
+    """计算一个块的 embedding（在线程池中执行）"""
+    ids, documents, metadatas = rag_service.prepare_quotes(quotes)
+    embeddings = rag_service.embedding_function(documents) if documents else []
+    return ids, documents, embeddings, metadatas
+
+
+def ingest(path: Path, chunk_size: int, workers: int, checkpoint: Checkpoint):
+    """
+    并行计算 embedding，按完成顺序在主线程批量 upsert
+
+    NumPy 后端每次 upsert 都会重写整个索引文件，因此算好的块先暂存到磁盘并记入断点，
+    待暂存行数达到索引现有行数时再合并写入一次 (总写入量与数据量成线性)；
+    中断后续传时暂存的块直接读取，不重新计算 embedding。
+    """
+    started = time.perf_counter()
+    written = 0
+    skipped = 0
+    resumed = 0
+    max_in_flight = workers * 2
+    in_flight = []
+    rewrites_index = rag_service.index is not None
+    pending: List[int] = []     # 已暂存、待写入索引的块号
+    pending_rows = 0
+
+    def write(chunks):
+        """合并写入若干块并记入断点"""
+        nonlocal written
+        ids, documents, embeddings, metadatas = [], [], [], []
+        for chunk_ids, chunk_documents, chunk_embeddings, chunk_metadatas in (c[1:] for c in chunks):
+            ids.extend(chunk_ids)
+            documents.extend(chunk_documents)
+            metadatas.extend(chunk_metadatas)
+            if chunk_ids:
+                embeddings.append(chunk_embeddings)
+        if ids:
+            embeddings = np.concatenate(embeddings) if rewrites_index else [e for c in embeddings for e in c]
+            rag_service.upsert_embeddings(ids, documents, embeddings, metadatas)
+        checkpoint.mark([c[0] for c in chunks], len(ids))
+        written += len(ids)
+        elapsed = time.perf_counter() - started
+        print(f"📥 块 #{chunks[-1][0]}: 已写入 {checkpoint.written} 条 "
+              f"({written / elapsed:.0f} 条/秒)", flush=True)
+
+    def flush():
+        nonlocal pending_rows
+        if pending:
+            write([(i, *checkpoint.load_spilled(i)) for i in pending])
+            pending.clear()
+            pending_rows = 0
+
+    def add_pending(chunk_index: int, rows: int):
+        nonlocal pending_rows
+        pending.append(chunk_index)
+        pending_rows += rows
+        if not rewrites_index or pending_rows >= max(rag_service.get_count(), chunk_size):
+            flush()
+
+    def drain(block: bool):
+        while in_flight and (block or in_flight[0][1].done()):
+            chunk_index, future = in_flight.pop(0)
+            ids, documents, embeddings, metadatas = future.result()
+            if rewrites_index:
+                embeddings = np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1)
+                checkpoint.spill(chunk_index, ids, documents, embeddings, metadatas)
+                add_pending(chunk_index, len(ids))
+            else:
+                write([(chunk_index, ids, documents, embeddings, metadatas)])
+            if block:
+                return
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest") as executor:
+        for chunk_index, chunk in enumerate(iter_chunks(iter_quotes(path), chunk_size)):
+            if chunk_index in checkpoint.done:
+                skipped += 1
+                continue
+            if chunk_index in checkpoint.spilled:
+                resumed += 1
+                add_pending(chunk_index, checkpoint.spilled[chunk_index])
+                continue
+            in_flight.append((chunk_index, executor.submit(embed_chunk, chunk)))
+            drain(block=False)
+            if len(in_flight) >= max_in_flight:
+                drain(block=True)
+        while in_flight:
+            drain(block=True)
+    flush()
+
+    if skipped:
+        print(f"⏭️  跳过 {skipped} 个已完成的块")
+    if resumed:
+        print(f"💾 {resumed} 个块使用暂存的 embedding")
+    print(f"✅ 本次写入 {written} 条，用时 {time.perf_counter() - started:.1f}s")
+
+
 def main():
+    parser = argparse.ArgumentParser(description="ChatBuff 知识库导入")
+    parser.add_argument("--file", type=Path, default=DEFAULT_FILE, help="金句文件 (.json 或 .jsonl)")
+    parser.add_argument("--chunk-size", type=int, default=256, help="每块的金句数")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="并行计算 embedding 的线程数")
+    parser.add_argument("--reset", action="store_true", help="导入前清空向量库")
+    parser.add_argument("--checkpoint", type=Path, default=None,
+                        help="断点文件路径，默认为 <文件名>.ingest.json")
+    parser.add_argument("--skip-test", action="store_true", help="导入后不执行测试检索")
+    args = parser.parse_args()
+
     print("🚀 开始初始化 ChatBuff 知识库...")
-    
-    # 读取金句数据
-    quotes_file = project_root / "app" / "db" / "seeds" / "quotes.json"
-    
-    if not quotes_file.exists():
-        print(f"❌ 文件不存在: {quotes_file}")
+
+    if not args.file.exists():
+        print(f"❌ 文件不存在: {args.file}")
         return
-    
-    with open(quotes_file, 'r', encoding='utf-8') as f:
-        quotes = json.load(f)
-    
-    print(f"📖 读取到 {len(quotes)} 条金句")
-    
-    # 检查是否已经有数据
-    current_count = rag_service.get_count()
-    if current_count > 0:
-        print(f"⚠️  向量库中已有 {current_count} 条数据")
-        choice = input("是否清空并重新导入？(y/n): ")
-        if choice.lower() == 'y':
-            # 重新创建集合（清空数据）
-            rag_service.client.delete_collection(rag_service.collection_name)
-            rag_service.collection = rag_service.client.create_collection(
-                name=rag_service.collection_name,
-                metadata={"description": "ChatBuff 金句库"}
-            )
-            print("✅ 已清空旧数据")
-        else:
-            print("❌ 取消导入")
-            return
-    
-    # 添加数据到向量库
-    rag_service.add_quotes(quotes)
-    
+
+    checkpoint_path = args.checkpoint or args.file.with_name(args.file.name + ".ingest.json")
+    checkpoint = Checkpoint(checkpoint_path, args.file, args.chunk_size)
+
+    if args.reset:
+        rag_service.reset()
+        checkpoint.clear()
+        checkpoint = Checkpoint(checkpoint_path, args.file, args.chunk_size)
+        print("✅ 已清空旧数据")
+    else:
+        # 旧版按位置编号的 id 先改为内容哈希 id，否则重新导入会重复写入每条金句
+        migrated = rag_service.migrate_legacy_ids()
+        if migrated:
+            print(f"🔑 已将 {migrated} 条旧版 id (quote_N) 迁移为内容哈希 id")
+        if checkpoint.done or checkpoint.spilled:
+            print(f"🔁 从断点继续：已完成 {len(checkpoint.done)} 个块，暂存 {len(checkpoint.spilled)} 个块")
+
+    ingest(args.file, args.chunk_size, max(args.workers, 1), checkpoint)
+    checkpoint.clear()
+
     print(f"✅ 初始化完成！当前向量库共有 {rag_service.get_count()} 条金句")
-    
+
+    if args.skip_test:
+        return
+
     # 测试检索
     print("\n🧪 测试检索功能...")
     test_query = "生活太难了"
-    results = rag_service.search(test_query, top_k=2)
+    results = rag_service.search_sync(test_query, top_k=2)
     print(f"查询: '{test_query}'")
     print(f"结果:")
     for i, quote in enumerate(results, 1):
         print(f"  {i}. {quote['quote']} —— {quote['author']}")
 
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,114 @@
+"""
+ChatBuff 压测脚本
+并发请求建议接口，统计吞吐量和延迟分位数；配合 mock_llm_server.py 可完全离线运行
+
+用法：
+    python scripts/load_test.py --endpoint /api/suggestion --concurrency 50 --requests 1000
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from typing import List
+
+import aiohttp
+
+BASE_URL = "http://127.0.0.1:8000"
+
+TEST_TEXTS = [
+    "今天心情不好",
+    "生活太难了",
+    "最近好累",
+    "明天要面试，好紧张",
+    "第一次和陌生人聊天",
+    "工作压力好大，真的很累",
+    "周末想出去走走",
+    "我觉得这个想法很有意思",
+]
+
+
+def percentile(values: List[float], p: float) -> float:
+    """计算 p 分位 (0~1)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(p * len(ordered)), len(ordered) - 1)]
+
+
+async def worker(session: aiohttp.ClientSession, args, queue: asyncio.Queue, latencies: List[float], errors: List[str]):
+    while True:
+        try:
+            queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+
+        text = random.choice(TEST_TEXTS)
+        if args.endpoint == "/api/assistant/process":
+            payload = {"text": text, "speaker": "other"}
+        else:
+            payload = {"text": text, "use_cache": not args.no_cache}
+
+        started = time.perf_counter()
+        try:
+            async with session.post(f"{args.base_url}{args.endpoint}", json=payload) as response:
+                await response.read()
+                if response.status != 200:
+                    errors.append(str(response.status))
+                    continue
+            latencies.append(time.perf_counter() - started)
+        except Exception as e:
+            errors.append(type(e).__name__)
+
+
+async def run(args):
+    queue: asyncio.Queue = asyncio.Queue()
+    for _ in range(args.requests):
+        queue.put_nowait(None)
+
+    latencies: List[float] = []
+    errors: List[str] = []
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+
+    started = time.perf_counter()
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+        await asyncio.gather(*[
+            worker(session, args, queue, latencies, errors)
+            for _ in range(args.concurrency)
+        ])
+    elapsed = time.perf_counter() - started
+
+    print("=" * 60)
+    print(f"接口: {args.endpoint}  并发: {args.concurrency}  请求数: {args.requests}")
+    print(f"总耗时: {elapsed:.2f}s  吞吐量: {len(latencies) / elapsed:.1f} req/s")
+    print(f"成功: {len(latencies)}  失败: {len(errors)}")
+    if latencies:
+        print(f"延迟 p50: {percentile(latencies, 0.5) * 1000:.0f}ms  "
+              f"p90: {percentile(latencies, 0.9) * 1000:.0f}ms  "
+              f"p99: {percentile(latencies, 0.99) * 1000:.0f}ms  "
+              f"max: {max(latencies) * 1000:.0f}ms")
+    if errors:
+        summary = {e: errors.count(e) for e in set(errors)}
+        print(f"错误分布: {summary}")
+    print("=" * 60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ChatBuff 压测")
+    parser.add_argument("--base-url", default=BASE_URL)
+    parser.add_argument("--endpoint", default="/api/suggestion",
+                        choices=["/api/suggestion", "/api/assistant/process"])
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--timeout", type=float, default=60.0, help="单个请求超时（秒）")
+    parser.add_argument("--no-cache", action="store_true", help="跳过 LLM 响应缓存")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
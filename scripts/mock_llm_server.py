@@ -0,0 +1,223 @@
+"""
+本地模拟 LLM 服务 (OpenAI 兼容协议)
+用于离线压测 ChatBuff：不消耗真实 API 额度，延迟、错误率和吐字速度均可配置
+
+用法：
+    python scripts/mock_llm_server.py --port 9000 --latency-ms 800 --latency-dist lognormal \\
+        --error-rate 0.02 --tokens-per-sec 40
+
+然后在 .env 中设置：
+    OPENAI_BASE_URL=http://127.0.0.1:9000/v1
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+import uuid
+from typing import Dict, List
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+SUGGESTION_LINES = [
+    "换个角度看，困难也是成长的养料。",
+    "听起来你需要的不是建议，是一顿火锅。",
+    "真诚是永远的通行证。",
+    "人生没有白走的路，每一步都算数。",
+    "你说得对，但我更想听听你的打算。",
+    "慢慢来，比较快。",
+]
+
+TYPED_LINES = [
+    "[深度] 尼采说过，杀不死你的会让你更强大。",
+    "[幽默] 生活虐我千百遍，我待生活如初恋。",
+    "[追问] 如果没有任何限制，你最想先改变哪一件事？",
+]
+
+
+class MockConfig:
+    """模拟服务配置"""
+
+    def __init__(self, args: argparse.Namespace):
+        self.latency_ms = args.latency_ms
+        self.latency_dist = args.latency_dist
+        self.jitter_ms = args.jitter_ms
+        self.error_rate = args.error_rate
+        self.error_statuses = [int(s) for s in args.error_statuses.split(",")]
+        self.tokens_per_sec = args.tokens_per_sec
+        self.rng = random.Random(args.seed)
+
+    def sample_latency(self) -> float:
+        """按配置的分布采样首 token 延迟（秒）"""
+        mean = self.latency_ms / 1000.0
+        jitter = self.jitter_ms / 1000.0
+        if self.latency_dist == "fixed":
+            value = mean
+        elif self.latency_dist == "uniform":
+            value = self.rng.uniform(mean - jitter, mean + jitter)
+        elif self.latency_dist == "normal":
+            value = self.rng.gauss(mean, jitter)
+        elif self.latency_dist == "exponential":
+            value = self.rng.expovariate(1.0 / mean) if mean > 0 else 0.0
+        else:
+            # 对数正态：长尾分布，更接近真实 API
+            sigma = (jitter / mean) if mean > 0 else 0.5
+            value = self.rng.lognormvariate(0, sigma) * mean
+        return max(value, 0.0)
+
+    def should_fail(self) -> bool:
+        return self.rng.random() < self.error_rate
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：中文字符 1 个，其余 4 个字符 1 个"""
+    cjk = len(re.findall(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]", text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def build_reply(messages: List[Dict], rng: random.Random) -> str:
+    """根据 prompt 类型生成格式匹配的回复"""
+    system = " ".join(m.get("content", "") for m in messages if m.get("role") == "system")
+    user = messages[-1].get("content", "") if messages else ""
+
+    def single(prompt: str) -> str:
+        if "[类型]" in system or "[深度]" in prompt:
+            return "\n".join(TYPED_LINES)
+        return "\n".join(rng.sample(SUGGESTION_LINES, 3))
+
+    # 微批请求：按任务编号返回 JSON
+    tasks = re.findall(r"【任务 (\d+)】", user)
+    if tasks:
+        return json.dumps({n: single(user) for n in tasks}, ensure_ascii=False)
+
+    return single(user)
+
+
+def split_tokens(text: str) -> List[str]:
+    """把文本切成近似 token 的片段，用于流式输出"""
+    return re.findall(r"[\u4e00-\u9fff]|[^\u4e00-\u9fff]{1,4}", text)
+
+
+def create_app(config: MockConfig) -> FastAPI:
+    app = FastAPI(title="ChatBuff Mock LLM")
+    stats = {"requests": 0, "errors": 0, "streams": 0, "in_flight": 0}
+
+    @app.get("/v1/models")
+    async def list_models():
+        return {"object": "list", "data": [{"id": "mock-chat", "object": "model", "owned_by": "chatbuff"}]}
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        messages = body.get("messages", [])
+        model = body.get("model", "mock-chat")
+        stream = body.get("stream", False)
+
+        stats["requests"] += 1
+        stats["in_flight"] += 1
+        try:
+            await asyncio.sleep(config.sample_latency())
+
+            if config.should_fail():
+                stats["errors"] += 1
+                stats["in_flight"] -= 1
+                status = config.rng.choice(config.error_statuses)
+                return JSONResponse(
+                    status_code=status,
+                    content={"error": {"message": "mock upstream error", "type": "server_error", "code": status}}
+                )
+
+            reply = build_reply(messages, config.rng)
+            prompt_tokens = sum(estimate_tokens(m.get("content", "")) for m in messages)
+            completion_tokens = estimate_tokens(reply)
+            completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+            created = int(time.time())
+        except BaseException:
+            stats["in_flight"] -= 1
+            raise
+
+        if not stream:
+            # 非流式：按吐字速度模拟生成耗时
+            try:
+                if config.tokens_per_sec > 0:
+                    await asyncio.sleep(completion_tokens / config.tokens_per_sec)
+                return {
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": created,
+                    "model": model,
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": reply},
+                        "finish_reason": "stop"
+                    }],
+                    "usage": {
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": completion_tokens,
+                        "total_tokens": prompt_tokens + completion_tokens
+                    }
+                }
+            finally:
+                stats["in_flight"] -= 1
+
+        stats["streams"] += 1
+
+        async def event_stream():
+            try:
+                def chunk(delta: Dict, finish_reason=None) -> str:
+                    payload = {
+                        "id": completion_id,
+                        "object": "chat.completion.chunk",
+                        "created": created,
+                        "model": model,
+                        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+                    }
+                    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+                yield chunk({"role": "assistant", "content": ""})
+                interval = 1.0 / config.tokens_per_sec if config.tokens_per_sec > 0 else 0
+                for piece in split_tokens(reply):
+                    if interval:
+                        await asyncio.sleep(interval)
+                    yield chunk({"content": piece})
+                yield chunk({}, finish_reason="stop")
+                yield "data: [DONE]\n\n"
+            finally:
+                stats["in_flight"] -= 1
+
+        return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ChatBuff 本地模拟 LLM 服务 (OpenAI 兼容)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency-ms", type=float, default=500.0, help="首 token 平均延迟（毫秒）")
+    parser.add_argument("--latency-dist", default="lognormal",
+                        choices=["fixed", "uniform", "normal", "exponential", "lognormal"],
+                        help="延迟分布")
+    parser.add_argument("--jitter-ms", type=float, default=200.0, help="延迟抖动/标准差（毫秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回错误的概率 (0~1)")
+    parser.add_argument("--error-statuses", default="500,503,429", help="随机返回的错误状态码，逗号分隔")
+    parser.add_argument("--tokens-per-sec", type=float, default=50.0, help="生成速度，0 表示瞬间完成")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子，用于可复现的压测")
+    args = parser.parse_args()
+
+    config = MockConfig(args)
+    print(f"🧪 模拟 LLM 服务: http://{args.host}:{args.port}/v1 "
+          f"(延迟 {args.latency_dist} {args.latency_ms}ms, 错误率 {args.error_rate}, {args.tokens_per_sec} tok/s)")
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()